@@ -1,20 +1,36 @@
 import argparse
 import asyncio
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from inspect import getmembers, isfunction
+from contextlib import suppress
+from inspect import getmembers, iscoroutinefunction
 from time import time
-from typing import Any, List, Set
+from typing import Any, Dict, List, Optional
 
 # --- Disabling requests logger (set log level CRITICAL)
 import requests
 
 import proxy_machine.otherproxies as otherproxies
 
+from .daemon import ProxyDaemon, daemon_port, parse_refresh, refresh_interval, serve_rotating_proxy
+from .pipeline import ScrapePipeline, probe_backends
 from .proxyarchive import parse_proxyarchive
 from .proxyscrape_all import parse_proxyscrape
-from .tools.proxies_manipulation import filtrate_ports, prepare_proxy
-from .tools.proxy_checker import run_checking, run_checking_async
+from .tools import prefilter, proxy_checker
+from .tools.adaptive import AdaptiveTimeout, HostTimeouts
+from .tools.cache import ResponseCache
+from .tools.distributed import Coordinator, coordinator_port, lease_size, lease_timeout, parse_address, run_worker
+from .tools.forward import ForwardProxy, forward_port
+from .tools.geo import GeoDB, build_geo_db
+from .tools.judges import JudgePool, judge_port, serve_judge
+from .tools.output import output_formats, rank_results, write_results
+from .tools.packed import pack_proxy
+from .tools.pool import ProxyPool
+from .tools.prefilter import raise_open_files_limit
+from .tools.protocols import protocols
+from .tools.proxy_checker import CheckResult, anonymity_levels, run_checking_results
+from .tools.scheduler import HostLimit, parse_host_limit
+from .tools.store import ProxyStore
+from .tools.trace import start_tracing, stop_tracing
 
 logging.getLogger(requests.__name__).setLevel(logging.CRITICAL)
 # ---
@@ -28,57 +44,151 @@ logger = logging.getLogger("proxy_machine")
 
 
 def load_proxies_func() -> List[Any]:
-    # Functions that don't parsing proxies
-    other_func = ("generate_user_agent", "parse_proxies", "short_url")
-    functions = [
-        func for name, func in getmembers(otherproxies, isfunction) if name not in other_func
-    ]  # Filtering result based on tuple: other_func
+    # Every public coroutine function of otherproxies is a parser
+    functions = [func for name, func in getmembers(otherproxies, iscoroutinefunction) if not name.startswith("_")]
     # Adding parsers in other modules
     functions.append(parse_proxyarchive)
     functions.append(parse_proxyscrape)
     return functions
 
 
-def save_proxies(filename: str, proxies: Set[str]) -> None:
-    with open(filename, "w+") as f:
-        f.writelines(proxies)
-        logger.info(f"{len(proxies)} proxies were recorded in {filename}")
+def save_proxies(filename: str, results: List[CheckResult], output_format: str = "txt") -> None:
+    write_results(filename, rank_results(results), output_format)
+    logger.info(f"{len(results)} proxies were recorded in {filename}")
 
 
-def main(filename: str, workers=None, checker=False, async_enabled=True, infile: str = None) -> None:
+def main(
+    filename: str,
+    workers=None,
+    checker=False,
+    async_enabled=True,
+    infile: str = None,
+    host_limits: Optional[Dict[str, HostLimit]] = None,
+    limit: Optional[int] = None,
+    max_latency: Optional[float] = None,
+    countries: Optional[List[str]] = None,
+    protocols: Optional[List[str]] = None,
+    anonymity: Optional[str] = None,
+    store: Optional[ProxyStore] = None,
+    prefilter: bool = False,
+    connect_workers: Optional[int] = None,
+    connect_timeout: Optional[float] = None,
+    backend: str = "httpx",
+    judges: Optional[List[str]] = None,
+    probes: int = 1,
+    output_format: str = "txt",
+    processes: int = 1,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    metrics: Optional[str] = None,
+    prometheus: Optional[str] = None,
+    trace: Optional[str] = None,
+    cache: Optional[ResponseCache] = None,
+    adaptive: Optional[AdaptiveTimeout] = None,
+    host_timeouts: Optional[HostTimeouts] = None,
+    geo: Optional[GeoDB] = None,
+) -> None:
     start = time()
-    proxies = set()
-    parsers = load_proxies_func()
-
+    if trace:
+        start_tracing()
+    infile_proxies = None
     if infile:
         with open(infile) as f:
-            prepared_proxies = f.readlines()
-    else:
-        with ThreadPoolExecutor(workers) as executor:
-            futures = []
-            for parser in parsers:
-                futures.append(executor.submit(parser))
-            for future in as_completed(futures):
-                try:
-                    parser_proxies = future.result()
-                    proxies.update(parser_proxies)
-                except Exception as e:
-                    print(e)
-
-        # Clearing unnecessary lines. (These can be from proxyscrape_all)
-        prepared_proxies = {f"{prepare_proxy(proxy)}\n" for proxy in proxies if filtrate_ports(proxy)}
+            infile_proxies = f.readlines()
 
+    pipeline = ScrapePipeline(
+        load_proxies_func(),
+        # The threaded checker can't take a stream, so it runs after scraping
+        checker=checker and async_enabled,
+        workers=workers,
+        limit=limit,
+        max_latency=max_latency,
+        countries=countries,
+        protocols=protocols,
+        anonymity=anonymity,
+        host_limits={**otherproxies.host_limits, **(host_limits or {})},
+        store=store,
+        prefilter=prefilter,
+        connect_workers=connect_workers,
+        connect_timeout=connect_timeout,
+        backend=backend,
+        judges=judges,
+        probes=probes,
+        processes=processes,
+        record=record,
+        replay=replay,
+        cache=cache,
+        adaptive=adaptive,
+        host_timeouts=host_timeouts,
+        geo=geo,
+    )
+    if checker and anonymity is not None:
+        asyncio.run(pipeline.judges.verify())
+        if not pipeline.judges.echo_headers:
+            # Every proxy would be filtered out at the end of the run
+            raise SystemExit(
+                "--anonymity needs a judge that echoes the request headers, "
+                "like --judge https://httpbin.org/get or the judge-server command"
+            )
     if checker:
         logger.info("----- Launch the proxies checker... -----")
-        if async_enabled:
-            loop = asyncio.get_event_loop()
-            checked_proxies = loop.run_until_complete(run_checking_async(prepared_proxies))
-            # checked_proxies = asyncio.run(run_checking_async(prepared_proxies))
-        else:
-            checked_proxies = run_checking(prepared_proxies, workers)
-        prepared_proxies = {f"{proxy}\n" for proxy in checked_proxies}
-
-    save_proxies(f"{filename}.txt", prepared_proxies)
+    results = asyncio.run(pipeline.run(infile_proxies))
+
+    if checker and not async_enabled:
+        asyncio.run(pipeline.judges.verify())
+        proxies, known_good = [result.proxy for result in results], []
+        if store is not None:
+            # The threaded checker runs after scraping, so the history sorts the scraped proxies out here
+            by_value = {pack_proxy(proxy): proxy for proxy in proxies}
+            to_check, known_good = store.triage(by_value)  # type: ignore
+            skipped = len(by_value) - len(to_check) - len(known_good)
+            if skipped:
+                logger.info(f"{skipped} proxies were skipped because they failed recently")
+            proxies = [by_value[value] for value in to_check]
+        checked = run_checking_results(
+            proxies,
+            workers,
+            probes,
+            judges=[judge.url for judge in pipeline.judges.judges],
+            client_ip=pipeline.judges.client_ip,
+        )
+        if store is not None:
+            for result in checked:
+                if result.error != "judge":  # No judge could check it
+                    store.record_result(result)
+        checked += known_good
+        for result in checked:
+            if geo is not None:
+                pipeline.place(result)
+            pipeline.count_result(result)
+        results = rank_results(result for result in checked if pipeline.accepts(result))[:limit]
+
+    save_proxies(f"{filename}.{output_format}", results, output_format)
+    pipeline.metrics.finish()
+    pipeline.metrics.write(metrics, prometheus)
+    stop_tracing(trace)
+    logger.info(f"Program execution time: {time() - start:.2f} sec")
+
+
+def coordinate(
+    listen: str,
+    filename: str,
+    infile: Optional[str] = None,
+    output_format: str = "txt",
+    size: int = lease_size,
+    expire_after: float = lease_timeout,
+) -> None:
+    """Scrapes (or reads --infile) and lets workers on other machines check the proxies"""
+    start = time()
+    if infile:
+        with open(infile) as f:
+            proxies = f.readlines()
+    else:
+        pipeline = ScrapePipeline(load_proxies_func(), host_limits=otherproxies.host_limits)
+        proxies = [result.proxy for result in asyncio.run(pipeline.run())]
+    coordinator = Coordinator(proxies, size, expire_after)
+    results = asyncio.run(coordinator.serve(*parse_address(listen)))
+    save_proxies(f"{filename}.{output_format}", [result for result in results if result.alive], output_format)
     logger.info(f"Program execution time: {time() - start:.2f} sec")
 
 
@@ -98,7 +208,8 @@ def cli():
         type=int,
         help="The number of workers that is transferred to "
         "ThreadPoolExecutor. Default set None. Because "
-        "python himself determines the required number of workers.",
+        "python himself determines the required number of workers. "
+        "With the async checker it is the number of simultaneous checks (default 500).",
     )
     argparser.add_argument(
         "-f",
@@ -115,15 +226,402 @@ def cli():
         help="The proxy check will be async",
     )
     argparser.add_argument("-i", "--infile", default=None, type=str, help="Use the proxies.txt for pc checking")
+    argparser.add_argument(
+        "--host-limit",
+        default=[],
+        action="append",
+        type=parse_host_limit,
+        metavar="HOST=INTERVAL[:CONCURRENCY]",
+        help="Seconds between requests and max simultaneous requests to a source host. Can be repeated.",
+    )
+    argparser.add_argument(
+        "-l",
+        "--limit",
+        default=None,
+        type=int,
+        help="Stop scraping and checking as soon as this number of good proxies is found",
+    )
+    argparser.add_argument(
+        "--max-latency",
+        default=None,
+        type=float,
+        help="Keep only proxies that answered the checker faster than this number of seconds",
+    )
+    argparser.add_argument(
+        "--country",
+        default=[],
+        action="append",
+        help="Keep only proxies from this country (ISO code reported by the checker). Can be repeated.",
+    )
+    argparser.add_argument(
+        "--protocol",
+        default=[],
+        action="append",
+        choices=protocols,
+        help="Keep only proxies that speak this protocol (https is CONNECT), detected by the async checker "
+        "with --backend detect. Can be repeated.",
+    )
+    argparser.add_argument(
+        "--anonymity",
+        default=None,
+        choices=anonymity_levels,
+        help="Keep only proxies at least this anonymous: transparent < anonymous (tells it is a proxy) < elite. "
+        "Needs a judge that echoes the request headers",
+    )
+
+    argparser.add_argument(
+        "--db",
+        default=None,
+        type=str,
+        help="SQLite file with the history of proxies. With it only new and stale proxies are checked",
+    )
+    argparser.add_argument(
+        "--stale-after",
+        default=60,
+        type=float,
+        help="Minutes after which a checked proxy from --db is checked again. Default 60",
+    )
+    argparser.add_argument(
+        "--max-failures",
+        default=3,
+        type=int,
+        help="Proxies from --db that failed so many checks in a row wait --retry-after hours. Default 3",
+    )
+    argparser.add_argument(
+        "--retry-after",
+        default=24,
+        type=float,
+        help="Hours before a proxy with --max-failures failures is checked again. Default 24",
+    )
+
+    argparser.add_argument(
+        "--prefilter",
+        default=False,
+        action="store_true",
+        help="Before the full check drop proxies that don't accept a TCP connection",
+    )
+    argparser.add_argument(
+        "--connect-workers",
+        default=None,
+        type=int,
+        help="Simultaneous TCP connects of --prefilter. Default 2000",
+    )
+    argparser.add_argument(
+        "--connect-timeout",
+        default=None,
+        type=float,
+        help="Seconds to wait for a TCP connection in --prefilter. Default 1.5",
+    )
+    argparser.add_argument(
+        "--backend",
+        default="httpx",
+        choices=sorted(probe_backends),
+        help="How the async checker talks to proxies: httpx client, raw sockets (less overhead per check) "
+        "or raw sockets that also find out which of http, https, socks4 and socks5 the proxy speaks. Default httpx",
+    )
+    argparser.add_argument(
+        "--judge",
+        default=[],
+        action="append",
+        metavar="URL",
+        help="Url that answers with the ip of the client as JSON, checks are spread over all judges. "
+        f"Can be repeated. Default {proxy_checker.url}",
+    )
+    argparser.add_argument(
+        "--probes",
+        default=1,
+        type=int,
+        help="Probes of every working proxy, its latency is the median of them. Default 1",
+    )
+    argparser.add_argument(
+        "--format",
+        default="txt",
+        choices=output_formats,
+        help="txt is a proxy per line, csv and json also have connect time, time to first byte, "
+        "latency and score. Proxies are sorted best first. Default txt",
+    )
+    argparser.add_argument(
+        "--processes",
+        default=1,
+        type=int,
+        help="Run the async checker in this many processes, --workers checks are split between them. Default 1",
+    )
+    argparser.add_argument(
+        "--record",
+        default=None,
+        metavar="ARCHIVE",
+        help="Save every response of the sources into this gzipped archive (e.g. sources.jsonl.gz)",
+    )
+    argparser.add_argument(
+        "--replay",
+        default=None,
+        metavar="ARCHIVE",
+        help="Take the responses of the sources from an archive of --record instead of the network",
+    )
+    argparser.add_argument(
+        "--adaptive-timeout",
+        action="store_true",
+        help="Tighten the check timeout to a percentile of the latencies of the working proxies found so far, "
+        "and learn fetch timeouts per source host. A sample of the cut checks is re-checked to report the misses",
+    )
+    argparser.add_argument(
+        "--timeout-percentile",
+        default=95.0,
+        type=float,
+        help="Percentile of the working proxies' latencies for --adaptive-timeout. Default 95",
+    )
+    argparser.add_argument(
+        "--timeout-margin",
+        default=0.5,
+        type=float,
+        help="Seconds added to the percentile for --adaptive-timeout. Default 0.5",
+    )
+    argparser.add_argument(
+        "--fetch-history",
+        default=None,
+        metavar="FILE",
+        help="Keep the fetch durations of the source hosts in this JSON file, so timeouts are learned over runs",
+    )
+    argparser.add_argument(
+        "--cache",
+        default=None,
+        metavar="DIR",
+        help="Keep static source files here and download them only when they changed (ETag, Last-Modified)",
+    )
+    argparser.add_argument(
+        "--geo-db",
+        default=None,
+        metavar="FILE",
+        help="Add the country and ASN of every proxy from this database (made by the geo-db command), offline. "
+        "With --country proxies of other countries are not checked",
+    )
+    argparser.add_argument(
+        "--metrics",
+        default=None,
+        metavar="FILE",
+        help="Write a JSON run report: fetch, parse and yield of every source, outcomes and latencies of the checks",
+    )
+    argparser.add_argument(
+        "--prometheus",
+        default=None,
+        metavar="FILE",
+        help="Write the same metrics in the Prometheus text format (e.g. for the node exporter textfile collector)",
+    )
+    argparser.add_argument(
+        "--trace",
+        default=None,
+        metavar="FILE",
+        help="Write a timeline of source fetches, pages, parsing, dedup and checks in the Chrome trace format",
+    )
+
+    commands = argparser.add_subparsers(dest="command", metavar="COMMAND")
+    judge_server = commands.add_parser("judge-server", help="Run a judge that echoes the client ip and headers")
+    judge_server.add_argument("--host", default="0.0.0.0", help="Default 0.0.0.0")
+    judge_server.add_argument("--port", default=judge_port, type=int, help=f"Default {judge_port}")
+
+    coordinator = commands.add_parser("coordinator", help="Scrape and hand the proxies to workers to check them")
+    coordinator.add_argument(
+        "--listen", default=f"0.0.0.0:{coordinator_port}", help=f"HOST:PORT. Default 0.0.0.0:{coordinator_port}"
+    )
+    coordinator.add_argument("-i", "--infile", default=None, help="Check the proxies of this file instead of scraping")
+    coordinator.add_argument("-f", "--file-name", default="proxies", help="Name of the file you want to save")
+    coordinator.add_argument("--format", default="txt", choices=output_formats, help="Default txt")
+    coordinator.add_argument(
+        "--lease-size", default=lease_size, type=int, help=f"Proxies a worker gets at once. Default {lease_size}"
+    )
+    coordinator.add_argument(
+        "--lease-timeout",
+        default=lease_timeout,
+        type=float,
+        help=f"Seconds after which an unreported lease goes to another worker. Default {lease_timeout:.0f}",
+    )
+
+    daemon = commands.add_parser("daemon", help="Keep a pool of working proxies fresh and serve it over HTTP")
+    daemon.add_argument(
+        "--listen", default=f"127.0.0.1:{daemon_port}", help=f"HOST:PORT of the API. Default 127.0.0.1:{daemon_port}"
+    )
+    serve_proxy = commands.add_parser(
+        "serve-proxy", help="Run the daemon and a rotating forward proxy that sends requests through its pool"
+    )
+    serve_proxy.add_argument(
+        "--listen",
+        default=f"127.0.0.1:{forward_port}",
+        help=f"HOST:PORT of the forward proxy. Default 127.0.0.1:{forward_port}",
+    )
+    serve_proxy.add_argument(
+        "--api", default=f"127.0.0.1:{daemon_port}", help=f"HOST:PORT of the pool API. Default 127.0.0.1:{daemon_port}"
+    )
+    serve_proxy.add_argument(
+        "--retries", default=2, type=int, help="Other members a failed request is tried through. Default 2"
+    )
+    serve_proxy.add_argument(
+        "--eject-after",
+        default=3,
+        type=int,
+        help="Failed requests in a row after which a member is ejected until its next check. Default 3",
+    )
+    serve_proxy.add_argument(
+        "--upstream-timeout",
+        default=5.0,
+        type=float,
+        help="Seconds a member has to connect and start its answer before the request goes to another one. "
+        "Default 5",
+    )
+    for pool_command in (daemon, serve_proxy):
+        pool_command.add_argument(
+            "--refresh-interval",
+            default=refresh_interval,
+            type=float,
+            help=f"Seconds between two fetches of a source. Default {refresh_interval}",
+        )
+        pool_command.add_argument(
+            "--refresh",
+            default=[],
+            action="append",
+            type=parse_refresh,
+            metavar="SOURCE=SECONDS",
+            help="Refresh interval of one source, by the name of its parser (e.g. spys_me=3600). Can be repeated.",
+        )
+        pool_command.add_argument(
+            "--revalidate-after",
+            default=300,
+            type=float,
+            help="Seconds after which a working proxy is checked again, the oldest checks go first. Default 300",
+        )
+        pool_command.add_argument(
+            "--max-failures",
+            default=2,
+            type=int,
+            help="Failed checks in a row after which a proxy leaves the pool. Default 2",
+        )
+        pool_command.add_argument("-w", "--workers", default=None, type=int, help="Simultaneous checks. Default 500")
+        pool_command.add_argument("--backend", default="httpx", choices=sorted(probe_backends), help="Default httpx")
+        pool_command.add_argument("--judge", default=[], action="append", metavar="URL", help="Can be repeated")
+        pool_command.add_argument(
+            "--cache", default=None, metavar="DIR", help="Conditional request cache of static sources"
+        )
+
+    worker = commands.add_parser("worker", help="Check proxies of a coordinator")
+    worker.add_argument("--coordinator", required=True, metavar="HOST:PORT")
+    worker.add_argument(
+        "-w",
+        "--workers",
+        default=None,
+        type=int,
+        help=f"Simultaneous checks. Default {proxy_checker.default_concurrency}",
+    )
+    worker.add_argument("--backend", default="httpx", choices=sorted(probe_backends), help="Default httpx")
+    worker.add_argument("--judge", default=[], action="append", metavar="URL", help="Can be repeated")
+    worker.add_argument("--probes", default=1, type=int, help="Default 1")
+
+    geo_db = commands.add_parser("geo-db", help="Build the database of --geo-db out of ip range files (gzipped or not)")
+    geo_db.add_argument(
+        "sources",
+        nargs="+",
+        metavar="SOURCE",
+        help="ip2asn-v4.tsv of iptoasn.com, or a CSV of first ip, last ip, country[, ASN]. "
+        "Where ranges overlap the first source wins",
+    )
+    geo_db.add_argument("-o", "--output", default="geo.db", help="Default geo.db")
 
     args = argparser.parse_args()
+    if args.command == "judge-server":
+        with suppress(KeyboardInterrupt):
+            asyncio.run(serve_judge(args.host, args.port))
+        return
+    if args.command == "geo-db":
+        build_geo_db(args.sources, args.output)
+        return
+    if args.command == "coordinator":
+        coordinate(args.listen, args.file_name, args.infile, args.format, args.lease_size, args.lease_timeout)
+        return
+    if args.command in ("daemon", "serve-proxy"):
+        # Checks and, with serve-proxy, client connections with their upstream ones
+        raise_open_files_limit((args.workers or proxy_checker.default_concurrency) + 8192)
+        proxy_daemon = ProxyDaemon(
+            load_proxies_func(),
+            ProxyPool(args.revalidate_after, args.max_failures),
+            workers=args.workers,
+            backend=args.backend,
+            judges=args.judge,
+            interval=args.refresh_interval,
+            intervals=dict(args.refresh),
+            host_limits={**otherproxies.host_limits, **dict(args.host_limit)},
+            cache=ResponseCache(args.cache) if args.cache else None,
+        )
+        with suppress(KeyboardInterrupt):
+            if args.command == "daemon":
+                asyncio.run(proxy_daemon.run(*parse_address(args.listen, daemon_port)))
+            else:
+                forward = ForwardProxy(proxy_daemon.pool, args.retries, args.eject_after, args.upstream_timeout)
+                asyncio.run(
+                    serve_rotating_proxy(
+                        proxy_daemon,
+                        forward,
+                        parse_address(args.listen, forward_port),
+                        parse_address(args.api, daemon_port),
+                    )
+                )
+        return
+    if args.command == "worker":
+        raise_open_files_limit((args.workers or proxy_checker.default_concurrency) + 256)
+        judges = JudgePool(args.judge or [proxy_checker.url])
+        asyncio.run(
+            run_worker(
+                *parse_address(args.coordinator),
+                workers=args.workers,
+                probe=probe_backends[args.backend],
+                judges=judges,
+                probes=args.probes,
+            )
+        )
+        return
+    if args.prefilter:
+        # Connects of the prefilter and checks of the checker are open at the same time
+        raise_open_files_limit(
+            (args.connect_workers or prefilter.default_concurrency)
+            + (args.workers or proxy_checker.default_concurrency)
+            + 256
+        )
+    store = None
+    if args.db:
+        store = ProxyStore(args.db, args.stale_after * 60, args.max_failures, args.retry_after * 3600)
+    if args.protocol and args.backend != "detect":
+        logger.info("--protocol needs the protocols of every proxy, they are checked with --backend detect")
+        args.backend = "detect"
     main(
         filename=args.file_name,
         workers=args.workers,
         checker=args.proxy_checker,
         async_enabled=args.async_enabled,
         infile=args.infile,
+        host_limits=dict(args.host_limit),
+        limit=args.limit,
+        max_latency=args.max_latency,
+        countries=args.country,
+        protocols=args.protocol,
+        anonymity=args.anonymity,
+        store=store,
+        prefilter=args.prefilter,
+        connect_workers=args.connect_workers,
+        connect_timeout=args.connect_timeout,
+        backend=args.backend,
+        judges=args.judge,
+        probes=args.probes,
+        output_format=args.format,
+        processes=args.processes,
+        record=args.record,
+        replay=args.replay,
+        metrics=args.metrics,
+        prometheus=args.prometheus,
+        trace=args.trace,
+        cache=ResponseCache(args.cache) if args.cache else None,
+        adaptive=AdaptiveTimeout(args.timeout_percentile, args.timeout_margin) if args.adaptive_timeout else None,
+        host_timeouts=HostTimeouts(args.fetch_history) if args.adaptive_timeout or args.fetch_history else None,
+        geo=GeoDB(args.geo_db) if args.geo_db else None,
     )
+    if store is not None:
+        store.close()
 
 
 if __name__ == "__main__":
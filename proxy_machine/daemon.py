@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+from http import HTTPStatus
+from time import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from .pipeline import probe_backends
+from .tools.adaptive import HostTimeouts
+from .tools.cache import ResponseCache
+from .tools.fetcher import Fetcher
+from .tools.forward import ForwardProxy
+from .tools.judges import JudgePool
+from .tools.packed import pack_proxy, unpack_proxy
+from .tools.pages import page_sink
+from .tools.pool import ProxyPool
+from .tools.proxies_manipulation import prepare_proxy
+from .tools.proxy_checker import anonymity_levels, iter_checking_async, url
+from .tools.scheduler import HostLimit, HostScheduler
+from .tools.trace import span
+
+logger = logging.getLogger(__name__)
+daemon_port = 8088
+refresh_interval = 600
+# Proxies an API answer has when ?count= is not given
+default_count = 10
+
+
+def parse_refresh(value: str) -> Tuple[str, float]:
+    """Parses the cli value SOURCE=SECONDS"""
+    source, _, seconds = value.partition("=")
+    if not source or not seconds:
+        raise ValueError(f"Expected SOURCE=SECONDS, got {value!r}")
+    return source, float(seconds)
+
+
+class ProxyDaemon:
+    """Keeps a pool of working proxies fresh and answers with them over HTTP.
+    Every source is fetched again on its own schedule, new proxies and due re-checks of the members
+    share one checker, the API only reads the pool"""
+
+    def __init__(
+        self,
+        parsers: List[Any],
+        pool: Optional[ProxyPool] = None,
+        workers: Optional[int] = None,
+        backend: str = "httpx",
+        judges: Optional[Sequence[str]] = None,
+        interval: float = refresh_interval,
+        intervals: Optional[Dict[str, float]] = None,
+        host_limits: Optional[Dict[str, HostLimit]] = None,
+        cache: Optional[ResponseCache] = None,
+        host_timeouts: Optional[HostTimeouts] = None,
+    ) -> None:
+        self.parsers = parsers
+        self.pool = pool if pool is not None else ProxyPool()  # An empty pool is falsy
+        self.workers = workers
+        self.probe = probe_backends[backend]
+        self.judges = JudgePool(judges or [url])
+        self.interval = interval
+        self.intervals = dict(intervals or {})  # per source, by the name of its parser
+        self.scheduler = HostScheduler(host_limits)
+        self.cache = cache
+        self.host_timeouts = host_timeouts
+        self.sources: Dict[str, Dict[str, Any]] = {}
+        self.forward: Optional[ForwardProxy] = None  # set by serve_rotating_proxy
+        self.started = time()
+
+    def interval_for(self, parser: Any) -> float:
+        return self.intervals.get(parser.__name__, self.interval)
+
+    def _offer(self, proxies: Iterable[str], source: str) -> int:
+        values = {pack_proxy(proxy) for proxy in proxies} - {None}
+        return self.pool.offer([prepare_proxy(unpack_proxy(value)) for value in values], source)  # type: ignore
+
+    async def _refresh(self, parser: Any, fetcher: Fetcher) -> None:
+        name = parser.__name__
+        state = self.sources[name] = {"interval": self.interval_for(parser), "runs": 0, "failures": 0}
+        streamed: Set[str] = set()
+        new = 0
+
+        def take_page(proxies: Set[str]) -> None:
+            nonlocal new
+            streamed.update(proxies)
+            new += self._offer(proxies, name)
+
+        page_sink.set(take_page)  # Only for the task of this source
+        while True:
+            streamed.clear()
+            new = 0
+            try:
+                with span(name, "source"):
+                    proxies = await parser(fetcher)
+            except Exception as e:
+                state["failures"] += 1
+                logger.warning(f"Source {name} failed: {e!r}")
+            else:
+                new += self._offer(set(proxies) - streamed, name)
+                state.update(last_refresh=time(), proxies=len(proxies), new=new)
+                logger.info(f"{name}: {len(proxies)} proxies, {new} new, next refresh in {state['interval']:.0f} sec")
+            state["runs"] += 1
+            if self.host_timeouts is not None:
+                self.host_timeouts.save()
+            await asyncio.sleep(state["interval"])
+
+    async def _check(self) -> None:
+        probe = self.judges.wrap(self.probe)
+        async for result in iter_checking_async(self.pool.due(), self.workers, probe=probe):
+            self.pool.record(result)
+
+    def answer(self, target: str) -> Tuple[int, str, bytes]:
+        """Status, content type and body for a GET of `target`"""
+        parts = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+        if parts.path == "/stats":
+            stats = {"uptime": time() - self.started, **self.pool.counts(), "sources": self.sources}
+            if self.forward is not None:
+                stats["forward"] = dict(self.forward.stats)
+            return 200, "application/json", json.dumps(stats).encode()
+        if parts.path != "/proxies":
+            return 404, "text/plain", b"GET /proxies or /stats\n"
+        try:
+            count = int(query.get("count", default_count))
+            max_latency = float(query["max_latency"]) if "max_latency" in query else None
+        except ValueError as e:
+            return 400, "text/plain", f"{e}\n".encode()
+        anonymity = query.get("anonymity")
+        if anonymity is not None and anonymity not in anonymity_levels:
+            return 400, "text/plain", f"anonymity is one of {', '.join(anonymity_levels)}\n".encode()
+        entries = self.pool.select(count, max_latency, query.get("protocol"), query.get("country"), anonymity)
+        if query.get("format") == "txt":
+            return 200, "text/plain", "".join(f"{entry.url}\n" for entry in entries).encode()
+        return 200, "application/json", json.dumps([entry.as_dict() for entry in entries]).encode()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+                method, target, version = request_line.split(" ", 2)
+                lowered = {}
+                for line in header_lines:
+                    name, _, value = line.partition(":")
+                    lowered[name.strip().lower()] = value.strip()
+                length = int(lowered.get("content-length", 0))
+                if length:
+                    await reader.readexactly(length)
+                if method == "GET":
+                    status, content_type, body = self.answer(target)
+                else:
+                    status, content_type, body = 405, "text/plain", b"Only GET\n"
+                keep_alive = version == "HTTP/1.1" and lowered.get("connection", "").lower() != "close"
+                writer.write(
+                    b"HTTP/1.1 %d %s\r\nContent-Type: %s\r\nCache-Control: no-store\r\n"
+                    b"Content-Length: %d\r\nConnection: %s\r\n\r\n%s"
+                    % (
+                        status,
+                        HTTPStatus(status).phrase.encode(),
+                        content_type.encode(),
+                        len(body),
+                        b"keep-alive" if keep_alive else b"close",
+                        body,
+                    )
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def run(self, host: str = "127.0.0.1", port: int = daemon_port) -> None:
+        """Runs until cancelled"""
+        await self.judges.verify()
+        server = await asyncio.start_server(self._serve, host, port, backlog=1024)
+        logger.info(f"Proxy pool is served on http://{host}:{port}/proxies, {len(self.parsers)} sources")
+        async with Fetcher(scheduler=self.scheduler, cache=self.cache, host_timeouts=self.host_timeouts) as fetcher:
+            tasks = [asyncio.ensure_future(self._refresh(parser, fetcher)) for parser in self.parsers]
+            tasks.append(asyncio.ensure_future(self._check()))
+            try:
+                async with server:
+                    await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if self.host_timeouts is not None:
+                    self.host_timeouts.save()
+
+
+async def serve_rotating_proxy(
+    daemon: ProxyDaemon, forward: ForwardProxy, listen: Tuple[str, int], api: Tuple[str, int]
+) -> None:
+    """The daemon and a forward proxy in front of its pool, until cancelled"""
+    daemon.forward = forward
+    server = await forward.start(*listen)
+    logger.info(f"Rotating proxy is listening on {listen[0]}:{listen[1]}")
+    try:
+        async with server:
+            await daemon.run(*api)
+    finally:
+        forward.report()
@@ -2,56 +2,64 @@ import json
 import logging
 import time
 from datetime import datetime as dt
-from typing import Set
+from typing import List, Set
 
-import brotli
-import requests
-from bs4 import BeautifulSoup
+import httpx
 from user_agent import generate_user_agent
 
-from .tools.proxies_manipulation import parse_proxies, short_url
+from .tools.extract import extract_proxies, last_option_number, table_slice
+from .tools.fetcher import Fetcher
+from .tools.pages import Page, paged
+from .tools.proxies_manipulation import decode_brotli, parse_proxies, short_url
+from .tools.scheduler import HostLimit
 
 logger = logging.getLogger(__name__)
 standard_headers = {"User-Agent": generate_user_agent()}
 timeout = 6
+# Crawl delays of the sites that ban too frequent requests
+host_limits = {
+    "aliveproxy.com": HostLimit(min_interval=1.3, max_concurrent=1),
+    "api.openproxy.space": HostLimit(min_interval=1.3, max_concurrent=1),
+    "checkerproxy.net": HostLimit(min_interval=3, max_concurrent=1),
+    "xiladaili.com": HostLimit(min_interval=0.5, max_concurrent=1),
+}
 
 
-def proxy50_50() -> Set[str]:
+async def proxy50_50(fetcher: Fetcher) -> Set[str]:
     url = "https://proxy50-50.blogspot.com/"
     proxies_set = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set)} proxies")
+        r = await fetcher.get(url, headers=standard_headers, timeout=timeout)
+        proxies_set.update(extract_proxies(r.content))
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxies_set)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set
 
 
-def proxy_searcher() -> Set[str]:
+async def proxy_searcher(fetcher: Fetcher) -> Set[str]:
     url = "http://proxysearcher.sourceforge.net/Proxy%20List.php?type=http"
     proxies_set2 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set2.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set2)} proxies")
+        r = await fetcher.get(url, headers=standard_headers, timeout=timeout)
+        proxies_set2.update(extract_proxies(r.content))
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxies_set2)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set2
 
 
-def hidester() -> Set[str]:
+async def hidester(fetcher: Fetcher) -> Set[str]:
     url = "https://hidester.com/proxydata/php/data.php"
     referer_url = "https://hidester.com/ru/public-proxy-ip-list/"
     user_agent = generate_user_agent()
     proxies_set3 = set()
     try:
-        with requests.Session() as s:
-            response = s.get(referer_url, headers=standard_headers, timeout=timeout)
+        response = await fetcher.get(referer_url, headers=standard_headers, timeout=timeout)
     except Exception:
-        logger.exception("Proxylink from {url} where not loaded :(")
+        logger.exception(f"Proxylink from {url} where not loaded :(")
         return proxies_set3
-    cookies_dict = response.cookies.get_dict()
+    cookies_dict = dict(response.cookies)
     cookies = "".join([f"{k}={v}" for k, v in cookies_dict.items()])
     params = (
         ("mykey", "data"),
@@ -78,63 +86,51 @@ def hidester() -> Set[str]:
         "user-agent": user_agent,
     }
     try:
-        r = requests.get(url, params=params, headers=headers, timeout=10)
-        decompress_uni = brotli.decompress(r.content)
+        r = await fetcher.get(url, params=params, headers=headers, timeout=10)
+        decompress_uni = decode_brotli(r.content)
         proxies = json.loads(decompress_uni.decode("utf-8"))
         for raw_proxy in proxies:
             if raw_proxy.get("type") in ("http", "https"):
                 proxy = f"{raw_proxy['IP']}:{raw_proxy['PORT']}"
                 proxies_set3.add(proxy)
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set3)} proxies")
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxies_set3)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set3
 
 
-def awmproxy() -> Set[str]:
+async def awmproxy(fetcher: Fetcher) -> Set[str]:
     url = "http://awmproxy.net"
     proxy_set4 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxy_set4.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxy_set4)} proxies")
+        r = await fetcher.get(url, headers=standard_headers, timeout=timeout)
+        proxy_set4.update(extract_proxies(r.content))
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxy_set4)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxy_set4
 
 
-def openproxy() -> Set[str]:
+@paged(headers=standard_headers, timeout=timeout)
+async def openproxy(fetcher: Fetcher) -> List[Page]:
     date = dt.now().strftime("%d.%m.%Y %H:%M:%S")
     strp_date = dt.strptime(date, "%d.%m.%Y %H:%M:%S")
     stamp_date = int(time.mktime(strp_date.timetuple()) * 1000)
-    proxy_set5 = set()
-    links = set()
-
     url = f"https://api.openproxy.space/list?skip=0&ts={stamp_date}"
-    try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        data = r.json()
-        for _dict in data:
-            if len(_dict.get("protocols")) == 2:
-                links.add(f"https://api.openproxy.space/list/{_dict.get('code')}")
-    except Exception:
-        logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
+    r = await fetcher.get(url, headers=standard_headers, timeout=timeout)
+    codes = dict.fromkeys(_dict.get("code") for _dict in r.json() if len(_dict.get("protocols")) == 2)
+    return [
+        Page(
+            f"https://api.openproxy.space/list/{code}",
+            lambda r: parse_proxies(str(r.json().get("data"))),
+            label=f"{code} section",
+        )
+        for code in codes
+    ]
 
-    logger.info(f"Parsing proxies from {short_url(url)}...")
-    for link in links:
-        try:
-            r = requests.get(link, headers=standard_headers, timeout=timeout)
-            proxies = parse_proxies(str(r.json().get("data")))
-            proxy_set5.update(proxies)
-            logger.info(f"From {r.url.split('/')[-1]} section were parsed {len(proxies)} proxies")
-        except Exception:
-            logger.exception(f"Proxies from {link.split('/')[-1]} were not loaded :(")
-        time.sleep(1.3)  # crawling-delay
-    logger.info(f"From {short_url(url)} were parsed {len(proxy_set5)} proxies")
-    return proxy_set5
-
-
-def aliveproxy() -> Set[str]:
+
+@paged(headers=standard_headers, timeout=timeout)
+async def aliveproxy(fetcher: Fetcher) -> List[Page]:
     urls = [
         "http://aliveproxy.com/fastest-proxies",
         "http://aliveproxy.com/high-anonymity-proxy-list",
@@ -146,51 +142,38 @@ def aliveproxy() -> Set[str]:
         "http://aliveproxy.com/jp-proxy-list",
         "http://aliveproxy.com/ca-proxy-list",
     ]
-    proxy_set7 = set()  # type: ignore
-    logger.info(f"Parsing proxies from {short_url(urls[0])}...")  # aliveproxy.com
-    for url in urls:
-        try:
-            r = requests.get(url, headers=standard_headers, timeout=timeout)
-            soup = BeautifulSoup(r.content, "lxml")
-            plp_s7 = len(proxy_set7)  # previous len proxy_set7
-            for proxy in soup.find("table", {"class": "cm or"}).find_all("tr")[1:]:
-                proxies = parse_proxies(str(proxy.find("td")))
-                proxy_set7.update(proxies)
-            link = r.url.split("/")[-2]
-            logger.info(f"From {link} section were parsed {len(proxy_set7) - plp_s7} proxies")
-            time.sleep(1.3)  # crawling-delay
-        except Exception:
-            logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
-    logger.info(f"From {short_url(urls[0])} were parsed {len(proxy_set7)} proxies")
-    return proxy_set7
-
-
-def community_aliveproxy() -> Set[str]:
+    return [
+        Page(
+            url,
+            lambda r: extract_proxies(table_slice(r.content, b'class="cm or"')),
+            label=f"{url.split('/')[-1]} section",
+        )
+        for url in urls
+    ]
+
+
+async def community_aliveproxy(fetcher: Fetcher) -> Set[str]:
     url = "http://community.aliveproxy.com/proxy_list_http_fastest"
     proxy_set8 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        soup = BeautifulSoup(r.content, "lxml")
-        for proxy in soup.find("table").find_all("tr")[1:]:
-            proxies = parse_proxies(proxy.text)
-            proxy_set8.update(proxies)
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxy_set8)} proxies")
+        r = await fetcher.get(url, headers=standard_headers, timeout=timeout)
+        proxy_set8.update(extract_proxies(table_slice(r.content)))
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxy_set8)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxy_set8
 
 
-def hidemy() -> Set[str]:
+@paged(headers=standard_headers, timeout=timeout)
+async def hidemy(fetcher: Fetcher) -> List[Page]:
     url = "http://hidemy.name/en/proxy-list/"
     countries = """AFALARAMAUATAZBHBDBYBEBZBJBOBABWBRBGBIKHCM\
 CACLCNCOCDCRHRCYCZDKECEGGQFIFRGEDEGRGTHNHKHUINIDIRIQIEILI\
 TJPKZKEKRKGLVLSLYLTMKMGMWMYMVMLMTMXMDMNMEMZNPNLNZNGNOPKPS\
 PAPYPEPHPLPTPRRORURWRSSCSGSKSISOZAESSDSESYTWTJTZTHTNTRUGU\
 AAEGBUSUYUZVEVNVGZW"""
-    proxies_set9 = set()
 
-    # 1-st start = 0. new page start=start+64.
-    for n in range(0, 15 * 64, 64):
+    def page(n: int) -> Page:
         params = (
             ("country", countries),
             ("maxtime", 3000),
@@ -200,187 +183,165 @@ AAEGBUSUYUZVEVNVGZW"""
             ("utf", ""),
             ("start", n),
         )
-        try:
-            r = requests.get(url, params=params, headers=standard_headers, timeout=timeout)
-            soup = BeautifulSoup(r.content, "lxml")
-            for tr in soup.find("table").find_all("tr")[1:]:
-                tds = tr.find_all("td")
-                proxies_set9.add(f"{tds[0].text}:{tds[1].text}")
-        except Exception:
-            logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
-    logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set9)} proxies")
-    return proxies_set9
-
-
-def proxy11() -> Set[str]:
+        return Page(url, lambda r: extract_proxies(table_slice(r.content)), {"params": params}, label=f"start={n}")
+
+    # 1-st start = 0. new page start=start+64.
+    return [page(n) for n in range(0, 15 * 64, 64)]
+
+
+async def proxy11(fetcher: Fetcher) -> Set[str]:
     url = "https://proxy11.com/api/demoweb/proxy.json"
     proxies_set10 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
+        r = await fetcher.get(url, headers=standard_headers, timeout=timeout)
         data_list = r.json().get("data")
         for data in data_list:
             proxy = f"{data.get('ip')}:{data.get('port')}"
             proxies_set10.add(proxy)
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set10)} proxies")
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxies_set10)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set10
 
 
-def httptunnel() -> Set[str]:
+async def httptunnel(fetcher: Fetcher) -> Set[str]:
     url = "http://www.httptunnel.ge/ProxyListForFree.aspx"
     proxies_set11 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set11.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set11)} proxies")
+        r = await fetcher.get(url, headers=standard_headers, timeout=timeout)
+        proxies_set11.update(extract_proxies(r.content))
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxies_set11)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set11
 
 
-def spys_me() -> Set[str]:
+async def spys_me(fetcher: Fetcher) -> Set[str]:
     url = "https://spys.me/proxy.txt"
     proxies_set12 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set12.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set12)} proxies")
+        proxies_set12.update(await fetcher.get_static(url, extract_proxies, headers=standard_headers, timeout=timeout))
+        logger.info(f"From {short_url(url)} were parsed {len(proxies_set12)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set12
 
 
-def fatezero() -> Set[str]:
+async def fatezero(fetcher: Fetcher) -> Set[str]:
     url = "http://static.fatezero.org/tmp/proxy.txt"
     proxies_set13 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set13.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set13)} proxies")
+        proxies_set13.update(await fetcher.get_static(url, extract_proxies, headers=standard_headers, timeout=timeout))
+        logger.info(f"From {short_url(url)} were parsed {len(proxies_set13)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set13
 
 
-def pubproxy() -> Set[str]:
+async def pubproxy(fetcher: Fetcher) -> Set[str]:
     url = "http://pubproxy.com/api/proxy"
     params = {"limit": "200", "format": "txt", "type": "http"}
     proxies_set14 = set()
     try:
-        r = requests.get(url, params=params, headers=standard_headers, timeout=timeout)
-        proxies_set14.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set14)} proxies")
+        r = await fetcher.get(url, params=params, headers=standard_headers, timeout=timeout)
+        proxies_set14.update(extract_proxies(r.content))
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxies_set14)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set14
 
 
-def proxylists() -> Set[str]:
+async def proxylists(fetcher: Fetcher) -> Set[str]:
     url = "http://www.proxylists.net/http_highanon.txt"
     proxies_set15 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set15.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set15)} proxies")
+        proxies_set15.update(await fetcher.get_static(url, extract_proxies, headers=standard_headers, timeout=timeout))
+        logger.info(f"From {short_url(url)} were parsed {len(proxies_set15)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set15
 
 
-def ab57ru() -> Set[str]:
+async def ab57ru(fetcher: Fetcher) -> Set[str]:
     url = "http://ab57.ru/downloads/proxylist.txt"
     proxies_set16 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set16.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set16)} proxies")
+        proxies_set16.update(await fetcher.get_static(url, extract_proxies, headers=standard_headers, timeout=timeout))
+        logger.info(f"From {short_url(url)} were parsed {len(proxies_set16)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set16
 
 
-def shifty() -> Set[str]:
+async def shifty(fetcher: Fetcher) -> Set[str]:
     url = "http://raw.githubusercontent.com/ShiftyTR/Proxy-List/master/https.txt"
     proxies_set17 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set17.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set17)} proxies")
+        proxies_set17.update(await fetcher.get_static(url, extract_proxies, headers=standard_headers, timeout=timeout))
+        logger.info(f"From {short_url(url)} were parsed {len(proxies_set17)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set17
 
 
-def shifty2() -> Set[str]:
+async def shifty2(fetcher: Fetcher) -> Set[str]:
     url = "http://raw.githubusercontent.com/ShiftyTR/Proxy-List/master/http.txt"
     proxies_set18 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set18.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set18)} proxies")
+        proxies_set18.update(await fetcher.get_static(url, extract_proxies, headers=standard_headers, timeout=timeout))
+        logger.info(f"From {short_url(url)} were parsed {len(proxies_set18)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set18
 
 
-def sunny9577() -> Set[str]:
+async def sunny9577(fetcher: Fetcher) -> Set[str]:
     url = "https://raw.githubusercontent.com/sunny9577/proxy-scraper/master/proxies.txt"
     proxies_set19 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set19.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set19)} proxies")
+        proxies_set19.update(await fetcher.get_static(url, extract_proxies, headers=standard_headers, timeout=timeout))
+        logger.info(f"From {short_url(url)} were parsed {len(proxies_set19)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set19
 
 
-def multiproxy() -> Set[str]:
+async def multiproxy(fetcher: Fetcher) -> Set[str]:
     url = "http://multiproxy.org/txt_all/proxy.txt"
     proxies_set21 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set21.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set21)} proxies")
+        proxies_set21.update(await fetcher.get_static(url, extract_proxies, headers=standard_headers, timeout=timeout))
+        logger.info(f"From {short_url(url)} were parsed {len(proxies_set21)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set21
 
 
-def root_jazz() -> Set[str]:
+async def root_jazz(fetcher: Fetcher) -> Set[str]:
     url = "http://rootjazz.com/proxies/proxies.txt"
     proxies_set22 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        proxies_set22.update(parse_proxies(r.text))
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set22)} proxies")
+        proxies_set22.update(await fetcher.get_static(url, extract_proxies, headers=standard_headers, timeout=timeout))
+        logger.info(f"From {short_url(url)} were parsed {len(proxies_set22)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set22
 
 
-def proxyscan() -> Set[str]:
+@paged(headers=standard_headers, timeout=timeout)
+async def proxyscan(fetcher: Fetcher) -> List[Page]:
     url = "http://www.proxyscan.io/api/proxy"
-    proxies_set23 = set()
     params = (
         ("ping", "500"),
         ("limit", "100"),
         ("type", "http,https"),
         ("format", "txt"),
     )
-    for _ in range(8):
-        try:
-            r = requests.get(url, params=params, headers=standard_headers, timeout=timeout)
-            proxies = parse_proxies(r.text)
-            proxies_set23.update(proxies)
-        except Exception:
-            logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
-    logger.info(f"From {short_url(url)} were parsed {len(proxies_set23)} proxies")
-    return proxies_set23
-
-
-def proxy_list_download() -> Set[str]:
+    # Every call answers with another random batch
+    return [Page(url, lambda r: extract_proxies(r.content), {"params": params}, label=f"batch {n}") for n in range(8)]
+
+
+async def proxy_list_download(fetcher: Fetcher) -> Set[str]:
     url = "https://www.proxy-list.download/api/v0/get?l=en&t=http"
     pl_headers = {
         "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,\
@@ -393,129 +354,103 @@ def proxy_list_download() -> Set[str]:
     }
     proxies_set24 = set()
     try:
-        r = requests.get(url, headers=pl_headers, timeout=timeout)
+        r = await fetcher.get(url, headers=pl_headers, timeout=timeout)
 
-        bytebrotl = brotli.decompress(r.content)
+        bytebrotl = decode_brotli(r.content)
         strbrotl = bytebrotl.decode("utf-8")
         data = json.loads(strbrotl)
 
         proxies_list = data[0].get("LISTA")
         for proxy in proxies_list:
             proxies_set24.add(f"{proxy.get('IP')}:{proxy.get('PORT')}")
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set24)} proxies")
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxies_set24)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set24
 
 
-def proxylistplus() -> Set[str]:
+@paged(headers=standard_headers, timeout=timeout)
+async def proxylistplus(fetcher: Fetcher) -> List[Page]:
     url = "https://list.proxylistplus.com/SSL-List-1"
-    proxies_set25 = set()
-    try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        soup = BeautifulSoup(r.content, "lxml")
-        max_page_num = soup.find("select", {"onchange": "window.location=this.value"}).find_all("option")[-1].text
-        for page_num in range(1, int(max_page_num) + 1):
-            url = f"https://list.proxylistplus.com/SSL-List-{page_num}"
-            r = requests.get(url, headers=standard_headers, timeout=timeout)
-            soup = BeautifulSoup(r.content, "lxml")
-            table = soup.find("table", {"class": "bg"})
-            for tr in table.find_all("tr")[2:]:
-                tds = tr.find_all("td")
-                ip, port = tds[1].text.strip(), tds[2].text.strip()
-                proxies_set25.add(f"{ip}:{port}")
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set25)} proxies")
-    except Exception:
-        logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
-    return proxies_set25
 
+    def parse_page(r: httpx.Response) -> Set[str]:
+        return extract_proxies(table_slice(r.content, b'class="bg"'))
+
+    r = await fetcher.get(url, headers=standard_headers, timeout=timeout)
+    pager = r.content[r.content.find(b"window.location=this.value") :]
+    max_page_num = last_option_number(pager[: pager.find(b"</select>")]) or 1
+    first = Page(url, parse_page, response=r)  # The first page is already loaded
+    pages = (Page(f"https://list.proxylistplus.com/SSL-List-{n}", parse_page) for n in range(2, max_page_num + 1))
+    return [first, *pages]
 
-def proxyhub() -> Set[str]:
+
+@paged(headers=standard_headers, timeout=timeout)
+async def proxyhub(fetcher: Fetcher) -> List[Page]:
     url = "https://www.proxyhub.me/ru/all-https-proxy-list.html"
-    proxies_set26 = set()
-    for page in range(1, 11):
-        try:
-            cookies = {"anonymity": "all", "page": f"{page}"}
-            r = requests.get(url, headers=standard_headers, cookies=cookies, timeout=timeout)
-            soup = BeautifulSoup(r.content, "lxml")
-            table = soup.find("table", {"class": "table-bordered"}).find("tbody")
-            for tr in table.find_all("tr"):
-                tds = tr.find_all("td")
-                proxies_set26.add(f"{tds[0].text}:{tds[1].text}")
-        except Exception:
-            logger.exception(f"Proxies from {short_url(url)} page: {page} were not loaded :(")
-    logger.info(f"From {short_url(url)} were parsed {len(proxies_set26)} proxies")
-    return proxies_set26
-
-
-def proxylist4all() -> Set[str]:
+    return [
+        Page(
+            url,
+            lambda r: extract_proxies(table_slice(r.content, b"table-bordered")),
+            {"cookies": {"anonymity": "all", "page": f"{page}"}},
+            label=f"page {page}",
+        )
+        for page in range(1, 11)
+    ]
+
+
+async def proxylist4all(fetcher: Fetcher) -> Set[str]:
     url = "https://www.proxylist4all.com/wp-admin/admin-ajax.php"
     proxies_set27 = set()
     data = {"action": "getProxyList", "request": ""}
     cookies = {"www.proxylist4all.com": "{}"}
     try:
-        r = requests.post(url, data=data, cookies=cookies, headers=standard_headers, timeout=timeout)
+        r = await fetcher.post(url, data=data, cookies=cookies, headers=standard_headers, timeout=timeout)
         for proxy in r.json():
             proxies_set27.add(f"{proxy.get('host')}:{proxy.get('port')}")
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set27)} proxies")
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxies_set27)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set27
 
 
-def proxynova() -> Set[str]:
+async def proxynova(fetcher: Fetcher) -> Set[str]:
     url = "https://www.proxynova.com/proxy-server-list/"
     proxies_set28 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
-        soup = BeautifulSoup(r.content, "lxml")
-        table = soup.find("table", {"id": "tbl_proxy_list"}).find("tbody")
-        for tr in table.find_all("tr"):
-            if tr.attrs.get("data-proxy-id") is not None:
-                tds = tr.find_all("td")
-                host = tds[0].find("script").text.strip().split("'")[1]
-                port = tds[1].text.strip()
-            proxies_set28.add(f"{host}:{port}")
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set28)} proxies")
+        r = await fetcher.get(url, headers=standard_headers, timeout=timeout)
+        # The host is written by document.write('ip') next to the port cell
+        proxies_set28.update(extract_proxies(table_slice(r.content, b'id="tbl_proxy_list"')))
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxies_set28)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set28
 
 
-def fatezero2() -> Set[str]:
+async def fatezero2(fetcher: Fetcher) -> Set[str]:
     url = "http://proxylist.fatezero.org/proxy.list"
     proxies_set29 = set()
     try:
-        r = requests.get(url, headers=standard_headers, timeout=timeout)
+        r = await fetcher.get(url, headers=standard_headers, timeout=timeout)
         raw_proxies = r.text.strip().split("\n")
         for raw_proxy in raw_proxies:
             proxy = json.loads(raw_proxy)
             if proxy.get("type") == "https":
                 proxies_set29.add(f"{proxy['host']}:{proxy['port']}")
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set29)} proxies")
+        logger.info(f"From {short_url(str(r.url))} were parsed {len(proxies_set29)} proxies")
     except Exception:
         logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
     return proxies_set29
 
 
-def xiladaili() -> Set[str]:
-    url = "http://www.xiladaili.com/https"
-    proxies_set30 = set()
+@paged(headers=standard_headers, timeout=timeout)
+async def xiladaili(fetcher: Fetcher) -> List[Page]:
     max_page_num = 8
-    try:
-        for n in range(max_page_num):
-            url = f"http://www.xiladaili.com/https/{n}"
-            r = requests.get(url, headers=standard_headers, timeout=timeout)
-            if r.ok:
-                proxies_set30.update(parse_proxies(r.text))
-            time.sleep(0.5)
-        logger.info(f"From {short_url(r.url)} were parsed {len(proxies_set30)} proxies")
-    except Exception:
-        logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
-    return proxies_set30
+    return [
+        Page(f"http://www.xiladaili.com/https/{n}", lambda r: extract_proxies(r.content)) for n in range(max_page_num)
+    ]
 
 
-def geonode() -> Set[str]:
+async def geonode(fetcher: Fetcher) -> Set[str]:
     url = "https://proxylist.geonode.com/api/proxy-list"
     params = {
         "limit": 500,
@@ -526,7 +461,7 @@ def geonode() -> Set[str]:
     }
     proxies_set31 = set()
     try:
-        r = requests.get(url, params=params, headers=standard_headers, timeout=timeout)
+        r = await fetcher.get(url, params=params, headers=standard_headers, timeout=timeout)
         r_data = r.json()
         for proxy in r_data.get("data"):
             proxies_set31.add(f"{proxy.get('ip')}:{proxy.get('port')}")
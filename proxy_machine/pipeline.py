@@ -0,0 +1,308 @@
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set
+
+from .tools.adaptive import AdaptiveTimeout, HostTimeouts
+from .tools.cache import ResponseCache
+from .tools.fetcher import Fetcher
+from .tools.geo import GeoDB
+from .tools.judges import JudgePool
+from .tools.metrics import RunMetrics, current_source
+from .tools.packed import ProxyArray, pack_proxy, unpack_proxy
+from .tools.pages import page_sink
+from .tools.prefilter import StageStats, iter_reachable
+from .tools.processes import iter_checking_processes
+from .tools.protocols import detect_probe, speaks_any
+from .tools.proxies_manipulation import prepare_proxy
+from .tools.proxy_checker import CheckResult, hides_enough, iter_checking_async, probe_proxy
+from .tools.proxy_checker import timeout as check_timeout
+from .tools.proxy_checker import url
+from .tools.raw_probe import raw_probe
+from .tools.replay import open_fetcher
+from .tools.scheduler import HostLimit, HostScheduler
+from .tools.store import ProxyStore
+from .tools.trace import span
+
+logger = logging.getLogger(__name__)
+# Ways to send the check request through a proxy, chosen with --backend
+probe_backends = {"httpx": probe_proxy, "raw": raw_probe, "detect": detect_probe}
+# How often the number of checks in flight is sampled for the run report
+sample_interval = 0.5
+
+
+class ScrapePipeline:
+    """Streams proxies from the parsers to the checker as soon as a parser
+    returns them, and stops everything when enough good proxies are found"""
+
+    def __init__(
+        self,
+        parsers: List[Any],
+        checker: bool = False,
+        workers: Optional[int] = None,
+        limit: Optional[int] = None,
+        max_latency: Optional[float] = None,
+        countries: Optional[Iterable[str]] = None,
+        protocols: Optional[Iterable[str]] = None,
+        anonymity: Optional[str] = None,
+        host_limits: Optional[Dict[str, HostLimit]] = None,
+        store: Optional[ProxyStore] = None,
+        prefilter: bool = False,
+        connect_workers: Optional[int] = None,
+        connect_timeout: Optional[float] = None,
+        backend: str = "httpx",
+        judges: Optional[Sequence[str]] = None,
+        probes: int = 1,
+        processes: int = 1,
+        record: Optional[str] = None,
+        replay: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        adaptive: Optional[AdaptiveTimeout] = None,
+        host_timeouts: Optional[HostTimeouts] = None,
+        geo: Optional[GeoDB] = None,
+    ) -> None:
+        self.parsers = parsers
+        self.checker = checker
+        self.workers = workers
+        self.limit = limit
+        self.max_latency = max_latency
+        self.countries = {country.upper() for country in countries} if countries else None
+        self.protocols = set(protocols) if protocols else None
+        self.anonymity = anonymity  # the least anonymity_levels level a proxy needs
+        self.scheduler = HostScheduler(host_limits)
+        self.store = store
+        self.prefilter = prefilter
+        self.connect_workers = connect_workers
+        self.connect_timeout = connect_timeout
+        self.probe = probe_backends[backend]
+        self.judges = JudgePool(judges or [url])
+        self.probes = probes
+        self.processes = processes
+        self.record = record
+        self.replay = replay
+        self.cache = cache
+        self.adaptive = adaptive
+        self.host_timeouts = host_timeouts
+        self.geo = geo
+        self.tcp_stats = StageStats("TCP prefilter")
+        self.http_stats = StageStats("HTTP check")
+        self.seen = ProxyArray()
+        self.metrics = RunMetrics()
+        self.found_by: Dict[str, ProxyArray] = {}  # source -> the proxies it returned first
+        self.dispatched = 0
+        self.completed = 0
+        self.scraped = 0
+        self.skipped = 0
+        self.elsewhere = 0  # not checked, the geo database puts them in other countries
+        self.queue: "asyncio.Queue[Optional[int]]"
+        self.results: "asyncio.Queue[Optional[CheckResult]]"
+
+    def offer(self, proxies: Iterable[str], source: str = "") -> None:
+        """Puts new proxies to the checker queue, duplicates are dropped here"""
+        proxies = list(proxies)
+        self.scraped += len(proxies)
+        with span("dedup", "dedup", source=source, proxies=len(proxies)):
+            new_proxies = ProxyArray.from_strings(proxies).difference(self.seen)
+            self.seen = self.seen.union(new_proxies)
+        source_metrics = self.metrics.source(source)
+        source_metrics.raw += len(proxies)
+        source_metrics.unique += len(new_proxies)
+        if new_proxies:
+            known = self.found_by.get(source)
+            self.found_by[source] = new_proxies if known is None else known.union(new_proxies)
+        to_check: Sequence[int] = new_proxies  # type: ignore
+        if self.geo is not None:
+            to_check = self._locate(new_proxies)
+        if self.store is not None:
+            if self.checker:
+                candidates = to_check
+                to_check, known_good = self.store.triage(candidates)
+                self.skipped += len(candidates) - len(to_check) - len(known_good)
+                for result in known_good:
+                    self.results.put_nowait(result)
+            self.store.record_seen(new_proxies, source)
+        for value in to_check:
+            self.queue.put_nowait(value)
+
+    def _locate(self, proxies: ProxyArray) -> List[int]:
+        """Looks new proxies up in the geo database in one batch. With --country the proxies
+        that the database puts in other countries are not checked at all"""
+        with span("geo", "geo", proxies=len(proxies)):
+            locations = self.geo.lookup(proxies)  # type: ignore
+        if self.countries is None:
+            return list(proxies)
+        wanted = [
+            value for value, (country, _) in zip(proxies, locations) if country is None or country in self.countries
+        ]
+        self.elsewhere += len(proxies) - len(wanted)
+        return wanted
+
+    def place(self, result: CheckResult) -> None:
+        """Puts the country and ASN from the geo database into a working result, the judge's country is kept
+        if the database doesn't know the ip. One lookup per live proxy keeps nothing per scraped proxy"""
+        value = pack_proxy(result.proxy)
+        if not result.alive or value is None:
+            return
+        ((country, asn),) = self.geo.lookup([value])  # type: ignore
+        result.country = country or result.country
+        result.asn = asn
+
+    def accepts(self, result: CheckResult) -> bool:
+        if not result.alive:
+            return False
+        if self.max_latency is not None and (result.latency is None or result.latency > self.max_latency):
+            return False
+        if self.countries is not None and (result.country or "").upper() not in self.countries:
+            return False
+        if self.protocols is not None and not speaks_any(result, self.protocols):
+            return False
+        if self.anonymity is not None and not hides_enough(result.anonymity, self.anonymity):
+            return False
+        return True
+
+    def count_result(self, result: CheckResult) -> None:
+        """Adds a check result to the run metrics and a live proxy to its source"""
+        self.metrics.checker.record(result)
+        if not result.alive:
+            return
+        value = pack_proxy(result.proxy)
+        # A search in the proxies of every source, only for live proxies
+        source = next((name for name, proxies in self.found_by.items() if value in proxies), None)
+        if source is not None:
+            self.metrics.source(source).live += 1
+
+    async def _produce(self, parser: Any, fetcher: Fetcher) -> None:
+        # The metrics and the page sink are set only for the task of this parser
+        current_source.set(self.metrics.source(parser.__name__))
+        streamed: Set[str] = set()
+
+        def take_page(proxies: Set[str]) -> None:
+            # Proxies of a paged source go to the checker page by page
+            streamed.update(proxies)
+            self.offer(proxies, parser.__name__)
+
+        page_sink.set(take_page)
+        try:
+            with span(parser.__name__, "source"):
+                proxies = await parser(fetcher)
+            self.offer(set(proxies) - streamed, parser.__name__)
+        except Exception as e:
+            logger.warning(f"Source {parser.__name__} failed: {e!r}")
+
+    async def _produce_all(self, infile_proxies: Optional[Iterable[str]]) -> None:
+        try:
+            if infile_proxies is not None:
+                self.offer(infile_proxies, "infile")
+            else:
+                async with open_fetcher(
+                    self.scheduler, self.record, self.replay, self.cache, self.host_timeouts
+                ) as fetcher:
+                    await asyncio.gather(*(self._produce(parser, fetcher) for parser in self.parsers))
+                self.scheduler.report()
+                if self.host_timeouts is not None:
+                    self.host_timeouts.report()
+                    self.host_timeouts.save()
+        finally:
+            self.queue.put_nowait(None)  # No more proxies
+
+    async def _candidates(self) -> AsyncIterator[str]:
+        while True:
+            value = await self.queue.get()
+            if value is None:
+                return
+            self.dispatched += 1
+            yield prepare_proxy(unpack_proxy(value))
+
+    async def _check_all(self) -> None:
+        candidates = self._candidates()
+        if self.checker and self.prefilter:
+            connect_options = {"timeout": self.connect_timeout} if self.connect_timeout else {}
+            candidates = iter_reachable(candidates, self.connect_workers, stats=self.tcp_stats, **connect_options)
+        checked = None
+        try:
+            if self.checker:
+                await self.judges.verify()
+                if self.anonymity is not None and not self.judges.echo_headers:
+                    logger.warning(
+                        "No judge echoes the request headers, no proxy passes --anonymity. "
+                        "Use a judge like httpbin.org/get or the judge-server command"
+                    )
+                if self.processes > 1:
+                    checked = iter_checking_processes(
+                        candidates,
+                        self.processes,
+                        self.workers,
+                        probe=self.probe,
+                        judges=self.judges,
+                        probes=self.probes,
+                        adaptive=self.adaptive,
+                    )
+                else:
+                    probe = self.judges.wrap(self.probe)
+                    if self.adaptive is not None:
+                        probe = self.adaptive.wrap(probe)
+                    checked = iter_checking_async(candidates, self.workers, probe=probe, probes=self.probes)
+                async for result in checked:
+                    self.completed += 1
+                    self.http_stats.record("alive" if result.alive else "dead", result.alive)
+                    if self.store is not None and result.error != "judge":  # No judge could check it
+                        self.store.record_result(result)
+                    self.results.put_nowait(result)
+            else:
+                async for proxy in self._candidates():
+                    self.results.put_nowait(CheckResult(proxy, alive=True))
+        finally:
+            if checked is not None:
+                await checked.aclose()  # Cancels the checks that are still in flight
+            self.results.put_nowait(None)  # Everything is checked
+
+    async def _sample_in_flight(self) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        while True:
+            self.metrics.checker.sample(loop.time() - start, self.dispatched - self.completed)
+            await asyncio.sleep(sample_interval)
+
+    async def run(self, infile_proxies: Optional[Iterable[str]] = None) -> List[CheckResult]:
+        good_proxies: List[CheckResult] = []
+        self.queue, self.results = asyncio.Queue(), asyncio.Queue()
+        producers = asyncio.ensure_future(self._produce_all(infile_proxies))
+        checkers = asyncio.ensure_future(self._check_all())
+        sampler = asyncio.ensure_future(self._sample_in_flight() if self.checker else asyncio.sleep(0))
+        try:
+            while True:
+                result = await self.results.get()
+                if result is None:
+                    break
+                if self.geo is not None:
+                    self.place(result)
+                if not self.checker:
+                    # Not checked yet: the threaded checker or the user filters them later
+                    good_proxies.append(result)
+                    continue
+                self.count_result(result)
+                if self.accepts(result):
+                    good_proxies.append(result)
+                    if self.limit and len(good_proxies) >= self.limit:
+                        logger.info(f"Found {self.limit} good proxies, stopping early")
+                        break
+        finally:
+            for task in (producers, checkers, sampler):
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+            if self.store is not None:
+                self.store.flush()
+        logger.info(f"{len(self.seen)} unique proxies out of {self.scraped} scraped")
+        if self.skipped:
+            logger.info(f"{self.skipped} proxies were skipped because they failed recently")
+        if self.elsewhere:
+            logger.info(f"{self.elsewhere} proxies were not checked, the geo database puts them in other countries")
+        if self.checker:
+            if self.prefilter:
+                self.tcp_stats.report()
+            self.http_stats.report()
+            self.judges.report()
+            if self.adaptive is not None:
+                self.metrics.adaptive_timeout = self.adaptive.report(check_timeout)
+        return good_proxies
@@ -1,25 +1,27 @@
 import json
 import logging
 from datetime import date
-from time import sleep
-from typing import List, Set
+from typing import Dict, List, Set
 
-import brotli
-import requests
 from user_agent import generate_user_agent
 
-from .tools.proxies_manipulation import short_url
+from .tools.fetcher import Fetcher
+from .tools.proxies_manipulation import decode_brotli, short_url
 
 logger = logging.getLogger(__name__)
 
 
 class CheckerProxyArchive:
-    def __init__(self) -> None:
+    def __init__(self, fetcher: Fetcher) -> None:
         current_date = date.today().strftime("%Y-%m-%d")
         self.URL = f"https://checkerproxy.net/api/archive/{current_date}"
         self.REFERER_URL = f"https://checkerproxy.net/archive/{current_date}"
         self.proxies_set: Set[str] = set()
-        cookies = self.get_cookies()
+        self.fetcher = fetcher
+        self.headers: Dict[str, str] = {}
+
+    async def prepare_headers(self) -> None:
+        cookies = await self.get_cookies()
         self.headers = {
             "Accept": "*/*",
             "Accept-Encoding": "gzip, deflate, br",
@@ -32,39 +34,39 @@ class CheckerProxyArchive:
             "User-Agent": generate_user_agent(),
         }
 
-    def get_cookies(self) -> List[str]:
+    async def get_cookies(self) -> List[str]:
         """Loads cookies from the page and returns as string"""
-        r_cookies = requests.get(
+        r_cookies = await self.fetcher.get(
             self.REFERER_URL,
             headers={"User-Agent": generate_user_agent()},
             timeout=6,
         )
-        cookies_dict = r_cookies.cookies.get_dict()
+        cookies_dict = dict(r_cookies.cookies)
         return [f"{k}={v}" for k, v in cookies_dict.items()]
 
-    def parse_proxies(self) -> Set[str]:
+    async def parse_proxies(self) -> Set[str]:
         try:
-            r = requests.get(self.URL, headers=self.headers, timeout=6)
-            if not r.ok:
-                logger.info(f"Proxies from {short_url(r.url)} were not loaded :(")
+            r = await self.fetcher.get(self.URL, headers=self.headers, timeout=6)
+            if r.is_error:
+                logger.info(f"Proxies from {short_url(self.URL)} were not loaded :(")
                 return self.proxies_set
-            raw_proxies = brotli.decompress(r.content)
+            raw_proxies = decode_brotli(r.content)
             proxies = raw_proxies.decode("utf-8")
             proxies = json.loads(proxies)
             for proxy in proxies:
                 if proxy.get("type") in (1, 2) and 210 < proxy.get("timeout") < 6000:
                     self.proxies_set.add(proxy.get("addr"))
-            logger.info(f"From {short_url(r.url)} were parsed {len(self.proxies_set)} proxies")
+            logger.info(f"From {short_url(self.URL)} were parsed {len(self.proxies_set)} proxies")
         except Exception:
             logger.exception(
-                f"Proxies from {short_url(r.url)} were not loaded :(\
+                f"Proxies from {short_url(self.URL)} were not loaded :(\
                 \n*This can happen if there is no proxies on site"
             )
         return self.proxies_set
 
 
-def parse_proxyarchive() -> Set[str]:
-    cpa = CheckerProxyArchive()
-    sleep(3)
-    cpa_set = cpa.parse_proxies()
+async def parse_proxyarchive(fetcher: Fetcher) -> Set[str]:
+    cpa = CheckerProxyArchive(fetcher)
+    await cpa.prepare_headers()  # The crawl delay before the api request comes from otherproxies.host_limits
+    cpa_set = await cpa.parse_proxies()
     return cpa_set
@@ -1,22 +1,34 @@
+import asyncio
 import logging
 from typing import Dict, Set, Union
 
-import requests
 from proxyscrape import create_collector, get_collector, scrapers
 from proxyscrape.errors import CollectorAlreadyDefinedError
 from user_agent import generate_user_agent
 
+from .tools.fetcher import Fetcher
 from .tools.proxies_manipulation import short_url
 
 logger = logging.getLogger(__name__)
 
 
 class ProxyScraper:
-    def __init__(self) -> None:
+    def __init__(self, fetcher: Fetcher) -> None:
         self.proxy_set: Set[str] = set()
         self.proxy_set2: Set[str] = set()
-        self.lib_proxies = self.proxyscrape_lib()
-        self.site_proxies = self.proxyscrape_site()
+        self.fetcher = fetcher
+        self.lib_proxies: Set[str] = set()
+        self.site_proxies: Set[str] = set()
+
+    async def load(self) -> None:
+        if self.fetcher.offline:
+            # The library makes its own requests, they can't be recorded or replayed
+            self.site_proxies = await self.proxyscrape_site()
+            return
+        # proxyscrape library is blocking, so it runs in a thread next to the site request
+        self.lib_proxies, self.site_proxies = await asyncio.gather(
+            asyncio.to_thread(self.proxyscrape_lib), self.proxyscrape_site()
+        )
 
     def proxyscrape_lib(self) -> Set[str]:
         """Parsing proxies from proxyscrape py library"""
@@ -42,7 +54,7 @@ class ProxyScraper:
         logger.info(f"From proxyscrape_lib were parsed {len(self.proxy_set)} proxies")
         return self.proxy_set
 
-    def proxyscrape_site(self) -> Set[str]:
+    async def proxyscrape_site(self) -> Set[str]:
         """Parsing proxies from proxyscrape"""
         url = "https://api.proxyscrape.com/"
         payload: Dict[str, Union[str, int]] = {
@@ -58,22 +70,23 @@ class ProxyScraper:
             q=0.9,image/webp,*/*;q=0.8",
             "User-Agent": generate_user_agent(),
         }
-        r = requests.get(url, params=payload, headers=head, timeout=6)
         try:
-            if r.ok:
+            r = await self.fetcher.get(url, params=payload, headers=head, timeout=6)
+            if not r.is_error:
                 data = r.text.encode()
                 data_utf = data.decode("utf-8")
                 self.proxy_set2 = set(data_utf.replace("\r", "").split("\n"))
-            logger.info(f"From {short_url(r.url)} were parsed {len(self.proxy_set2)} proxies")
+            logger.info(f"From {short_url(url)} were parsed {len(self.proxy_set2)} proxies")
         except Exception:
-            logger.exception(f"Proxies from {short_url(r.url)} were not loaded :(")
+            logger.exception(f"Proxies from {short_url(url)} were not loaded :(")
         return self.proxy_set2
 
     def combine_results(self) -> Set[str]:
         return self.lib_proxies.union(self.site_proxies)
 
 
-def parse_proxyscrape() -> Set[str]:
-    ps = ProxyScraper()
+async def parse_proxyscrape(fetcher: Fetcher) -> Set[str]:
+    ps = ProxyScraper(fetcher)
+    await ps.load()
     ps_set = ps.combine_results()
     return ps_set
@@ -0,0 +1,181 @@
+import json
+import logging
+from bisect import insort
+from collections import Counter, defaultdict, deque
+from time import perf_counter
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import urlparse
+
+from .judges import Probe
+from .proxy_checker import CheckResult
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveTimeout:
+    """Deadline of the checks learned from the latencies of the successful ones during the run:
+    their `percentile` plus `margin`, never above the timeout the checker was given.
+    The deadline is tightened once the first checks had the whole timeout to answer.
+    Every `shadow_every`-th check that timed out under a tightened deadline is checked again
+    with the whole timeout, the ones that pass there are the false negatives of the deadline"""
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        margin: float = 0.5,
+        floor: float = 0.5,
+        warmup: int = 30,
+        shadow_every: int = 20,
+    ) -> None:
+        self.percentile = percentile
+        self.margin = margin
+        self.floor = floor
+        self.warmup = warmup
+        self.shadow_every = shadow_every
+        self.latencies: List[float] = []  # sorted
+        self.stats: Counter = Counter()
+        self.started: Optional[float] = None
+
+    def fresh(self) -> "AdaptiveTimeout":
+        """The same settings, nothing learned yet"""
+        return AdaptiveTimeout(self.percentile, self.margin, self.floor, self.warmup, self.shadow_every)
+
+    def learned_deadline(self, check_timeout: float) -> float:
+        if len(self.latencies) < self.warmup:
+            return check_timeout
+        rank = min(len(self.latencies) - 1, int(len(self.latencies) * self.percentile / 100))
+        return max(self.floor, min(check_timeout, self.latencies[rank] + self.margin))
+
+    def deadline(self, check_timeout: float) -> float:
+        # Fast proxies answer first: until the first checks had the whole timeout to answer,
+        # the latencies seen are only the fast part of them
+        if self.started is None or perf_counter() - self.started < check_timeout:
+            return check_timeout
+        return self.learned_deadline(check_timeout)
+
+    def wrap(self, probe: Probe) -> Probe:
+        async def check(proxy: str, check_timeout: float) -> CheckResult:
+            if self.started is None:
+                self.started = perf_counter()
+            deadline = self.deadline(check_timeout)
+            result = await probe(proxy, deadline)
+            self.stats["checks"] += 1
+            if result.alive and result.latency is not None:
+                insort(self.latencies, result.latency)
+            if result.error == "timeout" and deadline < check_timeout:
+                self.stats["tightened_timeouts"] += 1
+                self.stats["saved_seconds"] += check_timeout - deadline
+                if self.stats["tightened_timeouts"] % self.shadow_every == 0:
+                    self.stats["shadow_checks"] += 1
+                    shadow = await probe(proxy, check_timeout)
+                    if shadow.alive:
+                        self.stats["false_negatives"] += 1
+                        # Successes slower than the deadline are only seen here, one of them
+                        # stands for `shadow_every` cut checks, or the deadline would only shrink
+                        for _ in range(self.shadow_every):
+                            insort(self.latencies, shadow.latency)
+                        return shadow
+            return result
+
+        return check
+
+    @property
+    def false_negative_rate(self) -> Optional[float]:
+        """Share of the tightened timeouts that would have passed with the whole timeout"""
+        if not self.stats["shadow_checks"]:
+            return None
+        return self.stats["false_negatives"] / self.stats["shadow_checks"]
+
+    def counts(self) -> Dict[str, Any]:
+        return {"stats": dict(self.stats), "latencies": self.latencies}
+
+    def merge(self, counts: Dict[str, Any]) -> None:
+        """Adds what an AdaptiveTimeout of another process learned"""
+        self.stats.update(counts["stats"])
+        for latency in counts["latencies"]:
+            insort(self.latencies, latency)
+
+    def report(self, check_timeout: float) -> Dict[str, Any]:
+        rate = self.false_negative_rate
+        report = {
+            "deadline": self.learned_deadline(check_timeout),
+            "percentile": self.percentile,
+            "margin": self.margin,
+            **{key: self.stats[key] for key in ("checks", "tightened_timeouts", "saved_seconds", "shadow_checks")},
+            "false_negatives": self.stats["false_negatives"],
+            "false_negative_rate": rate,
+            "estimated_missed": round(rate * self.stats["tightened_timeouts"]) if rate is not None else None,
+        }
+        rate_text = f"{rate:.1%}" if rate is not None else "unknown"
+        logger.info(
+            f"Adaptive timeout ended at {report['deadline']:.2f} sec, {report['tightened_timeouts']} checks timed out "
+            f"before {check_timeout} sec and saved {report['saved_seconds']:.0f} check-seconds, "
+            f"{report['false_negatives']} of {report['shadow_checks']} re-checked passed "
+            f"(false negative rate {rate_text}, ~{report['estimated_missed'] or 0} proxies missed)"
+        )
+        return report
+
+
+class HostTimeouts:
+    """Fetch timeouts per host from the durations of its recent successful fetches:
+    `factor` times the slowest of the last `window`, at least `floor`.
+    With a path the durations are kept between runs"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        window: int = 20,
+        factor: float = 3.0,
+        floor: float = 2.0,
+        min_samples: int = 3,
+    ) -> None:
+        self.path = path
+        self.window = window
+        self.factor = factor
+        self.floor = floor
+        self.min_samples = min_samples
+        self.durations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+        self.misses: Counter = Counter()
+        if path:
+            try:
+                with open(path) as f:
+                    for host, durations in json.load(f).items():
+                        self.durations[host].extend(durations)
+            except FileNotFoundError:
+                pass
+            except ValueError:
+                logger.warning(f"Fetch history {path} is broken, starting a new one")
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return (urlparse(url).hostname or "").lower()
+
+    def timeout_for(self, url: str) -> Optional[float]:
+        durations = self.durations.get(self._host(url))
+        if durations is None or len(durations) < self.min_samples:
+            return None
+        return max(self.floor, max(durations) * self.factor)
+
+    def observe(self, url: str, seconds: float) -> None:
+        self.durations[self._host(url)].append(round(seconds, 3))
+
+    def missed(self, url: str, timeout: float) -> None:
+        """A fetch ran out of the learned `timeout`: it took at least that long, so the next fetch of the host
+        waits `factor` times longer, up to the whole timeout"""
+        host = self._host(url)
+        self.misses[host] += 1
+        self.durations[host].append(round(timeout, 3))
+
+    def save(self) -> None:
+        if self.path:
+            with open(self.path, "w") as f:
+                json.dump({host: list(durations) for host, durations in self.durations.items()}, f)
+
+    def report(self) -> None:
+        for host, misses in self.misses.items():
+            logger.debug(f"{host} was slower than its learned timeout {misses} times")
+        learned = sum(len(durations) >= self.min_samples for durations in self.durations.values())
+        logger.info(
+            f"Learned fetch timeouts for {learned} hosts, "
+            f"{sum(self.misses.values())} fetches ran out of their learned timeout"
+        )
@@ -0,0 +1,87 @@
+import hashlib
+import json
+import logging
+import os
+from email.utils import parsedate_to_datetime
+from time import time
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry(NamedTuple):
+    url: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    digest: str  # sha1 of the body
+    parser: str  # the function that parsed `proxies` out of the body
+    proxies: List[str]
+    fresh_until: Optional[float] = None  # no request is needed before, by Cache-Control or Expires
+
+
+class ResponseCache:
+    """Bodies of static source files on disk, with their validators and the proxies parsed out of them.
+    Every url has <key>.json with the entry and <key>.body with the body"""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str, suffix: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(url.encode()).hexdigest()[:20] + suffix)
+
+    def load(self, url: str) -> Optional[CacheEntry]:
+        try:
+            with open(self._path(url, ".json")) as f:
+                entry = CacheEntry(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        return entry if entry.url == url else None
+
+    def body(self, url: str) -> Optional[bytes]:
+        try:
+            with open(self._path(url, ".body"), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def store(self, entry: CacheEntry, body: Optional[bytes] = None) -> None:
+        if body is not None:
+            self._write(self._path(entry.url, ".body"), body)
+        self._write(self._path(entry.url, ".json"), json.dumps(entry._asdict()).encode())
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        # A run killed in the middle leaves the old file, not half of the new one
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def is_fresh(entry: CacheEntry, parser: str) -> bool:
+        return entry.parser == parser and entry.fresh_until is not None and time() < entry.fresh_until
+
+    @staticmethod
+    def conditional_headers(entry: Optional[CacheEntry]) -> Dict[str, Any]:
+        headers = {}
+        if entry is not None and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+
+def fresh_until(headers: Mapping[str, str], now: float) -> Optional[float]:
+    """When a response stops being fresh by its Cache-Control max-age (minus its Age) or Expires,
+    None if it has to be revalidated every time"""
+    directives = [directive.strip() for directive in headers.get("cache-control", "").lower().split(",")]
+    if "no-cache" in directives or "no-store" in directives:
+        return None
+    try:
+        for directive in directives:
+            if directive.startswith("max-age="):
+                return now + int(directive[8:]) - int(headers.get("age", 0))
+        expires = headers.get("expires")
+        return parsedate_to_datetime(expires).timestamp() if expires else None
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import logging
+from collections import deque
+from dataclasses import asdict
+from itertools import count
+from typing import Any, Deque, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from .judges import JudgePool, Probe
+from .proxy_checker import CheckResult, default_concurrency, iter_checking_async, probe_proxy, timeout
+
+logger = logging.getLogger(__name__)
+coordinator_port = 8765
+lease_size = 256
+lease_timeout = 120.0
+# A report of a whole lease is one JSON line
+_line_limit = 2**24
+
+
+class Lease(NamedTuple):
+    proxies: List[str]
+    expires: float
+    owner: int  # the worker connection that holds it
+
+
+class Coordinator:
+    """Hands proxies to remote workers in leases and collects their results.
+    A lease that isn't reported in time, or whose worker disconnects, goes back to the queue"""
+
+    def __init__(self, proxies: Iterable[str], size: int = lease_size, expire_after: float = lease_timeout) -> None:
+        self.queue: Deque[str] = deque(dict.fromkeys(proxy.strip() for proxy in proxies if proxy.strip()))
+        self.size = size
+        self.expire_after = expire_after
+        self.leases: Dict[int, Lease] = {}
+        self.results: List[CheckResult] = []
+        self.requeued = 0
+        self._lease_ids = count(1)
+        self._connection_ids = count(1)
+        self._finished: Optional[asyncio.Event] = None
+        self._connections: Set[asyncio.StreamWriter] = set()
+
+    @property
+    def finished(self) -> bool:
+        return not self.queue and not self.leases
+
+    def lease(self, size: int, owner: int, now: float) -> Dict[str, Any]:
+        self.expire(now)
+        if self.queue:
+            proxies = [self.queue.popleft() for _ in range(min(size, self.size, len(self.queue)))]
+            lease_id = next(self._lease_ids)
+            self.leases[lease_id] = Lease(proxies, now + self.expire_after, owner)
+            return {"lease": lease_id, "proxies": proxies}
+        if self.leases:
+            # Nothing to hand out now, but a lease may still come back
+            return {"wait": 1.0}
+        return {"done": True}
+
+    def report(self, lease_id: int, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        lease = self.leases.pop(lease_id, None)
+        if lease is None:
+            return {"ok": False, "error": "the lease expired, its proxies were given to another worker"}
+        self.results.extend(CheckResult(**result) for result in results)
+        reported = {result["proxy"] for result in results}
+        missing = [proxy for proxy in lease.proxies if proxy not in reported]
+        if missing:
+            self._requeue(missing, f"Lease {lease_id} came back incomplete")
+        logger.info(f"{len(self.results)} proxies checked, {len(self.queue)} in the queue, {len(self.leases)} leased")
+        return {"ok": True}
+
+    def expire(self, now: float) -> None:
+        for lease_id, lease in list(self.leases.items()):
+            if lease.expires <= now:
+                del self.leases[lease_id]
+                self._requeue(lease.proxies, f"Lease {lease_id} expired")
+
+    def release(self, owner: int) -> None:
+        """Leases of a worker that disconnected go back to the queue"""
+        for lease_id, lease in list(self.leases.items()):
+            if lease.owner == owner:
+                del self.leases[lease_id]
+                self._requeue(lease.proxies, f"The worker of lease {lease_id} disconnected")
+
+    def _requeue(self, proxies: List[str], reason: str) -> None:
+        self.queue.extendleft(reversed(proxies))  # Front of the queue: they are late already
+        self.requeued += len(proxies)
+        logger.warning(f"{reason}, {len(proxies)} proxies go back to the queue")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        owner = next(self._connection_ids)
+        self._connections.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                if request.get("op") == "lease":
+                    answer = self.lease(int(request.get("size", self.size)), owner, loop.time())
+                elif request.get("op") == "report":
+                    answer = self.report(request["lease"], request["results"])
+                else:
+                    answer = {"error": f"unknown op {request.get('op')!r}"}
+                writer.write(json.dumps(answer).encode() + b"\n")
+                await writer.drain()
+                if self.finished and self._finished is not None:
+                    self._finished.set()
+        except (ConnectionError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Worker connection {owner} failed: {e!r}")
+        finally:
+            self._connections.discard(writer)
+            self.release(owner)
+            writer.close()
+
+    async def serve(self, host: str = "0.0.0.0", port: int = coordinator_port) -> List[CheckResult]:
+        """Serves leases until every proxy is checked, returns the results"""
+        self._finished = asyncio.Event()
+        if self.finished:
+            return self.results
+        server = await asyncio.start_server(self._handle, host, port, limit=_line_limit)
+        logger.info(f"Coordinator is listening on {host}:{port}, {len(self.queue)} proxies to check")
+        async with server:
+            await self._finished.wait()
+            # Workers ask for the next lease, get "done" and disconnect
+            for _ in range(50):
+                if not self._connections:
+                    break
+                await asyncio.sleep(0.1)
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.sleep(0)
+        logger.info(f"Workers checked {len(self.results)} proxies, {self.requeued} were handed out again")
+        return self.results
+
+
+def parse_address(value: str, default_port: int = coordinator_port) -> Tuple[str, int]:
+    """Parses HOST:PORT, HOST or :PORT"""
+    host, _, port = value.rpartition(":") if ":" in value else (value, "", "")
+    return host or "127.0.0.1", int(port) if port else default_port
+
+
+async def _ask(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, request: Dict[str, Any]) -> Dict[str, Any]:
+    writer.write(json.dumps(request).encode() + b"\n")
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("the coordinator closed the connection")
+    return json.loads(line)
+
+
+async def _connect(host: str, port: int, attempts: int = 10) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    attempt = 1
+    while True:
+        try:
+            return await asyncio.open_connection(host, port, limit=_line_limit)
+        except OSError as e:
+            if attempt >= attempts:
+                raise
+            logger.warning(f"Coordinator {host}:{port} is not reachable ({e!r}), retrying")
+            await asyncio.sleep(min(attempt, 5))
+            attempt += 1
+
+
+async def run_worker(
+    host: str,
+    port: int = coordinator_port,
+    workers: Optional[int] = None,
+    check_timeout: float = timeout,
+    probe: Probe = probe_proxy,
+    judges: Optional[JudgePool] = None,
+    probes: int = 1,
+    slots: int = 2,
+) -> int:
+    """Checks leases of a coordinator until it has nothing left, returns the number of checked proxies.
+    `slots` leases are checked at once, so the tail of one lease doesn't leave the worker idle"""
+    judges = judges or JudgePool()
+    await judges.verify()
+    check = judges.wrap(probe)
+    slot_workers = -(-(workers or default_concurrency) // slots)
+    checked = 0
+
+    async def slot() -> None:
+        nonlocal checked
+        reader, writer = await _connect(host, port)
+        try:
+            while True:
+                answer = await _ask(reader, writer, {"op": "lease", "size": lease_size})
+                if answer.get("done"):
+                    return
+                if "wait" in answer:
+                    await asyncio.sleep(answer["wait"])
+                    continue
+                results = [
+                    asdict(result)
+                    async for result in iter_checking_async(
+                        answer["proxies"], slot_workers, check_timeout, probe=check, probes=probes
+                    )
+                ]
+                reply = await _ask(reader, writer, {"op": "report", "lease": answer["lease"], "results": results})
+                if reply.get("ok"):
+                    checked += len(results)
+                else:
+                    logger.warning(f"Coordinator rejected lease {answer['lease']}: {reply.get('error')}")
+        except ConnectionError as e:
+            # Also what happens when the coordinator finished while this slot waited
+            logger.warning(f"Lost the coordinator: {e!r}")
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(slot() for _ in range(slots)))
+    judges.report()
+    logger.info(f"Worker checked {checked} proxies")
+    return checked
@@ -0,0 +1,77 @@
+import re
+from typing import List, Optional, Set
+
+from .metrics import measure
+from .trace import span
+
+# "ip:port" in text, or ip and port in neighbouring table cells: between them at least one tag or
+# one of the quotes left by `document.write('ip')`, with runs of whitespace (indentation) around them.
+# Every part has a bounded length, so ProxyExtractor knows how long a match can be.
+# Plain text needs the ":", so numbers that only follow an ip there are not taken for ports.
+# Octets and ports are not range checked here, pack_proxy drops invalid ones
+_proxy_re = re.compile(
+    rb"(?<![\d.])(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})"
+    rb"(?::|\s{0,256}(?:(?:<[^<>]{0,128}>|[\"');])\s{0,256}){1,12})"
+    rb"(\d{1,5})(?![\d.])"
+)
+_option_re = re.compile(rb"<option[^>]*>\s*(\d+)\s*</option>")
+# Longer than any match of _proxy_re (at most 15 + 256 + 12 * (130 + 256) + 5 bytes),
+# so a match never crosses the kept tail
+_keep = 8192
+
+
+def extract_proxies(content: bytes) -> Set[str]:
+    """Pulls "ip:port" pairs out of raw response bytes without building a DOM"""
+    with measure("parse_seconds"), span("extract_proxies", "parse", size=len(content)):
+        # Joined and decoded by C loops, building the strings in Python took a third of the time
+        return set(map(bytes.decode, map(b":".join, _proxy_re.findall(content))))
+
+
+def table_slice(content: bytes, marker: bytes = b"<table") -> bytes:
+    """Bytes from `marker` (e.g. a class of the table) to the end of its table"""
+    position = content.find(marker)
+    if position == -1:
+        return b""
+    table_end = content.find(b"</table>", position)
+    return content[position : table_end if table_end != -1 else len(content)]
+
+
+def last_option_number(content: bytes) -> Optional[int]:
+    """The biggest page number of a <select> pager"""
+    numbers = [int(number) for number in _option_re.findall(content)]
+    return max(numbers) if numbers else None
+
+
+class ProxyExtractor:
+    """Incremental extract_proxies for bodies that come in chunks"""
+
+    def __init__(self) -> None:
+        self._tail = b" "  # The first byte is only a context for the lookbehind
+        self._chunks: List[bytes] = []
+        self._size = 0
+
+    def _scan(self, final: bool) -> List[str]:
+        buffer = b"".join([self._tail, *self._chunks])
+        limit = len(buffer) if final else len(buffer) - _keep
+        matches = list(_proxy_re.finditer(buffer, 1))
+        taken = len(matches)
+        # Matches in the kept tail are found again with the next chunks, there are few of them
+        while taken and matches[taken - 1].start() >= limit:
+            taken -= 1
+        matches = matches[:taken]
+        cut = max(limit, matches[-1].end()) if matches else limit
+        self._tail, self._chunks, self._size = buffer[cut - 1 :], [], 0
+        return list(map(bytes.decode, map(b":".join, map(re.Match.groups, matches))))
+
+    def feed(self, chunk: bytes) -> List[str]:
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        # Scanning again at most an eighth of what was fed
+        if self._size <= 8 * _keep:
+            return []
+        return self._scan(final=False)
+
+    def close(self) -> List[str]:
+        proxies = self._scan(final=True)
+        self._tail = b" "
+        return proxies
@@ -0,0 +1,146 @@
+import hashlib
+import logging
+from time import perf_counter, time
+from typing import Any, Callable, Dict, Optional, Set
+
+import httpx
+from user_agent import generate_user_agent
+
+from .adaptive import HostTimeouts
+from .cache import CacheEntry, ResponseCache, fresh_until
+from .metrics import record_cache_hit, record_failed_fetch, record_fetch
+from .scheduler import HostScheduler
+from .trace import span
+
+logger = logging.getLogger(__name__)
+standard_headers = {"User-Agent": generate_user_agent()}
+timeout = 6
+
+
+class Fetcher:
+    """One pooled async HTTP client shared by every proxy source"""
+
+    offline = False  # True when responses don't come from the network (tools/replay.py)
+    reuse_fresh = True  # False when every source has to be asked, to record its response (tools/replay.py)
+
+    def __init__(
+        self,
+        fetch_timeout: float = timeout,
+        max_connections: int = 100,
+        scheduler: Optional[HostScheduler] = None,
+        cache: Optional[ResponseCache] = None,
+        host_timeouts: Optional[HostTimeouts] = None,
+    ) -> None:
+        self.scheduler = scheduler or HostScheduler()
+        self.cache = cache
+        self.fetch_timeout = fetch_timeout
+        self.host_timeouts = host_timeouts
+        self.client = httpx.AsyncClient(
+            headers=standard_headers,
+            timeout=fetch_timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            trust_env=False,
+        )
+
+    async def __aenter__(self) -> "Fetcher":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+        full_timeout = timeout if timeout is not None else self.fetch_timeout
+        learned = self.host_timeouts.timeout_for(url) if self.host_timeouts is not None else None
+        if learned is None or learned >= full_timeout:
+            return await self._request(method, url, full_timeout, kwargs)
+        try:
+            return await self._request(method, url, learned, kwargs)
+        except httpx.TimeoutException:
+            # A dead host costs the learned timeout only, a slow one gets longer ones from now on
+            self.host_timeouts.missed(url, learned)  # type: ignore
+            raise
+
+    async def _request(self, method: str, url: str, timeout: float, kwargs: Dict[str, Any]) -> httpx.Response:
+        kwargs = {**kwargs, "timeout": timeout}
+        with span("fetch", "fetch", url=url, timeout=timeout):
+            async with self.scheduler.slot(url):
+                start = perf_counter()
+                try:
+                    # The body is read as it came over the wire, so decoding it is measured on its own
+                    async with self.client.stream(method, url, **kwargs) as streamed:
+                        raw = b"".join([chunk async for chunk in streamed.aiter_raw()])
+                except Exception:
+                    record_failed_fetch(perf_counter() - start)
+                    raise
+            fetched = perf_counter()
+            with span("decode", "decompress", size=len(raw)):
+                response = httpx.Response(
+                    streamed.status_code,
+                    headers=streamed.headers,
+                    content=raw,  # Decoded here according to Content-Encoding
+                    request=streamed.request,
+                    extensions=streamed.extensions,
+                    history=streamed.history,
+                )
+        record_fetch(len(raw), fetched - start, perf_counter() - fetched)
+        if self.host_timeouts is not None:
+            self.host_timeouts.observe(url, fetched - start)
+        return response
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def get_static(self, url: str, parse: Callable[[bytes], Set[str]], **kwargs: Any) -> Set[str]:
+        """Proxies of a file that rarely changes. With a cache, a file that is still fresh by its last response
+        is not asked for at all, otherwise the request is conditional:
+        on 304, or when the body didn't change, the proxies parsed last time are reused"""
+        if self.cache is None:
+            return parse((await self.get(url, **kwargs)).content)
+        entry = self.cache.load(url)
+        if entry is not None and self.reuse_fresh and self.cache.is_fresh(entry, parse.__qualname__):
+            record_cache_hit()
+            return set(entry.proxies)
+        kwargs["headers"] = {**kwargs.get("headers", {}), **self.cache.conditional_headers(entry)}
+        r = await self.get(url, **kwargs)
+        body_lost = False
+        if entry is not None and r.status_code == 304:
+            entry = entry._replace(fresh_until=fresh_until(r.headers, time()))
+            if entry.parser == parse.__qualname__:
+                record_cache_hit()
+                self.cache.store(entry)
+                return set(entry.proxies)
+            body = self.cache.body(url)
+            if body is not None:
+                proxies = parse(body)
+                self.cache.store(entry._replace(parser=parse.__qualname__, proxies=sorted(proxies)))
+                return proxies
+            # The body is lost, ask again without validators
+            body_lost = True
+            kwargs["headers"] = {k: v for k, v in kwargs["headers"].items() if not k.startswith("If-")}
+            r = await self.get(url, **kwargs)
+        r.raise_for_status()
+        digest = hashlib.sha1(r.content).hexdigest()
+        if entry is not None and entry.digest == digest and entry.parser == parse.__qualname__:
+            record_cache_hit()
+            proxies = set(entry.proxies)
+        else:
+            proxies = parse(r.content)
+        self.cache.store(
+            CacheEntry(
+                url,
+                r.headers.get("etag"),
+                r.headers.get("last-modified"),
+                digest,
+                parse.__qualname__,
+                sorted(proxies),
+                fresh_until(r.headers, time()),
+            ),
+            r.content if entry is None or entry.digest != digest or body_lost else None,
+        )
+        return proxies
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import random
+from bisect import bisect_right
+from collections import Counter
+from itertools import accumulate
+from time import perf_counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from .pool import ProxyPool
+from .proxies_manipulation import split_proxy
+
+logger = logging.getLogger(__name__)
+forward_port = 8089
+# Headers that only concern one connection, they are not passed upstream
+_hop_by_hop = (b"connection:", b"proxy-connection:", b"keep-alive:", b"proxy-authorization:")
+# Members are spoken to in HTTP, SOCKS only proxies of the pool are left out
+_http_protocols = {"http", "https"}
+
+
+class _Member:
+    __slots__ = ("health", "fails")
+
+    def __init__(self) -> None:
+        self.health = 1.0  # moving average of the success of the forwarded requests
+        self.fails = 0  # failures in a row
+
+
+class UpstreamError(ConnectionError):
+    """The member failed before anything of its answer went to the client, another member can take the request"""
+
+
+def _member_failed(status_line: bytes, tunnel: bool) -> bool:
+    """A tunnel the member didn't open, an authentication it asks for, an error of its own (5xx)
+    or an answer that isn't HTTP"""
+    version, _, rest = status_line.partition(b" ")
+    status = rest[:3] if version.startswith(b"HTTP/") else b""
+    if tunnel:
+        return status != b"200"
+    return not status or status == b"407" or status.startswith(b"5")
+
+
+class ForwardProxy:
+    """An HTTP and CONNECT proxy that sends every request through a member of the pool.
+    Members are picked at random with the weight health / latency. A member that fails before its answer
+    started, or answers with 407 or 5xx, is replaced by another one, up to `retries` times; after `eject_after`
+    failures in a row it is ejected: out of the pool's answers and due for a check right away"""
+
+    def __init__(
+        self,
+        pool: ProxyPool,
+        retries: int = 2,
+        eject_after: int = 3,
+        timeout: float = 5.0,
+        reweigh_every: float = 1.0,
+    ) -> None:
+        self.pool = pool
+        self.retries = retries
+        self.eject_after = eject_after
+        self.timeout = timeout  # for the upstream connection and the start of its answer
+        self.reweigh_every = reweigh_every
+        self.members: Dict[str, _Member] = {}
+        self.stats: Counter = Counter()
+        self._proxies: List[str] = []
+        self._cumulative: List[float] = []
+        self._weighed = float("-inf")
+
+    def _weigh(self) -> None:
+        """Cumulative weights of the pool members that speak http, redone at most every `reweigh_every` seconds"""
+        self._weighed = perf_counter()
+        members = [
+            (latency, proxy)
+            for latency, proxy in self.pool.indexes[""]
+            if not _http_protocols.isdisjoint(self.pool.entries[proxy].protocols)
+        ]
+        self._proxies = [proxy for _, proxy in members]
+        self._cumulative = list(
+            accumulate(
+                self.members[proxy].health / (latency + 0.05) if proxy in self.members else 1 / (latency + 0.05)
+                for latency, proxy in members
+            )
+        )
+
+    def pick(self, exclude: Set[str]) -> Optional[str]:
+        if perf_counter() - self._weighed > self.reweigh_every:
+            self._weigh()
+        if not self._cumulative or self._cumulative[-1] <= 0:
+            return None
+        for _ in range(4):
+            proxy = self._proxies[bisect_right(self._cumulative, random.random() * self._cumulative[-1])]
+            if proxy not in exclude and self.pool.entries.get(proxy) is not None:
+                return proxy
+        # Unlucky draws, or most of the weight is excluded: the fastest member left
+        return next((proxy for proxy in self._proxies if proxy not in exclude and proxy in self.pool.entries), None)
+
+    def succeeded(self, proxy: str) -> None:
+        member = self.members.setdefault(proxy, _Member())
+        member.health = 0.8 * member.health + 0.2
+        member.fails = 0
+
+    def failed(self, proxy: str, error: Exception) -> None:
+        member = self.members.setdefault(proxy, _Member())
+        member.health *= 0.8
+        member.fails += 1
+        self.stats["upstream_failures"] += 1
+        logger.debug(f"{proxy} failed: {error!r}")
+        entry = self.pool.entries.get(proxy)
+        if member.fails >= self.eject_after and entry is not None and entry.alive:
+            del self.members[proxy]
+            self.pool.suspect(proxy)
+            self._weighed = float("-inf")
+            self.stats["ejected"] += 1
+            logger.info(f"{proxy} failed {self.eject_after} times in a row, ejected until its next check")
+
+    async def _open(self, proxy: str, head: bytes) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, bytes]:
+        """Sends the request head to the member, returns the connection and the first bytes of its answer"""
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*split_proxy(proxy)), self.timeout)
+        try:
+            writer.write(head)
+            await writer.drain()
+            first = await asyncio.wait_for(reader.read(65536), self.timeout)
+        except BaseException:
+            writer.close()
+            raise
+        if not first:
+            writer.close()
+            raise UpstreamError("closed the connection without an answer")
+        return reader, writer, first
+
+    async def _through_member(
+        self, head: bytes, tunnel: bool
+    ) -> Tuple[str, asyncio.StreamReader, asyncio.StreamWriter, bytes]:
+        tried: Set[str] = set()
+        while len(tried) <= self.retries:
+            proxy = self.pick(tried)
+            if proxy is None:
+                break
+            tried.add(proxy)
+            if len(tried) > 1:
+                self.stats["retries"] += 1
+            try:
+                reader, writer, first = await self._open(proxy, head)
+                status_line = first.partition(b"\r\n")[0]
+                if _member_failed(status_line, tunnel):
+                    writer.close()
+                    raise UpstreamError(f"answered {status_line!r}")
+            except (OSError, asyncio.TimeoutError) as e:
+                self.failed(proxy, e)
+                continue
+            return proxy, reader, writer, first
+        raise UpstreamError(f"no member could take the request, {len(tried)} tried")
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        upstream: Optional[asyncio.StreamWriter] = None
+        self.stats["connections"] += 1
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, _, header_block = head.partition(b"\r\n")
+            method, target, _ = request_line.split(b" ", 2)
+            tunnel = method == b"CONNECT"
+            lines = [line for line in header_block.split(b"\r\n") if line]
+            if tunnel:
+                upstream_head = b"CONNECT %s HTTP/1.1\r\nHost: %s\r\n\r\n" % (target, target)
+            else:
+                length = next((int(line[15:]) for line in lines if line.lower().startswith(b"content-length:")), 0)
+                body = await reader.readexactly(length) if length else b""
+                kept = [line for line in lines if not line.lower().startswith(_hop_by_hop)]
+                # One request per connection keeps the answers framed by the end of the connection
+                upstream_head = b"%s\r\n%s\r\nConnection: close\r\n\r\n%s" % (request_line, b"\r\n".join(kept), body)
+            start = perf_counter()
+            try:
+                proxy, upstream_reader, upstream, first = await self._through_member(upstream_head, tunnel)
+            except UpstreamError as e:
+                self.stats["bad_gateway"] += 1
+                message = f"{e}\n".encode()
+                writer.write(
+                    b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s"
+                    % (len(message), message)
+                )
+                await writer.drain()
+                return
+            self.stats["requests"] += 1
+            self.stats["upstream_seconds"] += perf_counter() - start
+            # For a tunnel, the member's "200 Connection established" is the client's too
+            writer.write(first)
+            if tunnel:
+                self.succeeded(proxy)
+                await asyncio.gather(_pipe(reader, upstream), _pipe(upstream_reader, writer))
+                return
+            error = await _pipe(upstream_reader, writer)
+            if error is None:
+                self.succeeded(proxy)
+            else:
+                # Too late for another member, but it counts towards the ejection
+                self.failed(proxy, error)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            if upstream is not None:
+                upstream.close()
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = forward_port) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle, host, port, backlog=4096)
+
+    def report(self) -> None:
+        logger.info(
+            f"Forward proxy: {self.stats['requests']} requests, {self.stats['retries']} retries, "
+            f"{self.stats['bad_gateway']} without a working member, {self.stats['ejected']} members ejected"
+        )
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[OSError]:
+    """Copies `reader` to `writer` until its end, returns the error that broke the reading off"""
+    try:
+        while True:
+            try:
+                data = await reader.read(65536)
+            except OSError as e:
+                return e
+            if not data:
+                return None
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        return None  # The other side went away
+    finally:
+        if writer.can_write_eof():
+            try:
+                writer.write_eof()
+            except OSError:
+                pass
@@ -0,0 +1,160 @@
+import csv
+import gzip
+import logging
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from itertools import chain
+from typing import IO, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the array module does the same slower
+    np = None
+
+logger = logging.getLogger(__name__)
+# The file is the magic, the number of ranges and the columns of the ranges sorted by their first ip:
+# first ips, last ips and ASNs as little endian uint32, then countries as 2 ASCII bytes ("\0\0" is unknown)
+_magic = b"PMGEO1\0\0"
+_header = struct.Struct("<8sI4x")
+Location = Tuple[Optional[str], Optional[int]]  # country code and ASN
+
+
+def _ip(text: str) -> Optional[int]:
+    """An IPv4 address as a number, dotted or already a number. None for IPv6 and headers"""
+    text = text.strip().strip('"')
+    if text.isdigit():
+        return int(text)
+    octets = text.split(".")
+    if len(octets) != 4 or not all(octet.isdigit() for octet in octets):
+        return None
+    value = 0
+    for octet in octets:
+        value = value << 8 | int(octet)
+    return value
+
+
+def read_ranges(f: IO[str]) -> Iterator[Tuple[int, int, str, int]]:
+    """(first ip, last ip, country, ASN) of the ip2asn-v4.tsv of iptoasn.com (first, last, ASN, country, name)
+    or of a CSV of first, last, country[, ASN] like the lite databases of db-ip.com and IP2Location"""
+    lines = iter(f)
+    first_line = next(lines, "")
+    for row in csv.reader(chain([first_line], lines), delimiter="\t" if "\t" in first_line else ","):
+        if len(row) < 3:
+            continue
+        first, last = _ip(row[0]), _ip(row[1])
+        if first is None or last is None:
+            continue
+        fields = [field.strip().strip('"') for field in row[2:4]]
+        if fields[0].isdigit():  # iptoasn
+            asn, country = int(fields[0]), fields[1] if len(fields) > 1 else ""
+        else:
+            country, asn = fields[0], int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else 0
+        country = country.upper() if len(country) == 2 and country.isalpha() else ""
+        if country or asn:  # Not "Not routed"
+            yield first, last, country, asn
+
+
+def build_geo_db(sources: Iterable[str], path: str) -> int:
+    """Converts range files (gzipped or not) into the file GeoDB maps, returns the number of ranges.
+    Overlapping ranges are cut so that the earlier source wins"""
+    ranges: List[Tuple[int, int, str, int]] = []
+    for source in sources:
+        opener = gzip.open if source.endswith(".gz") else open
+        with opener(source, "rt", newline="", encoding="utf-8", errors="replace") as f:  # type: ignore
+            ranges.extend(read_ranges(f))
+    ranges.sort(key=lambda item: item[0])  # Stable: the earlier source first for the same first ip
+    starts, ends, asns, countries = array("I"), array("I"), array("I"), bytearray()
+    for first, last, country, asn in ranges:
+        if ends and first <= ends[-1]:
+            if last <= ends[-1]:
+                continue
+            first = ends[-1] + 1
+        starts.append(first)
+        ends.append(last)
+        asns.append(asn)
+        countries += country.encode() if country else b"\0\0"
+    if sys.byteorder == "big":
+        for column in (starts, ends, asns):
+            column.byteswap()
+    with open(path, "wb") as f:
+        f.write(_header.pack(_magic, len(starts)))
+        for column in (starts, ends, asns):
+            f.write(column.tobytes())
+        f.write(countries)
+    logger.info(f"{len(starts)} ip ranges were written to {path}")
+    return len(starts)
+
+
+class GeoDB:
+    """Country and ASN of IPv4 addresses from a range file made by build_geo_db, fully offline.
+    The file is memory-mapped, so opening it reads nothing and the pages a lookup touches are shared
+    between processes; a batch of addresses is sorted once and found with binary searches over the ranges"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size = _header.unpack_from(self._map)
+        if magic != _magic:
+            raise ValueError(f"{path} is not a geo database, make one with the geo-db command")
+        columns = [_header.size + i * 4 * self.size for i in range(4)]
+        if np is not None:
+            self._starts, self._ends, self._asns = (
+                np.frombuffer(self._map, dtype="<u4", count=self.size, offset=offset) for offset in columns[:3]
+            )
+            self._countries = np.frombuffer(self._map, dtype="S2", count=self.size, offset=columns[3])
+        else:
+            view = memoryview(self._map)
+            self._starts, self._ends, self._asns = (
+                self._column(view[offset : offset + 4 * self.size]) for offset in columns[:3]
+            )
+            self._countries = view[columns[3] : columns[3] + 2 * self.size]
+
+    @staticmethod
+    def _column(view: memoryview):  # type: ignore
+        if sys.byteorder == "little":
+            return view.cast("I")
+        column = array("I", view.tobytes())  # A copy on big endian machines
+        column.byteswap()
+        return column
+
+    def __len__(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        # The arrays and views over the map keep it open
+        self._starts = self._ends = self._asns = self._countries = None
+        self._map.close()
+
+    def lookup(self, values: Iterable[int]) -> List[Location]:
+        """Locations of packed proxies ((ip << 16) | port, see tools/packed.py) in their order,
+        (None, None) for addresses out of every range"""
+        if not self.size:
+            return [(None, None)] * len(list(values))
+        if np is not None:
+            ips = (np.fromiter(values, dtype=np.uint64) >> 16).astype(np.uint32)
+            found = np.searchsorted(self._starts, ips, side="right") - 1
+            inside = (found >= 0) & (ips <= self._ends[np.maximum(found, 0)])
+            countries = self._countries[found].tolist()
+            asns = self._asns[found].tolist()
+            return [
+                (countries[i].decode() or None, asns[i] or None) if hit else (None, None)
+                for i, hit in enumerate(inside.tolist())
+            ]
+        ips = [value >> 16 for value in values]
+        locations: List[Location] = [(None, None)] * len(ips)
+        low = 0
+        # In ip order every search starts where the one before stopped, ProxyArray is sorted already
+        for i in sorted(range(len(ips)), key=ips.__getitem__):
+            ip = ips[i]
+            found = bisect_right(self._starts, ip, low) - 1
+            if found < 0:
+                continue
+            low = found
+            if ip <= self._ends[found]:
+                country = bytes(self._countries[2 * found : 2 * found + 2])
+                locations[i] = (country.decode() if country != b"\0\0" else None, self._asns[found] or None)
+        return locations
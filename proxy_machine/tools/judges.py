@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import httpx
+
+from .proxy_checker import CheckResult, JudgeError, headers, seen_ip, shared_ssl_context, timeout, url
+
+logger = logging.getLogger(__name__)
+judge_port = 8899
+# probe(proxy, check_timeout, judge_url, client_ip), see proxy_checker.probe_proxy and raw_probe.raw_probe
+Probe = Callable[[str, float, str, Optional[str]], Awaitable[CheckResult]]
+# Failures that a judge that went down causes too, unlike a refused connection to the proxy or a wrong ip
+judge_failures = ("timeout", "reset", "error")
+
+
+class Judge:
+    """A judge url and how it behaved during the run"""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.in_flight = 0
+        self.checks = 0
+        self.alive = 0
+        self.errors = 0
+        self.error_streak = 0
+        self.rests_until = 0.0
+        self.echoes_headers: Optional[bool] = None  # whether it shows the headers it got, see verify()
+        self.suspects = 0  # checks that failed in a way judge_failures since its last health check
+        self.checked_at = float("-inf")  # loop time of its last direct health check
+        self.healthy = True
+        self.health: "Optional[asyncio.Future[bool]]" = None  # the health check in flight
+
+
+class JudgePool:
+    """Spreads checks over several judges. A judge that refuses to answer (rate limiting) or doesn't
+    answer a direct request after failed checks rests for a while, and its checks go to the other judges"""
+
+    def __init__(
+        self,
+        urls: Sequence[str] = (url,),
+        cooldown: float = 30,
+        max_cooldown: float = 600,
+        health_interval: float = 10,
+        suspect_after: int = 5,
+    ) -> None:
+        self.judges = [Judge(judge_url) for judge_url in dict.fromkeys(urls)]
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.health_interval = health_interval  # a health verdict is trusted so long ...
+        self.suspect_after = suspect_after  # ... unless so many checks failed since
+        self.client_ip: Optional[str] = None  # our own ip as the judges see it
+        self.verified = False
+        self._turn = 0
+
+    def pick(self, exclude: Iterable[Judge] = ()) -> Optional[Judge]:
+        """The least busy judge that is not resting"""
+        judges = [judge for judge in self.judges if judge not in exclude]
+        if not judges:
+            return None
+        now = asyncio.get_running_loop().time()
+        ready = [judge for judge in judges if judge.rests_until <= now]
+        if not ready:
+            # Everyone rests: the one that comes back first is still better than no check
+            return min(judges, key=lambda judge: judge.rests_until)
+        # Rotating the start spreads ties (e.g. a single check in flight) over all judges
+        self._turn = (self._turn + 1) % len(ready)
+        ready = ready[self._turn :] + ready[: self._turn]
+        return min(ready, key=lambda judge: judge.in_flight)
+
+    def rest(self, judge: Judge, error: Exception) -> None:
+        judge.errors += 1
+        judge.error_streak += 1
+        pause = min(self.cooldown * 2 ** (judge.error_streak - 1), self.max_cooldown)
+        judge.rests_until = asyncio.get_running_loop().time() + pause
+        logger.warning(f"Judge {judge.url} failed ({error}), it rests for {pause:.0f} sec")
+
+    def wrap(self, probe: Probe) -> Callable[[str, float], Awaitable[CheckResult]]:
+        """Makes a probe for iter_checking_async that asks the judges of the pool"""
+
+        async def check(proxy: str, check_timeout: float) -> CheckResult:
+            tried: List[Judge] = []
+            while True:
+                judge = self.pick(tried)
+                if judge is None:
+                    raise JudgeError("every judge refused the check")
+                tried.append(judge)
+                judge.in_flight += 1
+                try:
+                    result = await probe(proxy, check_timeout, judge.url, self.client_ip)
+                except JudgeError as e:
+                    self.rest(judge, e)
+                    continue
+                finally:
+                    judge.in_flight -= 1
+                if result.error in judge_failures:
+                    judge.suspects += 1
+                    if not await self.is_healthy(judge):
+                        # Not the fault of the proxy, another judge checks it
+                        if judge.rests_until <= asyncio.get_running_loop().time():  # Once for the checks at once
+                            self.rest(judge, JudgeError("no direct answer"))
+                        continue
+                judge.checks += 1
+                if result.alive:
+                    judge.alive += 1
+                    judge.error_streak = 0
+                return result
+
+        return check
+
+    async def is_healthy(self, judge: Judge) -> bool:
+        """Whether the judge answers a direct request. The verdict is shared by the checks that failed at
+        the same time and reused for `health_interval`, or for a second once `suspect_after` checks failed"""
+        if judge.health is None:
+            age = asyncio.get_running_loop().time() - judge.checked_at
+            if age < self.health_interval and (judge.suspects < self.suspect_after or age < 1):
+                return judge.healthy
+            judge.health = asyncio.ensure_future(self._check_health(judge))
+        return await asyncio.shield(judge.health)
+
+    async def _check_health(self, judge: Judge) -> bool:
+        try:
+            async with httpx.AsyncClient(verify=shared_ssl_context(), timeout=timeout) as client:
+                judge.healthy = await self._ask(client, judge)
+        finally:
+            judge.checked_at = asyncio.get_running_loop().time()
+            judge.suspects = 0
+            judge.health = None
+        return judge.healthy
+
+    async def verify(self) -> None:
+        """Asks every judge directly, without a proxy: judges that don't answer are dropped. Only once"""
+        if self.verified:
+            return
+        self.verified = True
+        async with httpx.AsyncClient(verify=shared_ssl_context(), timeout=timeout) as client:
+            answers = await asyncio.gather(*(self._ask(client, judge) for judge in self.judges))
+        working = [judge for judge, answered in zip(self.judges, answers) if answered]
+        if not working:
+            logger.warning("No judge answered directly, all of them are kept")
+            return
+        self.judges = working
+
+    async def _ask(self, client: httpx.AsyncClient, judge: Judge) -> bool:
+        try:
+            response = await client.get(judge.url, headers=headers)
+            response.raise_for_status()
+            data = response.json()
+            client_ip = seen_ip(data)
+        except Exception as e:
+            logger.warning(f"Judge {judge.url} does not work: {e!r}")
+            return False
+        self.client_ip = self.client_ip or client_ip
+        # Only a judge that echoes the request headers tells how anonymous a proxy is
+        judge.echoes_headers = isinstance(data.get("headers"), dict)
+        return True
+
+    @property
+    def echo_headers(self) -> bool:
+        """False if no verified judge echoes the request headers, the anonymity of proxies stays unknown then"""
+        return any(judge.echoes_headers is not False for judge in self.judges)
+
+    def counts(self) -> Dict[str, Tuple[int, int, int]]:
+        return {judge.url: (judge.checks, judge.alive, judge.errors) for judge in self.judges}
+
+    def merge(self, counts: Dict[str, Tuple[int, int, int]]) -> None:
+        """Adds the counts of a pool in another process"""
+        for judge in self.judges:
+            checks, alive, errors = counts.get(judge.url, (0, 0, 0))
+            judge.checks += checks
+            judge.alive += alive
+            judge.errors += errors
+
+    def report(self) -> None:
+        for judge in self.judges:
+            logger.info(f"Judge {judge.url}: {judge.checks} checks, {judge.alive} alive, {judge.errors} failures")
+
+
+async def _answer(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    client_ip = writer.get_extra_info("peername")[0]
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            request_line, *header_lines = head.decode("latin-1").rstrip("\r\n").split("\r\n")
+            method, target, version = request_line.split(" ", 2)
+            request_headers: Dict[str, str] = {}
+            for line in header_lines:
+                name, _, value = line.partition(":")
+                name, value = name.strip(), value.strip()
+                request_headers[name] = f"{request_headers[name]}, {value}" if name in request_headers else value
+            lowered = {name.lower(): value for name, value in request_headers.items()}
+            length = int(lowered.get("content-length", 0))
+            if length:
+                await reader.readexactly(length)
+            body = json.dumps({"ip": client_ip, "method": method, "url": target, "headers": request_headers}).encode()
+            keep_alive = version == "HTTP/1.1" and lowered.get("connection", "").lower() != "close"
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nCache-Control: no-store\r\n"
+                b"Content-Length: %d\r\nConnection: %s\r\n\r\n%s"
+                % (len(body), b"keep-alive" if keep_alive else b"close", body)
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def start_judge_server(host: str = "127.0.0.1", port: int = judge_port) -> asyncio.AbstractServer:
+    """A judge that echoes the client ip and request headers as JSON"""
+    return await asyncio.start_server(_answer, host, port, backlog=1024)
+
+
+async def serve_judge(host: str = "0.0.0.0", port: int = judge_port) -> None:
+    server = await start_judge_server(host, port)
+    logger.info(f"Judge is listening on http://{host}:{port}/")
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,205 @@
+import json
+import logging
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from time import perf_counter, time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .proxy_checker import CheckResult
+
+logger = logging.getLogger(__name__)
+# Upper bounds of the check latency histogram, seconds
+latency_buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0)
+_prefix = "proxy_machine"
+
+
+@dataclass
+class SourceMetrics:
+    source: str
+    requests: int = 0
+    failed_requests: int = 0
+    fetch_seconds: float = 0.0  # from sending the request to the last byte of the body
+    bytes: int = 0  # body bytes as they came over the wire
+    decompress_seconds: float = 0.0
+    parse_seconds: float = 0.0  # extracting proxies from the bodies
+    raw: int = 0  # proxies the source returned
+    unique: int = 0  # of them, not returned by any source before
+    live: int = 0  # of the unique ones, proxies that passed the check
+    cache_hits: int = 0  # responses that weren't parsed, their proxies came from the cache
+
+
+# Metrics of the source whose task is running, set by the pipeline for every source
+current_source: ContextVar[Optional[SourceMetrics]] = ContextVar("current_source", default=None)
+
+
+@contextmanager
+def measure(name: str) -> Iterator[None]:
+    """Adds the time of the block to the `name` seconds of the current source"""
+    metrics = current_source.get()
+    if metrics is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        setattr(metrics, name, getattr(metrics, name) + perf_counter() - start)
+
+
+def record_fetch(size: int, seconds: float, decompress_seconds: float = 0.0) -> None:
+    metrics = current_source.get()
+    if metrics is not None:
+        metrics.requests += 1
+        metrics.bytes += size
+        metrics.fetch_seconds += seconds
+        metrics.decompress_seconds += decompress_seconds
+
+
+def record_cache_hit() -> None:
+    metrics = current_source.get()
+    if metrics is not None:
+        metrics.cache_hits += 1
+
+
+def record_failed_fetch(seconds: float) -> None:
+    metrics = current_source.get()
+    if metrics is not None:
+        metrics.requests += 1
+        metrics.failed_requests += 1
+        metrics.fetch_seconds += seconds
+
+
+class CheckerMetrics:
+    """Outcomes and latencies of the checks, and how many were in flight over the run"""
+
+    def __init__(self) -> None:
+        self.outcomes: Counter = Counter()
+        self.buckets = [0] * (len(latency_buckets) + 1)  # the last one is +Inf
+        self.latency_sum = 0.0
+        self.in_flight: List[Tuple[float, int]] = []  # (seconds since the start, checks in flight)
+
+    def record(self, result: CheckResult) -> None:
+        self.outcomes["alive" if result.alive else result.error or "error"] += 1
+        if result.alive and result.latency is not None:
+            self.buckets[bisect_left(latency_buckets, result.latency)] += 1
+            self.latency_sum += result.latency
+
+    def sample(self, elapsed: float, in_flight: int) -> None:
+        self.in_flight.append((round(elapsed, 3), in_flight))
+
+    @property
+    def checks(self) -> int:
+        return sum(self.outcomes.values())
+
+    def report(self) -> Dict[str, Any]:
+        cumulative, histogram = 0, {}
+        for bound, count in zip(latency_buckets + (float("inf"),), self.buckets):
+            cumulative += count
+            histogram[str(bound) if bound != float("inf") else "+Inf"] = cumulative
+        return {
+            "checks": self.checks,
+            "outcomes": dict(self.outcomes),
+            "timeouts": self.outcomes["timeout"],
+            "latency_histogram": histogram,
+            "latency_sum": self.latency_sum,
+            "peak_in_flight": max((count for _, count in self.in_flight), default=0),
+            "in_flight": self.in_flight,
+        }
+
+
+class RunMetrics:
+    """Everything measured during one run, as a JSON report or in the Prometheus text format"""
+
+    def __init__(self) -> None:
+        self.started = time()
+        self.finished: Optional[float] = None
+        self.sources: Dict[str, SourceMetrics] = {}
+        self.checker = CheckerMetrics()
+        self.adaptive_timeout: Optional[Dict[str, Any]] = None  # AdaptiveTimeout.report()
+
+    def source(self, name: str) -> SourceMetrics:
+        if name not in self.sources:
+            self.sources[name] = SourceMetrics(name)
+        return self.sources[name]
+
+    def finish(self) -> None:
+        self.finished = time()
+
+    @property
+    def seconds(self) -> float:
+        return (self.finished or time()) - self.started
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "seconds": self.seconds,
+            "sources": [asdict(metrics) for metrics in self.sources.values()],
+            "checker": self.checker.report(),
+            "adaptive_timeout": self.adaptive_timeout,
+        }
+
+    def prometheus(self) -> str:
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, float]]) -> None:
+            if kind == "counter":
+                name += "_total"
+            lines.append(f"# HELP {_prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {_prefix}_{name} {kind}")
+            lines.extend(f"{_prefix}_{name}{labels} {value:g}" for labels, value in samples)
+
+        metric("run_seconds", "gauge", "Duration of the run.", [("", self.seconds)])
+        source_fields = [
+            ("requests", "Requests made by the source."),
+            ("failed_requests", "Requests of the source that failed."),
+            ("fetch_seconds", "Time spent fetching responses of the source."),
+            ("bytes", "Body bytes downloaded by the source."),
+            ("decompress_seconds", "Time spent decompressing responses of the source."),
+            ("parse_seconds", "Time spent extracting proxies from responses of the source."),
+            ("raw", "Proxies returned by the source."),
+            ("unique", "Proxies first returned by the source."),
+            ("live", "Proxies first returned by the source that passed the check."),
+            ("cache_hits", "Responses of the source whose proxies came from the cache."),
+        ]
+        for name, help_text in source_fields:
+            samples = [(f'{{source="{metrics.source}"}}', getattr(metrics, name)) for metrics in self.sources.values()]
+            metric(f"source_{name}", "counter", help_text, samples)
+        checker = self.checker.report()
+        outcomes = [(f'{{outcome="{outcome}"}}', count) for outcome, count in sorted(checker["outcomes"].items())]
+        metric("checks", "counter", "Finished checks by outcome.", outcomes)
+        histogram = [(f'_bucket{{le="{bound}"}}', count) for bound, count in checker["latency_histogram"].items()]
+        histogram += [("_sum", checker["latency_sum"]), ("_count", checker["outcomes"].get("alive", 0))]
+        metric("check_latency_seconds", "histogram", "Latency of the successful checks.", histogram)
+        metric("checks_peak_in_flight", "gauge", "Most checks in flight at once.", [("", checker["peak_in_flight"])])
+        if self.adaptive_timeout is not None:
+            adaptive = self.adaptive_timeout
+            metric("check_deadline_seconds", "gauge", "Learned deadline of the checks.", [("", adaptive["deadline"])])
+            metric(
+                "check_tightened_timeouts",
+                "counter",
+                "Checks that timed out under the learned deadline.",
+                [("", adaptive["tightened_timeouts"])],
+            )
+            metric(
+                "check_shadow_checks", "counter", "Re-checks with the whole timeout.", [("", adaptive["shadow_checks"])]
+            )
+            metric(
+                "check_false_negatives",
+                "counter",
+                "Re-checked proxies that passed with the whole timeout.",
+                [("", adaptive["false_negatives"])],
+            )
+        return "\n".join(lines) + "\n"
+
+    def write(self, json_path: Optional[str] = None, prometheus_path: Optional[str] = None) -> None:
+        if json_path:
+            with open(json_path, "w") as f:
+                json.dump(self.report(), f, indent=2)
+            logger.info(f"Run report was written to {json_path}")
+        if prometheus_path:
+            with open(prometheus_path, "w") as f:
+                f.write(self.prometheus())
+            logger.info(f"Prometheus metrics were written to {prometheus_path}")
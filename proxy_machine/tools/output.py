@@ -0,0 +1,45 @@
+import csv
+import json
+from typing import Any, Dict, Iterable, List
+
+from .protocols import proxy_url
+from .proxy_checker import CheckResult
+
+output_formats = ("txt", "csv", "json")
+fields = (
+    "proxy",
+    "score",
+    "latency",
+    "connect_time",
+    "ttfb",
+    "successes",
+    "probes",
+    "country",
+    "asn",
+    "protocols",
+    "anonymity",
+)
+
+
+def rank_results(results: Iterable[CheckResult]) -> List[CheckResult]:
+    """Best proxies first, proxies without a score (not checked) keep their order at the end"""
+    return sorted(results, key=lambda result: (result.score is None, result.score or 0.0))
+
+
+def result_row(result: CheckResult) -> Dict[str, Any]:
+    row = {field: getattr(result, field) for field in fields}
+    row.update(proxy=proxy_url(result), protocols=",".join(result.protocols))
+    return {field: round(value, 4) if isinstance(value, float) else value for field, value in row.items()}
+
+
+def write_results(path: str, results: List[CheckResult], output_format: str = "txt") -> None:
+    """txt is a proxy per line, csv and json also have the timings and the score"""
+    with open(path, "w", newline="") as f:
+        if output_format == "json":
+            json.dump([result_row(result) for result in results], f, indent=2)
+        elif output_format == "csv":
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            writer.writerows(result_row(result) for result in results)
+        else:
+            f.writelines(f"{proxy_url(result)}\n" for result in results)
@@ -0,0 +1,78 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the array module does the same slower
+    np = None
+
+
+def pack_proxy(ip_port: str) -> Optional[int]:
+    """Packs "1.2.3.4:8080" (scheme is allowed) or returns None if it is not an IPv4 proxy"""
+    ip_port = ip_port.strip()
+    if "://" in ip_port:
+        ip_port = ip_port.split("://", 1)[1]
+    ip, _, port = ip_port.rpartition(":")
+    octets = ip.split(".")
+    if len(octets) != 4 or not port.isdigit() or not 0 < int(port) < 65535:
+        return None
+    value = 0
+    for octet in octets:
+        if not octet.isdigit() or int(octet) > 255:
+            return None
+        value = value << 8 | int(octet)
+    return value << 16 | int(port)
+
+
+def unpack_proxy(value: int) -> str:
+    ip = value >> 16
+    return f"{ip >> 24}.{ip >> 16 & 255}.{ip >> 8 & 255}.{ip & 255}:{value & 0xFFFF}"
+
+
+class ProxyArray:
+    """Sorted array of unique IPv4 proxies packed as (ip << 16) | port.
+    One proxy takes 8 bytes instead of a ~60 bytes string in a set"""
+
+    def __init__(self, values: Iterable[int] = ()) -> None:
+        if np is not None:
+            self._values = np.unique(np.fromiter(values, dtype=np.uint64))
+        else:
+            self._values = array("Q", sorted(set(values)))
+
+    @classmethod
+    def _wrap(cls, values) -> "ProxyArray":  # type: ignore
+        # `values` are already sorted and unique
+        proxy_array = cls.__new__(cls)
+        proxy_array._values = values
+        return proxy_array
+
+    @classmethod
+    def from_strings(cls, proxies: Iterable[str]) -> "ProxyArray":
+        return cls(value for value in map(pack_proxy, proxies) if value is not None)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __iter__(self) -> Iterator[int]:
+        return (int(value) for value in self._values)
+
+    def __contains__(self, value: int) -> bool:
+        if np is not None:
+            i = int(np.searchsorted(self._values, value))
+        else:
+            i = bisect_left(self._values, value)
+        return i < len(self._values) and self._values[i] == value
+
+    def union(self, other: "ProxyArray") -> "ProxyArray":
+        if np is not None:
+            return self._wrap(np.union1d(self._values, other._values))
+        return ProxyArray(set(self._values).union(other._values))
+
+    def difference(self, other: "ProxyArray") -> "ProxyArray":
+        if np is not None:
+            return self._wrap(np.setdiff1d(self._values, other._values, assume_unique=True))
+        return self._wrap(array("Q", [value for value in self._values if value not in other]))
+
+    def to_strings(self, scheme: str = "") -> List[str]:
+        return [f"{scheme}{unpack_proxy(value)}" for value in self]
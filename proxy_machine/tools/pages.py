@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Set
+
+import httpx
+
+from .fetcher import Fetcher
+
+logger = logging.getLogger(__name__)
+# Takes the proxies of every page as soon as the page is parsed, set by the pipeline for every source
+page_sink: ContextVar[Optional[Callable[[Set[str]], None]]] = ContextVar("page_sink", default=None)
+
+
+class Page(NamedTuple):
+    url: str
+    parse: Callable[[httpx.Response], Iterable[str]]
+    options: Dict[str, Any] = {}  # params, cookies, headers ... of the request, over the defaults of the source
+    label: str = ""  # names the page in the log, the url by default
+    response: Optional[httpx.Response] = None  # a page the discovery already loaded is only parsed
+
+
+async def fetch_pages(fetcher: Fetcher, name: str, pages: Iterable[Page], defaults: Dict[str, Any]) -> Set[str]:
+    """Loads all pages at once (the scheduler keeps every host polite) and parses each as soon as it came.
+    A page that fails is logged and skipped, the others still count"""
+    pages = list(pages)
+    sink = page_sink.get()
+    proxies: Set[str] = set()
+    failed = 0
+
+    async def load(page: Page) -> None:
+        nonlocal failed
+        try:
+            r = page.response or await fetcher.get(page.url, **{**defaults, **page.options})
+            r.raise_for_status()
+            found = set(page.parse(r))
+        except Exception as e:
+            failed += 1
+            logger.warning(f"{name}: page {page.label or page.url} was not loaded: {e!r}")
+            return
+        proxies.update(found)
+        if sink is not None:
+            sink(found)
+
+    await asyncio.gather(*(load(page) for page in pages))
+    logger.info(f"From {name} were parsed {len(proxies)} proxies, {len(pages) - failed} of {len(pages)} pages loaded")
+    return proxies
+
+
+def paged(**defaults: Any) -> Callable[[Callable[[Fetcher], Awaitable[Iterable[Page]]]], Any]:
+    """Makes a source out of a coroutine that tells its pages, e.g. after loading the first one to find the
+    number of pages. `defaults` are the request options (headers, timeout ...) of every page"""
+
+    def decorate(discover: Callable[[Fetcher], Awaitable[Iterable[Page]]]) -> Any:
+        @wraps(discover)
+        async def source(fetcher: Fetcher) -> Set[str]:
+            try:
+                pages = await discover(fetcher)
+            except Exception:
+                logger.exception(f"Pages of {discover.__name__} were not found :(")
+                return set()
+            return await fetch_pages(fetcher, discover.__name__, pages, defaults)
+
+        return source
+
+    return decorate
@@ -0,0 +1,236 @@
+import asyncio
+import heapq
+import logging
+from bisect import bisect_right, insort
+from itertools import islice
+from time import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .protocols import preferred_scheme
+from .proxy_checker import CheckResult, hides_enough
+
+logger = logging.getLogger(__name__)
+# Sorts after every proxy of the same latency in an index
+_last = "\uffff"
+
+
+class PoolEntry:
+    """A proxy the pool knows: a candidate until its first check, then a member while it works"""
+
+    __slots__ = (
+        "proxy",
+        "source",
+        "protocol",
+        "protocols",
+        "latency",
+        "country",
+        "anonymity",
+        "alive",
+        "checked",
+        "failures",
+        "due",
+    )
+
+    def __init__(self, proxy: str, source: str, due: float) -> None:
+        self.proxy = proxy
+        self.source = source
+        self.protocol = proxy.split("://")[0] if "://" in proxy else "http"  # the scheme of its url
+        self.protocols: Tuple[str, ...] = (self.protocol,)  # what it speaks, as detected by its last check
+        self.latency: Optional[float] = None
+        self.country: Optional[str] = None
+        self.anonymity: Optional[str] = None
+        self.alive = False  # served by select()
+        self.checked: Optional[float] = None  # time of the last check
+        self.failures = 0  # failed checks in a row
+        self.due = due  # when the next check may start
+
+    @property
+    def url(self) -> str:
+        """The proxy with the scheme of what it speaks"""
+        return f"{self.protocol}://{self.proxy.split('://')[-1]}"
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "proxy": self.url,
+            "protocol": self.protocol,
+            "protocols": list(self.protocols),
+            "latency": self.latency,
+            "country": self.country,
+            "anonymity": self.anonymity,
+            "checked": self.checked,
+            "source": self.source,
+        }
+
+
+class ProxyPool:
+    """Working proxies in memory, indexed by latency for every protocol and country.
+    Every known proxy waits in one heap ordered by the time its next check is due:
+    new proxies are due when they are found, members `revalidate_after` seconds after their last check,
+    so the checks that are the oldest go first. A member that fails `max_failures` checks in a row is evicted,
+    already the first failure takes it out of the answers"""
+
+    def __init__(
+        self,
+        revalidate_after: float = 300,
+        max_failures: int = 2,
+        retry_after: float = 30,
+        forget_after: float = 3600,
+    ) -> None:
+        self.revalidate_after = revalidate_after
+        self.max_failures = max_failures
+        self.retry_after = retry_after  # a member that failed a check gets the next one sooner
+        self.forget_after = forget_after  # evicted proxies aren't checked again for so long
+        self.entries: Dict[str, PoolEntry] = {}
+        self.evicted: Dict[str, float] = {}  # proxy -> when it was evicted
+        # Sorted (latency, proxy) of the members under "", "protocol:<name>" and "country:<code>"
+        self.indexes: Dict[str, List[Tuple[float, str]]] = {"": []}
+        self.stats: Dict[str, int] = {"found": 0, "checks": 0, "evicted": 0}
+        self._heap: List[Tuple[float, str]] = []
+        self._changed: Optional[asyncio.Event] = None  # Made in the loop that waits on it
+
+    def __len__(self) -> int:
+        return len(self.indexes[""])
+
+    def _schedule(self, entry: PoolEntry, due: float) -> None:
+        entry.due = due
+        heapq.heappush(self._heap, (due, entry.proxy))
+        if self._changed is not None:
+            self._changed.set()
+
+    def offer(self, proxies: List[str], source: str, now: Optional[float] = None) -> int:
+        """Adds proxies the pool doesn't know yet, returns how many were new"""
+        now = time() if now is None else now
+        self.evicted = {proxy: evicted for proxy, evicted in self.evicted.items() if now - evicted < self.forget_after}
+        new = 0
+        for proxy in proxies:
+            if proxy in self.entries or proxy in self.evicted:
+                continue
+            entry = self.entries[proxy] = PoolEntry(proxy, source, now)
+            self._schedule(entry, now)
+            new += 1
+        self.stats["found"] += new
+        return new
+
+    def _index_keys(self, entry: PoolEntry) -> List[str]:
+        keys = ["", *(f"protocol:{protocol}" for protocol in entry.protocols)]
+        if entry.country:
+            keys.append(f"country:{entry.country.upper()}")
+        return keys
+
+    def _unindex(self, entry: PoolEntry) -> None:
+        if not entry.alive:
+            return
+        item = (entry.latency, entry.proxy)
+        for key in self._index_keys(entry):
+            index = self.indexes[key]
+            del index[bisect_right(index, item) - 1]  # type: ignore
+        entry.alive = False
+
+    def _index(self, entry: PoolEntry) -> None:
+        for key in self._index_keys(entry):
+            insort(self.indexes.setdefault(key, []), (entry.latency, entry.proxy))
+        entry.alive = True
+
+    def record(self, result: CheckResult, now: Optional[float] = None) -> None:
+        """Takes the result of a check of a due proxy"""
+        now = time() if now is None else now
+        entry = self.entries.get(result.proxy)
+        if entry is None:
+            return
+        if result.error == "judge":
+            # No judge could check it: no verdict, the next check comes as if this one failed
+            self._schedule(entry, now + min(self.revalidate_after, self.retry_after))
+            return
+        self.stats["checks"] += 1
+        self._unindex(entry)
+        entry.checked = now
+        if result.alive:
+            entry.latency = result.latency if result.latency is not None else float("inf")
+            entry.country = result.country or entry.country
+            entry.anonymity = result.anonymity or entry.anonymity
+            if result.protocols:
+                entry.protocols = result.protocols
+                entry.protocol = preferred_scheme(result.protocols)
+            entry.failures = 0
+            self._index(entry)
+            self._schedule(entry, now + self.revalidate_after)
+            return
+        entry.failures += 1
+        if entry.latency is None or entry.failures >= self.max_failures:
+            # Never worked, or stopped working
+            del self.entries[entry.proxy]
+            self.evicted[entry.proxy] = now
+            self.stats["evicted"] += entry.latency is not None
+            return
+        # Maybe a blip: checked again soon, out of the answers until then
+        self._schedule(entry, now + min(self.revalidate_after, self.retry_after))
+
+    def suspect(self, proxy: str, now: Optional[float] = None) -> None:
+        """Takes a member out of the answers until its next check, which is due right away"""
+        entry = self.entries.get(proxy)
+        if entry is None:
+            return
+        self._unindex(entry)
+        if entry.due != float("inf"):  # Unless a check is in flight
+            self._schedule(entry, time() if now is None else now)
+
+    async def due(self) -> AsyncIterator[str]:
+        """Proxies whose check is due, the most overdue first, as long as the pool lives"""
+        self._changed = asyncio.Event()
+        while True:
+            now = time()
+            while self._heap and self._heap[0][0] <= now:
+                due, proxy = heapq.heappop(self._heap)
+                entry = self.entries.get(proxy)
+                if entry is not None and entry.due == due:  # Entries rescheduled since are stale
+                    entry.due = float("inf")  # In flight
+                    yield proxy
+                    now = time()
+            self._changed.clear()
+            wait = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def select(
+        self,
+        count: int = 10,
+        max_latency: Optional[float] = None,
+        protocol: Optional[str] = None,
+        country: Optional[str] = None,
+        anonymity: Optional[str] = None,
+    ) -> List[PoolEntry]:
+        """The fastest `count` members that match, a bisect and a walk over the smallest index"""
+        indexes = [self.indexes.get(f"protocol:{protocol.lower()}", []) if protocol else None]
+        indexes.append(self.indexes.get(f"country:{country.upper()}", []) if country else None)
+        known = [index for index in indexes if index is not None]
+        index = min(known, key=len) if known else self.indexes[""]
+        end = bisect_right(index, (max_latency, _last)) if max_latency is not None else len(index)
+        selected = []
+        for _, proxy in islice(index, end):
+            entry = self.entries[proxy]
+            if protocol and protocol.lower() not in entry.protocols:
+                continue
+            if country and (entry.country or "").upper() != country.upper():
+                continue
+            if anonymity and not hides_enough(entry.anonymity, anonymity):
+                continue
+            selected.append(entry)
+            if len(selected) >= count:
+                break
+        return selected
+
+    def counts(self) -> Dict[str, object]:
+        now = time()
+        checked = [entry.checked for entry in self.entries.values() if entry.alive and entry.checked is not None]
+        return {
+            "alive": len(self),
+            "known": len(self.entries),
+            "unchecked": sum(entry.checked is None for entry in self.entries.values()),
+            "overdue": sum(entry.due <= now for entry in self.entries.values()),
+            "oldest_check_age": now - min(checked) if checked else None,
+            **self.stats,
+            "protocols": {key[9:]: len(index) for key, index in self.indexes.items() if key.startswith("protocol:")},
+            "countries": {key[8:]: len(index) for key, index in self.indexes.items() if key.startswith("country:")},
+        }
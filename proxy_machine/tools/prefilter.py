@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import socket
+from collections import Counter
+from time import perf_counter
+from typing import AsyncIterable, AsyncIterator, Iterable, Optional, Tuple, Union
+
+from .proxies_manipulation import split_proxy
+from .proxy_checker import iter_bounded
+
+logger = logging.getLogger(__name__)
+connect_timeout = 1.5
+# Connect attempts are cheap, so the prefilter runs far more of them at once than the checker
+default_concurrency = 2000
+
+
+class StageStats:
+    """Counts and timings of one checking stage"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.outcomes: Counter = Counter()
+        self.passed = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def total(self) -> int:
+        return sum(self.outcomes.values())
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or perf_counter()) - self.started
+
+    def record(self, outcome: str, passed: bool) -> None:
+        if self.started is None:
+            self.started = perf_counter()
+        self.outcomes[outcome] += 1
+        self.passed += passed
+        self.finished = perf_counter()
+
+    def report(self) -> None:
+        outcomes = ", ".join(f"{outcome}: {count}" for outcome, count in self.outcomes.most_common())
+        logger.info(
+            f"{self.name}: {self.passed} of {self.total} passed, {self.total - self.passed} dropped "
+            f"in {self.elapsed:.2f} sec ({outcomes or 'nothing to do'})"
+        )
+
+
+async def tcp_connect(proxy: str, timeout: float = connect_timeout) -> Tuple[str, str]:
+    """Returns the proxy and "open", "refused", "timeout" or "unreachable" """
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        await asyncio.wait_for(loop.sock_connect(sock, split_proxy(proxy)), timeout)
+        return proxy, "open"
+    except ConnectionRefusedError:
+        return proxy, "refused"
+    except asyncio.TimeoutError:
+        return proxy, "timeout"
+    except (OSError, ValueError):
+        return proxy, "unreachable"
+    finally:
+        sock.close()
+
+
+async def iter_reachable(
+    proxies: Union[Iterable[str], AsyncIterable[str]],
+    workers: Optional[int] = None,
+    timeout: float = connect_timeout,
+    stats: Optional[StageStats] = None,
+) -> AsyncIterator[str]:
+    """Yields only proxies that accept a TCP connection, before the full HTTP check"""
+    stats = stats or StageStats("TCP prefilter")
+    async for proxy, outcome in iter_bounded(
+        lambda proxy: tcp_connect(proxy, timeout), proxies, workers or default_concurrency
+    ):
+        stats.record(outcome, outcome == "open")
+        if outcome == "open":
+            yield proxy
+
+
+def raise_open_files_limit(wanted: int) -> None:
+    """Every connection in flight is a file descriptor, the soft limit is often only 1024"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        new_soft = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (new_soft, hard))
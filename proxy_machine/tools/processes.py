@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import multiprocessing
+from queue import Empty
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+
+from .adaptive import AdaptiveTimeout
+from .judges import JudgePool, Probe
+from .proxy_checker import CheckResult, default_concurrency, iter_checking_async, probe_proxy, timeout, url
+
+logger = logging.getLogger(__name__)
+# Small chunks keep every process busy until the end: a process that runs out
+# of work takes the next chunk from the shared queue
+chunk_size = 64
+# Results go back to the parent in batches, at least this often
+flush_interval = 0.1
+_done = "done"
+
+
+async def _batches(items: Union[Iterable[str], AsyncIterable[str]], size: int) -> AsyncIterator[List[str]]:
+    """Waits for the first item, then takes whatever else is ready, up to `size` items"""
+    if not isinstance(items, AsyncIterable):
+        items = list(items)
+        for i in range(0, len(items), size):
+            yield items[i : i + size]
+        return
+    ready: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+    async def pump() -> None:
+        try:
+            async for item in items:  # type: ignore
+                ready.put_nowait(item)
+        finally:
+            ready.put_nowait(None)
+
+    pumping = asyncio.ensure_future(pump())
+    try:
+        while True:
+            item = await ready.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < size and not ready.empty():
+                item = ready.get_nowait()
+                if item is None:
+                    yield batch
+                    return
+                batch.append(item)
+            yield batch
+    finally:
+        pumping.cancel()
+
+
+def _get(queue: "multiprocessing.Queue[Any]", wait: float = 0.2) -> Any:
+    # A short wait, so a thread of the executor never hangs on a queue nobody feeds anymore
+    try:
+        return queue.get(timeout=wait)
+    except Empty:
+        return None
+
+
+async def _check_chunks(
+    index: int,
+    tasks: "multiprocessing.Queue[Union[List[str], str]]",
+    results: "multiprocessing.Queue[Tuple[int, str, Any]]",
+    options: Dict[str, Any],
+) -> None:
+    loop = asyncio.get_running_loop()
+    judges = JudgePool(options["judges"])
+    judges.client_ip = options["client_ip"]  # The parent verified the judges
+    adaptive = options["adaptive"]  # A fresh copy in every process
+    probe = judges.wrap(options["probe"])
+    if adaptive is not None:
+        probe = adaptive.wrap(probe)
+
+    parent = multiprocessing.parent_process()
+    batch: List[CheckResult] = []
+
+    async def proxies() -> AsyncIterator[str]:
+        while True:
+            chunk = await loop.run_in_executor(None, _get, tasks)
+            if chunk == _done or parent is not None and not parent.is_alive():
+                return
+            for proxy in chunk or ():
+                yield proxy
+
+    def send() -> None:
+        nonlocal batch
+        if batch:
+            results.put((index, "results", batch))
+            batch = []
+
+    async def send_periodically() -> None:
+        while True:
+            await asyncio.sleep(flush_interval)
+            send()
+
+    sending = asyncio.ensure_future(send_periodically())
+    try:
+        async for result in iter_checking_async(
+            proxies(),
+            options["workers"],
+            options["check_timeout"],
+            probe=probe,
+            probes=options["probes"],
+        ):
+            batch.append(result)
+            if len(batch) >= chunk_size:
+                send()
+    finally:
+        sending.cancel()
+    send()
+    results.put((index, "judges", judges.counts()))
+    if adaptive is not None:
+        results.put((index, "adaptive", adaptive.counts()))
+    results.put((index, _done, None))
+
+
+def _worker(
+    index: int,
+    tasks: "multiprocessing.Queue[Union[List[str], str]]",
+    results: "multiprocessing.Queue[Tuple[int, str, Any]]",
+    options: Dict[str, Any],
+) -> None:
+    logging.basicConfig(
+        format="{asctime} <{levelname}> {processName} {name}: {message}",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        style="{",
+        level=options["log_level"],
+    )
+    asyncio.run(_check_chunks(index, tasks, results, options))
+
+
+async def iter_checking_processes(
+    proxies: Union[Iterable[str], AsyncIterable[str]],
+    processes: int,
+    workers: Optional[int] = None,
+    check_timeout: float = timeout,
+    probe: Probe = probe_proxy,
+    judges: Optional[JudgePool] = None,
+    probes: int = 1,
+    adaptive: Optional[AdaptiveTimeout] = None,
+) -> AsyncIterator[CheckResult]:
+    """iter_checking_async spread over `processes` processes with an event loop each.
+    Proxies go to them in small chunks from one shared queue, so a process that
+    finishes early takes over the work of the slower ones"""
+    loop = asyncio.get_running_loop()
+    judges = judges or JudgePool([url])
+    context = multiprocessing.get_context("spawn")  # Forking a process with a running event loop is unsafe
+    tasks: "multiprocessing.Queue[Union[List[str], str]]" = context.Queue()
+    results: "multiprocessing.Queue[Tuple[int, str, Any]]" = context.Queue()
+    options = {
+        "workers": -(-(workers or default_concurrency) // processes),
+        "check_timeout": check_timeout,
+        "probe": probe,
+        "judges": [judge.url for judge in judges.judges],
+        "client_ip": judges.client_ip,
+        "probes": probes,
+        # Every process learns its own deadline, the parent gets what they learned at the end
+        "adaptive": adaptive.fresh() if adaptive is not None else None,
+        "log_level": logging.getLogger().getEffectiveLevel(),
+    }
+    workers_processes = [
+        context.Process(target=_worker, args=(index, tasks, results, options), daemon=True)
+        for index in range(processes)
+    ]
+    for process in workers_processes:
+        process.start()
+
+    async def feed() -> None:
+        try:
+            async for chunk in _batches(proxies, chunk_size):
+                tasks.put(chunk)
+        finally:
+            for _ in workers_processes:
+                tasks.put(_done)  # No more work
+
+    feeding = asyncio.ensure_future(feed())
+    done: set = set()
+    try:
+        while len(done) < len(workers_processes):
+            message = await loop.run_in_executor(None, _get, results)
+            if message is None:
+                for index, process in enumerate(workers_processes):
+                    if index not in done and not process.is_alive():
+                        logger.warning(f"Checker process {index} died with exit code {process.exitcode}")
+                        done.add(index)
+                continue
+            index, kind, payload = message
+            if kind == "results":
+                for result in payload:
+                    yield result
+            elif kind == "judges":
+                judges.merge(payload)
+            elif kind == "adaptive" and adaptive is not None:
+                adaptive.merge(payload)
+            else:
+                done.add(index)
+    finally:
+        feeding.cancel()
+        for process in workers_processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
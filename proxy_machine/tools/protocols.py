@@ -0,0 +1,269 @@
+import asyncio
+import json
+import socket
+import struct
+from functools import lru_cache
+from typing import Awaitable, Iterable, List, NamedTuple, Optional, Sequence
+from urllib.parse import urlsplit
+
+from .proxies_manipulation import split_proxy
+from .proxy_checker import (
+    CheckResult,
+    JudgeError,
+    dead_result,
+    headers,
+    judge_result,
+    judge_status,
+    shared_ssl_context,
+    timeout,
+    url,
+)
+from .raw_probe import ProbeError, Receive, read_body, read_head
+
+# What a proxy can speak: plain http forwarding, CONNECT tunnels, SOCKS4(a) and SOCKS5 without authentication
+protocols = ("http", "https", "socks4", "socks5")
+
+
+class _Target(NamedTuple):
+    host: str
+    port: int
+    tls: bool
+    absolute: bytes  # the GET for an http proxy, empty for https judges
+    connect: bytes  # the CONNECT for an http proxy
+    origin: bytes  # the GET through a tunnel
+
+
+@lru_cache(maxsize=None)
+def _target(judge: str) -> _Target:
+    parts = urlsplit(judge)
+    tls = parts.scheme == "https"
+    port = parts.port or (443 if tls else 80)
+    host = parts.hostname or ""
+    host_header = host if parts.port is None else f"{host}:{port}"
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    # No "Connection: close", the second request of an http proxy reuses the connection if the proxy lets it
+    lines = "\r\n".join([f"Host: {host_header}", f"User-Agent: {headers['User-Agent']}", "Accept: */*"])
+    return _Target(
+        host,
+        port,
+        tls,
+        b"" if tls else f"GET {judge} HTTP/1.1\r\n{lines}\r\n\r\n".encode(),
+        f"CONNECT {host}:{port} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n".encode(),
+        f"GET {path} HTTP/1.1\r\n{lines}\r\nConnection: close\r\n\r\n".encode(),
+    )
+
+
+def _ipv4(host: str) -> Optional[bytes]:
+    try:
+        return socket.inet_aton(host) if host.count(".") == 3 else None
+    except OSError:
+        return None
+
+
+def preferred_scheme(found: Sequence[str]) -> str:
+    """The scheme a client puts in the proxy url, http when the proxy speaks any http"""
+    if not found or "http" in found or "https" in found:
+        return "http"
+    return "socks5" if "socks5" in found else "socks4"
+
+
+def proxy_url(result: CheckResult) -> str:
+    """The proxy with the scheme of what it speaks, as it was checked if protocols weren't detected"""
+    if not result.protocols:
+        return result.proxy
+    return f"{preferred_scheme(result.protocols)}://{result.proxy.split('://')[-1]}"
+
+
+class _Detection:
+    """The state of one detecting check: the sockets it opened, the protocols that worked and the errors"""
+
+    def __init__(self, proxy: str, judge: str, client_ip: Optional[str] = None) -> None:
+        self.proxy = proxy
+        self.client_ip = client_ip
+        self.address = split_proxy(proxy)
+        self.target = _target(judge)
+        self.loop = asyncio.get_running_loop()
+        self.start = self.loop.time()
+        self.connect_time: Optional[float] = None
+        self.head_time = 0.0
+        self.found: List[str] = []
+        self.first: Optional[CheckResult] = None  # the timings are of the first protocol that worked
+        self.errors: List[Exception] = []
+        self.sockets: List[socket.socket] = []
+        self.socks5 = False  # the proxy answered the SOCKS5 greeting
+
+    async def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        self.sockets.append(sock)
+        await self.loop.sock_connect(sock, self.address)
+        if self.connect_time is None:
+            self.connect_time = self.loop.time() - self.start
+        return sock
+
+    def _receive(self, sock: socket.socket) -> Receive:
+        return lambda: self.loop.sock_recv(sock, 65536)
+
+    async def _exactly(self, sock: socket.socket, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = await self.loop.sock_recv(sock, size - len(data))
+            if not chunk:
+                raise ProbeError(f"connection closed after {data!r}")
+            data += chunk
+        return data
+
+    async def _judge(self, protocol: str, receive: Receive, buffer: bytes = b"") -> bool:
+        """Reads the judge answer, the protocol works if the judge saw the proxy ip.
+        Returns whether the connection stays open for another request"""
+        status, response_headers, body = await read_head(receive, buffer)
+        self.head_time = self.loop.time()
+        framed = "content-length" in response_headers or "chunked" in response_headers.get("transfer-encoding", "")
+        body = await read_body(receive, response_headers, body)
+        judge_status(status)
+        if status != 200:
+            raise ProbeError(f"judge answered {status}")
+        result = judge_result(
+            self.proxy,
+            json.loads(body),
+            self.loop.time() - self.start,
+            connect_time=self.connect_time,
+            ttfb=self.head_time - self.start,
+            client_ip=self.client_ip,
+        )
+        self.found.append(protocol)
+        self.first = self.first or result
+        return framed and response_headers.get("connection", "").lower() != "close"
+
+    async def _through_tunnel(self, protocol: str, sock: socket.socket) -> None:
+        if not self.target.tls:
+            await self.loop.sock_sendall(sock, self.target.origin)
+            await self._judge(protocol, self._receive(sock))
+            return
+        # TLS over the same socket, the transport owns it from now on
+        self.sockets.remove(sock)
+        reader, writer = await asyncio.open_connection(
+            sock=sock, ssl=shared_ssl_context(), server_hostname=self.target.host
+        )
+        try:
+            writer.write(self.target.origin)
+            await self._judge(protocol, lambda: reader.read(65536))
+        finally:
+            writer.close()
+
+    async def _attempt(self, protocol_check: Awaitable[None]) -> None:
+        try:
+            await protocol_check
+        except JudgeError:
+            raise
+        except Exception as e:
+            self.errors.append(e)
+
+    async def _http(self, sock: socket.socket) -> bool:
+        """Plain forwarding (of http judges only) and CONNECT, both on the first connection while the proxy
+        keeps it open. False if the proxy didn't answer the first request with HTTP, it may speak SOCKS then"""
+        await self.loop.sock_sendall(sock, self.target.absolute or self.target.connect)
+        try:
+            first = await self.loop.sock_recv(sock, 65536)
+        except ConnectionResetError as e:  # What SOCKS servers do with bytes they don't understand
+            self.errors.append(e)
+            return False
+        if not first or not first.startswith(b"HTTP/"[: len(first)]):
+            self.errors.append(ProbeError(f"not an http answer: {first[:16]!r}"))
+            return False
+        if not self.target.absolute:
+            await self._attempt(self._tunnel(sock, first))  # The CONNECT was the first request
+            return True
+        reusable = False
+        try:
+            reusable = await self._judge("http", self._receive(sock), first)
+        except JudgeError:
+            raise
+        except Exception as e:
+            self.errors.append(e)
+        await self._attempt(self._tunnel(sock if reusable else None))
+        return True
+
+    async def _tunnel(self, sock: Optional[socket.socket], buffer: bytes = b"") -> None:
+        """A CONNECT to the judge, `buffer` is the start of the answer if the CONNECT is already sent"""
+        if sock is None:
+            sock = await self._connect()
+        if not buffer:
+            await self.loop.sock_sendall(sock, self.target.connect)
+        status, _, _ = await read_head(self._receive(sock), buffer)
+        if status != 200:
+            raise ProbeError(f"CONNECT refused with {status}")
+        await self._through_tunnel("https", sock)
+
+    async def _socks5(self) -> None:
+        sock = await self._connect()
+        await self.loop.sock_sendall(sock, b"\x05\x01\x00")  # Version 5, one method: no authentication
+        reply = await self.loop.sock_recv(sock, 2)
+        if reply[:1] != b"\x05":
+            raise ProbeError(f"not a SOCKS5 answer: {reply!r}")
+        self.socks5 = True
+        if reply != b"\x05\x00":
+            raise ProbeError("SOCKS5 wants authentication")
+        host = self.target.host
+        ip = _ipv4(host)
+        address = b"\x01" + ip if ip else b"\x03" + bytes([len(host)]) + host.encode()
+        await self.loop.sock_sendall(sock, b"\x05\x01\x00" + address + struct.pack(">H", self.target.port))
+        _, code, _, address_type = await self._exactly(sock, 4)
+        if code != 0:
+            raise ProbeError(f"SOCKS5 connect failed with {code}")
+        size = {1: 4, 4: 16}.get(address_type) or (await self._exactly(sock, 1))[0]
+        await self._exactly(sock, size + 2)  # The address the proxy connected from
+        await self._through_tunnel("socks5", sock)
+
+    async def _socks4(self) -> None:
+        sock = await self._connect()
+        host = self.target.host
+        ip = _ipv4(host)
+        # SOCKS4a: the ip 0.0.0.1 means that the host name follows the user id
+        request = b"\x04\x01" + struct.pack(">H", self.target.port) + (ip or b"\x00\x00\x00\x01") + b"\x00"
+        await self.loop.sock_sendall(sock, request if ip else request + host.encode() + b"\x00")
+        reply = await self._exactly(sock, 8)
+        if reply[1] != 0x5A:
+            raise ProbeError(f"SOCKS4 connect failed with {reply[1]}")
+        await self._through_tunnel("socks4", sock)
+
+    async def run(self) -> None:
+        # A proxy that can't be reached is dead for every protocol, that's one connection attempt for most of them
+        sock = await self._connect()
+        if await self._http(sock):
+            return
+        await self._attempt(self._socks5())
+        if not self.socks5:  # A SOCKS5 server doesn't speak SOCKS4 either
+            await self._attempt(self._socks4())
+
+    def close(self) -> None:
+        for sock in self.sockets:
+            sock.close()
+
+    def result(self) -> CheckResult:
+        if self.first is None:
+            return dead_result(self.proxy, self.errors[0] if self.errors else ProbeError("no protocol worked"))
+        self.first.protocols = tuple(protocol for protocol in protocols if protocol in self.found)
+        return self.first
+
+
+async def detect_probe(
+    proxy: str, check_timeout: float = timeout, judge: str = url, client_ip: Optional[str] = None
+) -> CheckResult:
+    """Finds out in one check which protocols of `protocols` the proxy speaks. The first connection carries
+    the http requests, a proxy that answers them with anything but HTTP is tried with SOCKS5, then SOCKS4.
+    The deadline covers the whole check, the protocols found before it ran out still count"""
+    detection = _Detection(proxy.strip(), judge, client_ip)
+    try:
+        await asyncio.wait_for(detection.run(), check_timeout)
+    except JudgeError:
+        raise
+    except Exception as e:
+        detection.errors.insert(0, e)
+    finally:
+        detection.close()
+    return detection.result()
+
+
+def speaks_any(result: CheckResult, wanted: Iterable[str]) -> bool:
+    return not set(wanted).isdisjoint(result.protocols)
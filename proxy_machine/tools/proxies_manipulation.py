@@ -1,13 +1,19 @@
 import re
+from typing import Tuple
 from urllib.parse import urlparse
 
+import brotli
+
+from .metrics import measure
+from .trace import span
+
 
 def filtrate_ports(ip_port: str) -> bool:
     try:
         port = ip_port.split(":")[-1]
     except ValueError:
         return False
-    if len(port) > 0:
+    if len(port) > 0 and port.isdigit():
         if int(port) < 65535:
             return True
     return False
@@ -18,8 +24,24 @@ def short_url(url: str) -> str:
 
 
 def parse_proxies(response: str) -> set:
-    return set(re.findall(r"((?:\d{1,3}\.){3}\d{1,3}:\d{1,5})", response))
+    with measure("parse_seconds"), span("parse_proxies", "parse", size=len(response)):
+        return set(re.findall(r"((?:\d{1,3}\.){3}\d{1,3}:\d{1,5})", response))
 
 
 def prepare_proxy(ip_port: str) -> str:
     return f"http://{ip_port}"
+
+
+def split_proxy(proxy: str) -> Tuple[str, int]:
+    """Splits "http://1.2.3.4:8080" into ("1.2.3.4", 8080)"""
+    host, _, port = proxy.strip().split("://")[-1].rpartition(":")
+    return host, int(port)
+
+
+def decode_brotli(content: bytes) -> bytes:
+    """httpx already decodes `Content-Encoding: br` bodies, so raw brotli is decompressed only if it is left"""
+    with measure("decompress_seconds"), span("decode_brotli", "decompress", size=len(content)):
+        try:
+            return brotli.decompress(content)
+        except brotli.error:
+            return content
@@ -1,75 +1,414 @@
+import asyncio
 import logging
-import time
+import re
+import ssl
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Set, Union
+from dataclasses import dataclass
+from functools import lru_cache
+from itertools import islice
+from statistics import median
+from time import perf_counter
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import httpx
 import requests
 from user_agent import generate_user_agent
 
+from .trace import span
+
 logger = logging.getLogger(__name__)
 url = "http://api.myip.com/"
 headers = {"User-Agent": generate_user_agent()}
-client = httpx.AsyncClient(timeout=6)
+timeout = 6
+# How many checks the async checker keeps in flight when --workers is not given
+default_concurrency = 500
+T = TypeVar("T")
+# From the least to the most hidden, see anonymity_level()
+anonymity_levels = ("transparent", "anonymous", "elite")
+# Headers where proxies put the address of their client ...
+_client_headers = {
+    "x-forwarded-for",
+    "forwarded",
+    "x-real-ip",
+    "client-ip",
+    "x-client-ip",
+    "x-originating-ip",
+    "true-client-ip",
+    "x-cluster-client-ip",
+}
+# ... and headers that only tell that there is a proxy
+_proxy_headers = {"via", "proxy-connection", "proxy-agent", "x-proxy-id", "x-bluecoat-via", "x-forwarded-server"}
+_ip_re = re.compile(r"(?<![\d.])(?:\d{1,3}\.){3}\d{1,3}(?![\d.])")
 
 
-def check_proxy(proxy: str) -> Union[str, None]:
+class JudgeError(Exception):
+    """The judge itself refused to answer (e.g. rate limited), the proxy may be fine"""
+
+
+class WrongIpError(ConnectionError):
+    """The judge saw the request coming from another ip than the proxy's"""
+
+
+@dataclass
+class CheckResult:
+    proxy: str
+    alive: bool = False
+    latency: Optional[float] = None  # total time of the check, the median of the successful probes
+    country: Optional[str] = None  # ISO code reported by the judge, or of the --geo-db
+    connect_time: Optional[float] = None
+    ttfb: Optional[float] = None  # time to the first byte of the answer
+    probes: int = 1
+    successes: int = 0
+    error: Optional[str] = None  # why the check failed, one of failure_kind()
+    protocols: Tuple[str, ...] = ()  # what the proxy speaks, found only by tools/protocols.detect_probe
+    asn: Optional[int] = None  # autonomous system of the proxy ip, from the --geo-db
+    anonymity: Optional[str] = None  # one of anonymity_levels, known if the judge echoes the request headers
+
+    @property
+    def score(self) -> Optional[float]:
+        """Seconds per successful request: the median latency over the success ratio, lower is better"""
+        if not self.successes or self.latency is None:
+            return None
+        return self.latency * self.probes / self.successes
+
+
+@lru_cache(maxsize=None)
+def shared_ssl_context() -> ssl.SSLContext:
+    """Loading CA certificates is the most expensive part of building a client,
+    so every check reuses one context"""
+    return httpx.create_ssl_context()
+
+
+def probe_proxy_sync(
+    proxy: str, judge: str = url, check_timeout: float = timeout, client_ip: Optional[str] = None
+) -> CheckResult:
     proxy = proxy.replace("\n", "")
     proxies = {"http": proxy, "https": proxy}
-    proxy = proxy.replace("http://", "").split(":")  # type: ignore
-    ip = proxy[0]
-    try:
-        result = requests.get(url, headers=headers, proxies=proxies, timeout=6)
-        data = result.json()
-        if data.get("ip") == ip:
-            logger.info(f"Good proxy: {proxy[0]}:{proxy[1]} !!!")
-            return proxies.get("http")
-    except Exception:
-        logger.info(f"Dead proxy: {proxy[0]}:{proxy[1]}")
-    return None
+    with span("check", "check", proxy=proxy):
+        try:
+            start_time = perf_counter()
+            result = requests.get(judge, headers=headers, proxies=proxies, timeout=check_timeout)
+            total_time = perf_counter() - start_time
+            judge_status(result.status_code)
+            # requests measures `elapsed` up to the parsed headers of the answer
+            return judge_result(
+                proxy, result.json(), total_time, ttfb=result.elapsed.total_seconds(), client_ip=client_ip
+            )
+        except Exception as e:
+            return dead_result(proxy, e)
+
+
+def check_proxy(proxy: str) -> Union[str, None]:
+    result = probe_proxy_sync(proxy)
+    return result.proxy if result.alive else None
+
+
+async def _request_through(proxy: str, check_timeout: float, judge: str = url) -> Tuple[httpx.Response, float]:
+    """The answer of the judge and the loop time when its headers came"""
+    # One transport per proxy: httpx binds proxies to the transport, but the
+    # SSL context (and therefore the certificate store) is shared by all of them
+    transport = httpx.AsyncHTTPTransport(proxy=httpx.Proxy(proxy), verify=shared_ssl_context(), trust_env=False)
+    async with httpx.AsyncClient(transport=transport, timeout=check_timeout, trust_env=False) as client:
+        async with client.stream("GET", judge, headers=headers) as response:
+            headers_time = asyncio.get_running_loop().time()
+            await response.aread()
+            return response, headers_time
+
+
+def judge_status(status: int) -> None:
+    if status == 429:
+        raise JudgeError("judge is rate limiting us")
+
+
+def seen_ip(data: dict) -> str:
+    """The client ip in a judge answer"""
+    # {"ip": ...} of api.myip.com, ipify and our judge server, {"origin": ...} of httpbin.
+    # A transparent proxy makes that origin "client, proxy": the last hop is who connected to the judge
+    return data.get("ip") or str(data.get("origin", "")).split(",")[-1].strip()
+
+
+def anonymity_level(data: dict, proxy_ip: str, client_ip: Optional[str] = None) -> Optional[str]:
+    """transparent if the judge got our ip, anonymous if it got headers that tell of a proxy,
+    elite if it got neither; None if the judge doesn't echo the request headers"""
+    echoed = data.get("headers")
+    if not isinstance(echoed, dict):
+        return None
+    echoed = {name.lower(): str(value) for name, value in echoed.items() if name.lower() != "host"}
+    # httpbin puts the whole X-Forwarded-For chain into "origin"
+    seen = set(_ip_re.findall(str(data.get("origin", ""))))
+    if client_ip is not None and client_ip != proxy_ip:
+        seen.update(*(_ip_re.findall(value) for value in echoed.values()))
+        if client_ip in seen:
+            return "transparent"
+    else:
+        # Without our own ip any other ip where proxies put the client's counts
+        seen.update(*(_ip_re.findall(value) for name, value in echoed.items() if name in _client_headers))
+        if seen - {proxy_ip}:
+            return "transparent"
+    # A header with just the proxy ip may come from a load balancer in front of the judge
+    if any(
+        name in _proxy_headers or name in _client_headers and set(_ip_re.findall(value)) != {proxy_ip}
+        for name, value in echoed.items()
+    ):
+        return "anonymous"
+    return "elite"
+
+
+def hides_enough(anonymity: Optional[str], level: str) -> bool:
+    """Whether a proxy of `anonymity` is at least as anonymous as `level`, an unknown one is not"""
+    return anonymity is not None and anonymity_levels.index(anonymity) >= anonymity_levels.index(level)
+
+
+def judge_result(
+    proxy: str,
+    data: dict,
+    total_time: float,
+    connect_time: Optional[float] = None,
+    ttfb: Optional[float] = None,
+    client_ip: Optional[str] = None,
+) -> CheckResult:
+    """The proxy works if the judge saw the request coming from the proxy ip"""
+    address = proxy.split("://")[-1]
+    proxy_ip = address.rpartition(":")[0]
+    if seen_ip(data) != proxy_ip:
+        raise WrongIpError(f"judge returned {seen_ip(data)}")
+    logger.info(f"Good proxy: {address} !!! - {total_time=:.3f}")
+    return CheckResult(
+        proxy,
+        alive=True,
+        latency=total_time,
+        country=data.get("cc"),
+        connect_time=connect_time,
+        ttfb=ttfb,
+        successes=1,
+        anonymity=anonymity_level(data, proxy_ip, client_ip),
+    )
+
+
+def failure_kind(error: BaseException) -> str:
+    """timeout, refused, reset, wrong_ip, judge or error"""
+    # httpx wraps the OSError that tells what happened, requests only keeps its text
+    cause: Optional[BaseException] = error
+    while cause is not None:
+        if isinstance(cause, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException, requests.Timeout)):
+            return "timeout"
+        if isinstance(cause, WrongIpError):
+            return "wrong_ip"
+        if isinstance(cause, JudgeError):
+            return "judge"
+        if isinstance(cause, ConnectionRefusedError):
+            return "refused"
+        if isinstance(cause, ConnectionResetError):
+            return "reset"
+        cause = cause.__cause__ or cause.__context__
+    text = str(error).lower()
+    if "refused" in text:
+        return "refused"
+    if "reset" in text:
+        return "reset"
+    return "error"
 
 
-async def check_proxy_async(proxy: str) -> Union[str, None]:
+def dead_result(proxy: str, error: Exception) -> CheckResult:
+    logger.debug(f"Error {error!r}")
+    logger.info(f"Dead proxy: {proxy.split('://')[-1]}")
+    return CheckResult(proxy, error=failure_kind(error))
+
+
+async def probe_proxy(
+    proxy: str, check_timeout: float = timeout, judge: str = url, client_ip: Optional[str] = None
+) -> CheckResult:
     proxy = proxy.replace("\n", "")
-    proxies = {"http://": proxy, "https://": proxy}
-    proxy = proxy.replace("http://", "").split(":")  # type: ignore
-    ip = proxy[0]
     try:
-        client.proxies = proxies
-        start_time = time.perf_counter()
-        async with httpx.AsyncClient(proxies=proxies) as client_2:
-            result = await client_2.get(url, headers=headers)
-        # result = await client.get(url, headers=headers)
-        total_time = time.perf_counter() - start_time
-        data = result.json()
-        if data.get("ip") == ip:
-            logger.info(f"Good proxy: {proxy[0]}:{proxy[1]} !!! - {total_time=}")
-            return proxies.get("http")
-        else:
-            raise ConnectionError()
+        start_time = asyncio.get_running_loop().time()
+        # The deadline covers the whole check, not every single network phase
+        result, headers_time = await asyncio.wait_for(_request_through(proxy, check_timeout, judge), check_timeout)
+        total_time = asyncio.get_running_loop().time() - start_time
+        judge_status(result.status_code)
+        # httpx doesn't expose the moment the connection is established, so only raw_probe knows connect_time
+        return judge_result(proxy, result.json(), total_time, ttfb=headers_time - start_time, client_ip=client_ip)
+    except JudgeError:
+        raise
     except Exception as e:
-        logger.warning(f"Error {e}")
-        logger.info(f"Dead proxy: {proxy[0]}:{proxy[1]} - current_id:")
-    return None
+        return dead_result(proxy, e)
 
 
-def run_checking(proxies_set: Set[str], workers=None) -> Set[str]:
-    checked_proxies = set()
+async def check_or_dead(
+    probe: Callable[[str, float], Awaitable[CheckResult]], proxy: str, check_timeout: float
+) -> CheckResult:
+    """Runs a probe, a proxy that could not be judged counts as dead"""
+    with span("check", "check", proxy=proxy):
+        try:
+            return await probe(proxy, check_timeout)
+        except JudgeError as e:
+            return dead_result(proxy, e)
+
+
+def combine_probes(results: List[CheckResult]) -> CheckResult:
+    """One result out of several probes of a proxy, timings are the medians of the successful probes"""
+    alive = [result for result in results if result.alive]
+    if not alive:
+        return results[0]
+
+    def median_of(values: Iterable[Optional[float]]) -> Optional[float]:
+        known = [value for value in values if value is not None]
+        return median(known) if known else None
+
+    return CheckResult(
+        alive[0].proxy,
+        alive=True,
+        latency=median_of(result.latency for result in alive),
+        country=alive[0].country,
+        connect_time=median_of(result.connect_time for result in alive),
+        ttfb=median_of(result.ttfb for result in alive),
+        probes=len(results),
+        successes=len(alive),
+        protocols=alive[0].protocols,
+        asn=alive[0].asn,
+        # The least hidden level any probe saw
+        anonymity=min(
+            (result.anonymity for result in alive if result.anonymity is not None),
+            key=anonymity_levels.index,
+            default=None,
+        ),
+    )
+
+
+def repeating(
+    probe: Callable[[str, float], Awaitable[CheckResult]], probes: int
+) -> Callable[[str, float], Awaitable[CheckResult]]:
+    """A probe that probes a proxy, once it passed the first probe, `probes - 1` more times"""
+
+    async def check(proxy: str, check_timeout: float) -> CheckResult:
+        results = [await probe(proxy, check_timeout)]
+        while results[0].alive and len(results) < probes:
+            try:
+                results.append(await probe(proxy, check_timeout))
+            except JudgeError:
+                break  # Not the fault of the proxy
+        return combine_probes(results)
+
+    return check
+
+
+async def check_proxy_async(proxy: str, check_timeout: float = timeout) -> Union[str, None]:
+    result = await check_or_dead(probe_proxy, proxy, check_timeout)
+    return result.proxy if result.alive else None
+
+
+def probe_repeatedly_sync(
+    proxy: str, probes: int = 1, judge: str = url, check_timeout: float = timeout, client_ip: Optional[str] = None
+) -> CheckResult:
+    results = [probe_proxy_sync(proxy, judge, check_timeout, client_ip)]
+    while results[0].alive and len(results) < probes:
+        results.append(probe_proxy_sync(proxy, judge, check_timeout, client_ip))
+    return combine_probes(results)
+
+
+def run_checking_results(
+    proxies: Iterable[str],
+    workers=None,
+    probes: int = 1,
+    judges: Sequence[str] = (url,),
+    check_timeout: float = timeout,
+    client_ip: Optional[str] = None,
+) -> List[CheckResult]:
+    """The threaded checker, proxies take turns over the judges"""
     with ThreadPoolExecutor(workers) as executor:
-        futures = []
-        for proxy in proxies_set:
-            futures.append(executor.submit(check_proxy, proxy))
-        for future in as_completed(futures):
-            c_proxy = future.result()
-            if c_proxy is not None:
-                checked_proxies.add(c_proxy)
-    return checked_proxies
+        futures = [
+            executor.submit(probe_repeatedly_sync, proxy, probes, judges[i % len(judges)], check_timeout, client_ip)
+            for i, proxy in enumerate(proxies)
+        ]
+        return [future.result() for future in as_completed(futures)]
+
+
+def run_checking(proxies_set: Set[str], workers=None) -> Set[str]:
+    return {result.proxy for result in run_checking_results(proxies_set, workers) if result.alive}
+
+
+async def iter_bounded(
+    func: Callable[[str], Awaitable[T]], items: Union[Iterable[str], AsyncIterable[str]], limit: int
+) -> AsyncIterator[T]:
+    """Runs `func` for every item, at most `limit` at once, and yields the
+    results in the order they finish. Items can come from an async iterable,
+    then work starts before the whole input is known"""
+    pending: Set["asyncio.Future[T]"] = set()
+
+    if not isinstance(items, AsyncIterable):
+        items_iter = iter(items)
+        try:
+            while True:
+                for item in islice(items_iter, limit - len(pending)):
+                    pending.add(asyncio.ensure_future(func(item)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        return
+
+    source = items.__aiter__()
+    next_item: "Optional[asyncio.Future[str]]" = None
+    exhausted = False
+    try:
+        while True:
+            if next_item is None and not exhausted and len(pending) < limit:
+                next_item = asyncio.ensure_future(source.__anext__())
+            waiting = pending | {next_item} if next_item is not None else pending
+            if not waiting:
+                break
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            if next_item in done:
+                done.discard(next_item)
+                try:
+                    pending.add(asyncio.ensure_future(func(next_item.result())))
+                except StopAsyncIteration:
+                    exhausted = True
+                next_item = None
+            for task in done:
+                pending.discard(task)
+                yield task.result()
+    finally:
+        if next_item is not None:
+            next_item.cancel()
+        for task in pending:
+            task.cancel()
+
+
+def iter_checking_async(
+    proxies: Union[Iterable[str], AsyncIterable[str]],
+    workers: Optional[int] = None,
+    check_timeout: float = timeout,
+    probe: Callable[[str, float], Awaitable[CheckResult]] = probe_proxy,
+    probes: int = 1,
+) -> AsyncIterator[CheckResult]:
+    """Checks proxies concurrently, at most `workers` at once"""
+    if probes > 1:
+        probe = repeating(probe, probes)
+    return iter_bounded(
+        lambda proxy: check_or_dead(probe, proxy, check_timeout), proxies, workers or default_concurrency
+    )
 
 
 async def run_checking_async(proxies_set: Set[str], workers=None) -> Set[str]:
     checked_proxies = set()
-    for proxy in proxies_set:
-        c_proxy = await check_proxy_async(proxy)
-        if c_proxy:
-            checked_proxies.add(c_proxy)
+    async for result in iter_checking_async(proxies_set, workers):
+        if result.alive:
+            checked_proxies.add(result.proxy)
     return checked_proxies
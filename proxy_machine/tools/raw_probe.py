@@ -0,0 +1,157 @@
+import asyncio
+import json
+import socket
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .proxies_manipulation import split_proxy
+from .proxy_checker import (
+    CheckResult,
+    JudgeError,
+    dead_result,
+    headers,
+    judge_result,
+    judge_status,
+    shared_ssl_context,
+    timeout,
+    url,
+)
+
+# Judge answers are tiny, anything bigger is not a judge
+max_response_size = 64 * 1024
+Receive = Callable[[], Awaitable[bytes]]
+
+
+class ProbeError(ConnectionError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def _requests(judge: str) -> Tuple[bytes, bytes]:
+    """The absolute-URI GET for plain http judges and the CONNECT for https ones"""
+    parts = urlsplit(judge)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    host = parts.hostname if parts.port is None else f"{parts.hostname}:{port}"
+    path = parts.path or "/"
+    if parts.query:
+        path += f"?{parts.query}"
+    lines = [f"Host: {host}", f"User-Agent: {headers['User-Agent']}", "Accept: */*", "Connection: close"]
+    if parts.scheme == "https":
+        request = f"GET {path} HTTP/1.1\r\n" + "\r\n".join(lines) + "\r\n\r\n"
+        connect = f"CONNECT {parts.hostname}:{port} HTTP/1.1\r\nHost: {parts.hostname}:{port}\r\n\r\n"
+        return request.encode(), connect.encode()
+    request = f"GET {judge} HTTP/1.1\r\n" + "\r\n".join(lines) + "\r\n\r\n"
+    return request.encode(), b""
+
+
+async def read_head(receive: Receive, buffer: bytes = b"") -> Tuple[int, Dict[str, str], bytes]:
+    """Reads the status line and headers, returns them with the body bytes that came along"""
+    while b"\r\n\r\n" not in buffer:
+        chunk = await receive()
+        if not chunk:
+            raise ProbeError("connection closed before the response head")
+        buffer += chunk
+        if len(buffer) > max_response_size:
+            raise ProbeError("response head is too big")
+    head, _, body = buffer.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    parts = status_line.split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+        raise ProbeError(f"not an http response: {status_line[:40]!r}")
+    response_headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        response_headers[name.strip().lower()] = value.strip()
+    return int(parts[1]), response_headers, body
+
+
+def _dechunk(body: bytes) -> bytes:
+    result, position = b"", 0
+    while True:
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";")[0], 16)
+        if size == 0:
+            return result
+        result += body[line_end + 2 : line_end + 2 + size]
+        position = line_end + 2 + size + 2
+
+
+async def read_body(receive: Receive, response_headers: Dict[str, str], body: bytes) -> bytes:
+    length = response_headers.get("content-length")
+    chunked = "chunked" in response_headers.get("transfer-encoding", "").lower()
+    while len(body) <= max_response_size:
+        if length is not None and len(body) >= int(length):
+            return body[: int(length)]
+        if chunked and (body.endswith(b"0\r\n\r\n") or body == b"0\r\n\r\n"):
+            return _dechunk(body)
+        chunk = await receive()
+        if not chunk:
+            if length is not None or chunked:
+                raise ProbeError("connection closed in the middle of the body")
+            return body
+        body += chunk
+    raise ProbeError("response is too big")
+
+
+async def _exchange(proxy: str, judge: str, timings: Dict[str, float]) -> bytes:
+    """Sends the judge request through the proxy and returns the response body,
+    the loop time of the connect and of the response head go to `timings`"""
+    loop = asyncio.get_running_loop()
+    request, connect = _requests(judge)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    writer = None
+    try:
+        await loop.sock_connect(sock, split_proxy(proxy))
+        timings["connect"] = loop.time()
+        if not connect:
+            await loop.sock_sendall(sock, request)
+            status, response_headers, body = await read_head(lambda: loop.sock_recv(sock, 65536))
+            timings["head"] = loop.time()
+            body = await read_body(lambda: loop.sock_recv(sock, 65536), response_headers, body)
+        else:
+            await loop.sock_sendall(sock, connect)
+            status, _, _ = await read_head(lambda: loop.sock_recv(sock, 65536))
+            if status != 200:
+                raise ProbeError(f"CONNECT refused with {status}")
+            # TLS over the same socket, the proxy is a tunnel now
+            reader, writer = await asyncio.open_connection(
+                sock=sock, ssl=shared_ssl_context(), server_hostname=urlsplit(judge).hostname
+            )
+            writer.write(request)
+            status, response_headers, body = await read_head(lambda: reader.read(65536))
+            timings["head"] = loop.time()
+            body = await read_body(lambda: reader.read(65536), response_headers, body)
+        judge_status(status)
+        if status != 200:
+            raise ProbeError(f"judge answered {status}")
+        return body
+    finally:
+        if writer is not None:
+            writer.close()  # The transport owns the socket from now on
+        else:
+            sock.close()
+
+
+async def raw_probe(
+    proxy: str, check_timeout: float = timeout, judge: str = url, client_ip: Optional[str] = None
+) -> CheckResult:
+    """The same check as proxy_checker.probe_proxy on bare sockets, without an http client"""
+    proxy = proxy.strip()
+    loop = asyncio.get_running_loop()
+    try:
+        start_time, timings = loop.time(), {}
+        body = await asyncio.wait_for(_exchange(proxy, judge, timings), check_timeout)
+        return judge_result(
+            proxy,
+            json.loads(body),
+            loop.time() - start_time,
+            connect_time=timings["connect"] - start_time,
+            ttfb=timings["head"] - start_time,
+            client_ip=client_ip,
+        )
+    except JudgeError:
+        raise
+    except Exception as e:
+        return dead_result(proxy, e)
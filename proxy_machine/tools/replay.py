@@ -0,0 +1,134 @@
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import re
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+import httpx
+
+from .adaptive import HostTimeouts
+from .cache import ResponseCache
+from .fetcher import Fetcher
+from .metrics import record_failed_fetch, record_fetch
+from .scheduler import HostScheduler
+
+logger = logging.getLogger(__name__)
+# Arguments of Fetcher.request that end up in the request itself
+_request_arguments = ("params", "headers", "cookies", "content", "data", "files", "json")
+# Already decoded by httpx, or not true anymore for the stored body
+_dropped_headers = {"content-encoding", "content-length", "transfer-encoding"}
+# Sources that put today's date into the url are replayed on other days too
+_date_re = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+
+def build_request(method: str, url: str, kwargs: Dict[str, Any]) -> httpx.Request:
+    """The request a source asked for, without the client's headers and the cookies it collected on the way"""
+    request = httpx.Request(method, url, **{k: v for k, v in kwargs.items() if k in _request_arguments})
+    request.read()
+    return request
+
+
+def request_key(request: httpx.Request) -> str:
+    """Method, url, cookies and body of a request, the same for the same request of another run"""
+    body = hashlib.sha1(request.content).hexdigest()[:16]
+    url = _date_re.sub("DATE", str(request.url))
+    return f"{request.method} {url} cookie={request.headers.get('cookie', '')} body={body}"
+
+
+class RecordingFetcher(Fetcher):
+    """A Fetcher that saves every response (status, headers and body) into a gzipped JSON lines archive"""
+
+    reuse_fresh = False
+
+    def __init__(self, path: str, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        self.records: List[Dict[str, Any]] = []
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+        key = request_key(build_request(method, url, kwargs))
+        response = await super().request(method, url, timeout, **kwargs)
+        recorded = response
+        if response.status_code == 304:
+            # A replay has no cache, so the archive gets the body the 304 stands for
+            body = self.cache.body(url) if self.cache is not None else None
+            if body is None:
+                headers = {k: v for k, v in kwargs.get("headers", {}).items() if not k.startswith("If-")}
+                recorded = await super().request(method, url, timeout, **{**kwargs, "headers": headers})
+            else:
+                recorded = httpx.Response(200, headers=response.headers, content=body)
+        self.records.append(
+            {
+                "key": key,
+                "status": recorded.status_code,
+                "headers": [
+                    [name, value]
+                    for name, value in recorded.headers.multi_items()
+                    if name.lower() not in _dropped_headers
+                ],
+                "content": base64.b64encode(recorded.content).decode(),
+            }
+        )
+        return response
+
+    async def aclose(self) -> None:
+        await super().aclose()
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            for record in self.records:
+                f.write(json.dumps(record) + "\n")
+        logger.info(f"{len(self.records)} responses were recorded in {self.path}")
+
+
+def load_archive(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    archive: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            archive[record["key"]].append(record)
+    return archive
+
+
+class ReplayFetcher(Fetcher):
+    """A Fetcher that answers from an archive of RecordingFetcher instead of the network.
+    Repeated requests get the recorded responses in order, then the last one again"""
+
+    offline = True
+
+    def __init__(self, archive: Dict[str, List[Dict[str, Any]]], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.archive: Dict[str, Deque[Dict[str, Any]]] = {key: deque(records) for key, records in archive.items()}
+        self.misses = 0
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs: Any) -> "ReplayFetcher":
+        return cls(load_archive(path), **kwargs)
+
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs: Any) -> httpx.Response:
+        request = build_request(method, url, kwargs)
+        key = request_key(request)
+        records = self.archive.get(key)
+        if not records:
+            self.misses += 1
+            record_failed_fetch(0.0)
+            raise httpx.ConnectError(f"{key} is not in the archive", request=request)
+        record = records.popleft() if len(records) > 1 else records[0]
+        content = base64.b64decode(record["content"])
+        record_fetch(len(content), 0.0)
+        return httpx.Response(record["status"], headers=record["headers"], content=content, request=request)
+
+
+def open_fetcher(
+    scheduler: HostScheduler,
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    cache: Optional[ResponseCache] = None,
+    host_timeouts: Optional[HostTimeouts] = None,
+) -> Fetcher:
+    if replay:
+        return ReplayFetcher.from_file(replay)  # No politeness delays, nothing goes to the hosts, no cache
+    if record:
+        return RecordingFetcher(record, scheduler=scheduler, cache=cache, host_timeouts=host_timeouts)
+    return Fetcher(scheduler=scheduler, cache=cache, host_timeouts=host_timeouts)
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+from .trace import span
+
+logger = logging.getLogger(__name__)
+
+
+class HostLimit(NamedTuple):
+    min_interval: float = 0.0  # seconds between the starts of two requests
+    max_concurrent: int = 8
+
+
+class _HostState:
+    def __init__(self, limit: HostLimit) -> None:
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit.max_concurrent)
+        self.next_start = 0.0
+
+
+class HostScheduler:
+    """Keeps requests to every host polite (spacing and concurrency) without
+    blocking the requests that go to other hosts"""
+
+    def __init__(self, limits: Optional[Dict[str, HostLimit]] = None, default: HostLimit = HostLimit()) -> None:
+        self.limits = dict(limits or {})
+        self.default = default
+        self.waited: Dict[str, float] = defaultdict(float)
+        self._hosts: Dict[str, _HostState] = {}
+
+    def domain_for(self, host: str) -> str:
+        """The limited domain the host belongs to, the host itself if it has no limit of its own.
+        "aliveproxy.com" also covers "www.aliveproxy.com" and "community.aliveproxy.com", they share one budget"""
+        parts = host.split(".")
+        for i in range(len(parts) - 1):
+            domain = ".".join(parts[i:])
+            if domain in self.limits:
+                return domain
+        return host
+
+    def limit_for(self, host: str) -> HostLimit:
+        return self.limits.get(self.domain_for(host), self.default)
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        host = self.domain_for((urlparse(url).hostname or "").lower())
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(self.limit_for(host))
+        async with state.semaphore:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            # The start time is reserved before sleeping, so waiters keep their order
+            start = max(now, state.next_start)
+            state.next_start = start + state.limit.min_interval
+            if start > now:
+                self.waited[host] += start - now
+                with span("polite wait", "wait", host=host):
+                    await asyncio.sleep(start - now)
+            yield
+
+    @property
+    def total_waited(self) -> float:
+        return sum(self.waited.values())
+
+    def report(self) -> None:
+        for host, waited in sorted(self.waited.items(), key=lambda item: -item[1]):
+            logger.debug(f"Waited {waited:.2f} sec before requests to {host}")
+        logger.info(f"Politeness delays took {self.total_waited:.2f} sec over {len(self.waited)} hosts")
+
+
+def parse_host_limit(value: str) -> Tuple[str, HostLimit]:
+    """Parses the cli value HOST=INTERVAL[:CONCURRENCY]"""
+    host, _, limit = value.partition("=")
+    interval, _, concurrent = limit.partition(":")
+    if not host or not interval:
+        raise ValueError(f"Expected HOST=INTERVAL[:CONCURRENCY], got {value!r}")
+    return host.lower(), HostLimit(float(interval), int(concurrent) if concurrent else HostLimit().max_concurrent)
@@ -0,0 +1,152 @@
+import logging
+import sqlite3
+from time import time
+from typing import Iterable, List, Optional, Tuple
+
+from .packed import pack_proxy, unpack_proxy
+from .proxies_manipulation import prepare_proxy
+from .proxy_checker import CheckResult
+
+logger = logging.getLogger(__name__)
+
+_schema = """
+CREATE TABLE IF NOT EXISTS proxies (
+    proxy INTEGER PRIMARY KEY,  -- (ip << 16) | port, see tools/packed.py
+    source TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    last_checked REAL,
+    last_alive REAL,
+    checks INTEGER NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0,
+    fail_streak INTEGER NOT NULL DEFAULT 0,
+    latency REAL,
+    country TEXT,
+    protocols TEXT,  -- comma separated, known if they were detected
+    anonymity TEXT
+);
+CREATE INDEX IF NOT EXISTS proxies_last_checked ON proxies (last_checked);
+CREATE INDEX IF NOT EXISTS proxies_last_alive ON proxies (last_alive);
+"""
+# Old sqlite builds allow only 999 variables in one statement
+_batch = 900
+
+
+class ProxyStore:
+    """SQLite history of every proxy: when it was seen, where from and how its checks went"""
+
+    def __init__(
+        self,
+        path: str,
+        stale_after: float = 3600,
+        max_failures: int = 3,
+        retry_after: float = 24 * 3600,
+    ) -> None:
+        self.path = path
+        self.stale_after = stale_after  # results older than this are checked again
+        self.max_failures = max_failures  # after so many failures in a row ...
+        self.retry_after = retry_after  # ... the proxy waits this long for a new check
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_schema)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(proxies)")}
+        for column in ("protocols", "anonymity"):
+            if column not in columns:  # A history of an older version
+                self.connection.execute(f"ALTER TABLE proxies ADD COLUMN {column} TEXT")
+        self._results: List[CheckResult] = []
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+    def record_seen(self, proxies: Iterable[int], source: str, now: Optional[float] = None) -> None:
+        now = time() if now is None else now
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO proxies (proxy, source, first_seen, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (proxy) DO UPDATE SET last_seen = excluded.last_seen",
+                ((proxy, source, now, now) for proxy in proxies),
+            )
+
+    def triage(self, proxies: Iterable[int], now: Optional[float] = None) -> Tuple[List[int], List[CheckResult]]:
+        """Splits proxies into ones that need a check and fresh known good results,
+        recently failed proxies are dropped"""
+        now = time() if now is None else now
+        proxies = list(proxies)
+        rows = {}
+        for i in range(0, len(proxies), _batch):
+            chunk = proxies[i : i + _batch]
+            rows.update(
+                (row[0], row[1:])
+                for row in self.connection.execute(
+                    "SELECT proxy, last_checked, fail_streak, latency, country, protocols, anonymity FROM proxies "
+                    f"WHERE proxy IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+            )
+        to_check, known_good = [], []
+        for proxy in proxies:
+            last_checked, fail_streak, *known = rows.get(proxy, (None, 0, None, None, None, None))
+            age = now - last_checked if last_checked is not None else None
+            if age is None:
+                to_check.append(proxy)
+            elif fail_streak >= self.max_failures and age < self.retry_after:
+                continue
+            elif age >= self.stale_after:
+                to_check.append(proxy)
+            elif fail_streak == 0:
+                known_good.append(self._known_result(proxy, *known))
+        return to_check, known_good
+
+    @staticmethod
+    def _known_result(
+        proxy: int,
+        latency: Optional[float],
+        country: Optional[str],
+        protocols: Optional[str],
+        anonymity: Optional[str],
+    ) -> CheckResult:
+        return CheckResult(
+            prepare_proxy(unpack_proxy(proxy)),
+            alive=True,
+            latency=latency,
+            country=country,
+            successes=1,
+            protocols=tuple(protocols.split(",")) if protocols else (),
+            anonymity=anonymity,
+        )
+
+    def record_result(self, result: CheckResult) -> None:
+        self._results.append(result)
+        if len(self._results) >= _batch:
+            self.flush()
+
+    def flush(self, now: Optional[float] = None) -> None:
+        if not self._results:
+            return
+        now = time() if now is None else now
+        rows = [
+            {
+                "now": now,
+                "alive": int(result.alive),
+                "latency": result.latency,
+                "country": result.country,
+                "protocols": ",".join(result.protocols) or None,
+                "anonymity": result.anonymity,
+                "proxy": proxy,
+            }
+            for proxy, result in ((pack_proxy(result.proxy), result) for result in self._results)
+            if proxy is not None
+        ]
+        self._results = []
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE proxies SET last_checked = :now, checks = checks + 1, successes = successes + :alive, "
+                "fail_streak = CASE WHEN :alive THEN 0 ELSE fail_streak + 1 END, "
+                "last_alive = CASE WHEN :alive THEN :now ELSE last_alive END, "
+                "latency = CASE WHEN :alive THEN :latency ELSE latency END, "
+                "country = coalesce(:country, country), "
+                "protocols = CASE WHEN :alive THEN coalesce(:protocols, protocols) ELSE protocols END, "
+                "anonymity = CASE WHEN :alive THEN coalesce(:anonymity, anonymity) ELSE anonymity END "
+                "WHERE proxy = :proxy",
+                rows,
+            )
@@ -0,0 +1,136 @@
+import asyncio
+import heapq
+import json
+import logging
+import os
+import threading
+from time import perf_counter_ns
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+# Rows of threads come after the rows of tasks
+_first_thread_row = 100000
+
+
+class Tracer:
+    """Spans in the Chrome trace event format (Perfetto, chrome://tracing).
+    Every asyncio task gets a row ("lane") while it runs, rows of finished tasks are reused,
+    so thousands of short checks take as many rows as were in flight at once.
+    Threads get a row each"""
+
+    def __init__(self) -> None:
+        self.pid = os.getpid()
+        self.events: List[Dict[str, Any]] = []
+        self._origin = perf_counter_ns()
+        self._lanes: Dict["asyncio.Task[Any]", int] = {}
+        self._free: List[int] = []
+        self._lane_count = 0
+        self._threads: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _name_row(self, tid: int, name: str) -> None:
+        self.events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}})
+        self.events.append(
+            {"name": "thread_sort_index", "ph": "M", "pid": self.pid, "tid": tid, "args": {"sort_index": tid}}
+        )
+
+    def _release(self, task: "asyncio.Task[Any]") -> None:
+        heapq.heappush(self._free, self._lanes.pop(task))
+
+    def row(self) -> Tuple[int, Optional["asyncio.Task[Any]"]]:
+        """The row and the running task, or the row of the thread outside of asyncio"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is None:
+            ident = threading.get_ident()
+            with self._lock:
+                if ident not in self._threads:
+                    self._threads[ident] = _first_thread_row + len(self._threads)
+                    self._name_row(self._threads[ident], threading.current_thread().name)
+            return self._threads[ident], None
+        lane = self._lanes.get(task)
+        if lane is None:
+            if self._free:
+                lane = heapq.heappop(self._free)
+            else:
+                self._lane_count += 1
+                lane = self._lane_count
+                self._name_row(lane, f"tasks {lane}")
+            self._lanes[task] = lane
+            task.add_done_callback(self._release)
+        return lane, task
+
+    def complete(self, name: str, category: str, start: int, end: int, tid: int, args: Dict[str, Any]) -> None:
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": (start - self._origin) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": self.pid,
+            "tid": tid,
+            "args": args,
+        }
+        self.events.append(event)
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+        logger.info(f"{len(self.events)} trace events were written to {path}")
+
+
+_tracer: Optional[Tracer] = None
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "category", "args", "start", "tid")
+
+    def __init__(self, tracer: Tracer, name: str, category: str, args: Dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self) -> None:
+        self.tid, task = self.tracer.row()
+        if task is not None:
+            self.args["task"] = task.get_name()
+        self.start = perf_counter_ns()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.tracer.complete(self.name, self.category, self.start, perf_counter_ns(), self.tid, self.args)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_no_span = _NoSpan()
+
+
+def span(name: str, category: str, **args: Any) -> Any:
+    """A context manager that records the time of its block, nothing at all while tracing is off"""
+    if _tracer is None:
+        return _no_span
+    return _Span(_tracer, name, category, args)
+
+
+def start_tracing() -> Tracer:
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing(path: Optional[str] = None) -> None:
+    global _tracer
+    if _tracer is not None and path:
+        _tracer.write(path)
+    _tracer = None
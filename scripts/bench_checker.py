@@ -0,0 +1,129 @@
+"""Runs the checkers against a local farm of fake proxies and a local judge, no network needed.
+
+python scripts/bench_checker.py [--size 2000] [--timeout 3] [--workers 200] [--other-protocols 0] [--json report.json]
+
+The farm mixes healthy, slow, blackholed, refusing, lying and resetting proxies
+(scripts/farm.py), so every verdict of the checker can be compared with the truth.
+--other-protocols adds CONNECT only, SOCKS4 and SOCKS5 proxies: dead for the plain http checks,
+async-detect has to find what each of them speaks.
+Every mode runs in a fresh process: peak memory is the max RSS of that process only.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import resource
+from statistics import quantiles
+from time import perf_counter
+from typing import Any, Dict, List
+
+from farm import scaled_mix, speaks, start_farm_process, works
+
+from proxy_machine.pipeline import probe_backends
+from proxy_machine.tools.judges import JudgePool
+from proxy_machine.tools.prefilter import raise_open_files_limit
+from proxy_machine.tools.proxy_checker import CheckResult, iter_checking_async, run_checking_results
+
+modes = ("async-httpx", "async-raw", "async-detect", "threads")
+
+
+async def check_async(proxies: List[str], backend: str, judge_url: str, workers: int, timeout: float):
+    probe = JudgePool([judge_url]).wrap(probe_backends[backend])
+    return [result async for result in iter_checking_async(proxies, workers, timeout, probe=probe)]
+
+
+def run_mode(mode: str, options: Dict[str, Any], report: "multiprocessing.Queue[Dict[str, Any]]") -> None:
+    raise_open_files_limit(4 * options["workers"] + 1024)
+    proxies, judge_url = list(options["proxies"]), options["judge_url"]
+    workers, timeout = options["workers"], options["timeout"]
+    start = perf_counter()
+    if mode == "threads":
+        results: List[CheckResult] = run_checking_results(proxies, workers, judges=[judge_url], check_timeout=timeout)
+    else:
+        results = asyncio.run(check_async(proxies, mode.split("-")[1], judge_url, workers, timeout))
+    elapsed = perf_counter() - start
+    latencies = sorted(result.latency for result in results if result.alive and result.latency is not None)
+    percentiles = quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99 or [float("nan")] * 99
+    if mode == "async-detect":
+        spoken = {
+            proxy: speaks(behaviour, options["slow_delay"], timeout) for proxy, behaviour in options["proxies"].items()
+        }
+        truth = {proxy: bool(protocols) for proxy, protocols in spoken.items()}
+    else:
+        truth = {
+            proxy: works(behaviour, options["slow_delay"], timeout) for proxy, behaviour in options["proxies"].items()
+        }
+    right = sum(result.alive == truth[result.proxy] for result in results)
+    protocol_report = {}
+    if mode == "async-detect":
+        protocol_report["protocol_accuracy"] = sum(
+            tuple(result.protocols) == spoken[result.proxy] for result in results
+        ) / len(results)
+    report.put(
+        {
+            "mode": mode,
+            "checks": len(results),
+            "seconds": elapsed,
+            "checks_per_second": len(results) / elapsed,
+            "p50": percentiles[49],
+            "p99": percentiles[98],
+            "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "accuracy": right / len(results),
+            "false_positives": sum(result.alive and not truth[result.proxy] for result in results),
+            "false_negatives": sum(not result.alive and truth[result.proxy] for result in results),
+            **protocol_report,
+        }
+    )
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("--size", default=2000, type=int, help="Fake proxies in the farm")
+    argparser.add_argument("--timeout", default=3.0, type=float, help="Check timeout, blackholes cost this much")
+    argparser.add_argument("--workers", default=200, type=int, help="Simultaneous checks (threads for threads)")
+    argparser.add_argument("--slow-delay", default=1.0, type=float, help="Delay of the slow proxies")
+    argparser.add_argument("--other-protocols", default=0, type=int, help="Proxies of every other protocol")
+    argparser.add_argument("--mode", default=[], action="append", choices=modes, help="Default all modes")
+    argparser.add_argument("--json", default=None, help="Also write the report to this file")
+    args = argparser.parse_args()
+
+    mix = scaled_mix(args.size)
+    if args.other_protocols:
+        mix.update(dict.fromkeys(("tunnel", "socks4", "socks5"), args.other_protocols))
+    farm, proxies, judge_url = start_farm_process(mix, args.slow_delay)
+    mix_text = ", ".join(f"{count} {behaviour}" for behaviour, count in mix.items())
+    print(f"{len(proxies)} fake proxies ({mix_text}), timeout {args.timeout} s, {args.workers} at once")
+    options = {
+        "proxies": proxies,
+        "judge_url": judge_url,
+        "workers": args.workers,
+        "timeout": args.timeout,
+        "slow_delay": args.slow_delay,
+    }
+    context = multiprocessing.get_context("spawn")
+    reports = []
+    try:
+        for mode in args.mode or modes:
+            queue: "multiprocessing.Queue[Dict[str, Any]]" = context.Queue()
+            process = context.Process(target=run_mode, args=(mode, options, queue))
+            process.start()
+            report = queue.get()
+            process.join()
+            reports.append(report)
+            print(
+                f"  {mode:>12}: {report['checks_per_second']:7.0f} checks/s  "
+                f"p50 {report['p50'] * 1000:6.1f} ms  p99 {report['p99'] * 1000:6.1f} ms  "
+                f"peak {report['peak_rss_mib']:6.1f} MiB  accuracy {report['accuracy']:6.1%}  "
+                f"({report['false_positives']} false positives, {report['false_negatives']} false negatives)"
+                + (f"  protocols {report['protocol_accuracy']:6.1%}" if "protocol_accuracy" in report else "")
+            )
+    finally:
+        farm.terminate()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"options": {**options, "proxies": len(proxies)}, "reports": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Compares tools.extract with the regex-over-text and BeautifulSoup parsing it replaced.
+
+python scripts/bench_extract.py                 # synthetic pages
+python scripts/bench_extract.py page.html ...   # recorded pages
+"""
+
+import random
+import sys
+from pathlib import Path
+from timeit import repeat
+from typing import Callable, Dict, Set
+
+from bs4 import BeautifulSoup
+
+from proxy_machine.tools.extract import ProxyExtractor, extract_proxies, table_slice
+from proxy_machine.tools.proxies_manipulation import parse_proxies
+
+
+def random_proxy(rnd: random.Random) -> str:
+    ip = ".".join(str(rnd.randint(1, 223 if n == 0 else 254)) for n in range(4))
+    return f"{ip}:{rnd.randint(80, 9999)}"
+
+
+# Indented like the pages of the sources
+row = """
+      <tr>
+        <td class='t'>{}</td>
+        <td>{}</td>
+        <td>
+          <span>Country</span>
+        </td>
+        <td>HTTP</td>
+        <td>1 min</td>
+      </tr>"""
+
+
+def synthetic_pages() -> Dict[str, bytes]:
+    rnd = random.Random(1)
+    plain = "\n".join(f"{random_proxy(rnd)} US-H +" for _ in range(30000)).encode()
+    rows = "".join(row.format(*random_proxy(rnd).split(":")) for _ in range(500))
+    filler = "<div class='menu'>" + "<a href='/x'>link</a>" * 2000 + "</div>"
+    cells = f"<html><body>{filler}<table><tr><th>IP</th><th>Port</th></tr>{rows}</table></body></html>".encode()
+    return {"plain list": plain, "table cells": cells}
+
+
+def old_text_regex(content: bytes) -> Set[str]:
+    return parse_proxies(content.decode("utf-8", "replace"))
+
+
+def old_soup_cells(content: bytes) -> Set[str]:
+    proxies = set()
+    soup = BeautifulSoup(content, "lxml")
+    for tr in soup.find("table").find_all("tr")[1:]:
+        tds = tr.find_all("td")
+        proxies.add(f"{tds[0].text}:{tds[1].text}")
+    return proxies
+
+
+def new_extract(content: bytes) -> Set[str]:
+    return extract_proxies(table_slice(content) or content)
+
+
+def streamed_extract(content: bytes, chunk_size: int = 16384) -> Set[str]:
+    extractor = ProxyExtractor()
+    proxies = set()
+    for start in range(0, len(content), chunk_size):
+        proxies.update(extractor.feed(content[start : start + chunk_size]))
+    proxies.update(extractor.close())
+    return proxies
+
+
+def bench(name: str, content: bytes) -> None:
+    candidates: Dict[str, Callable[[bytes], Set[str]]] = {
+        "extract": new_extract,
+        "streamed": streamed_extract,
+        "text regex": old_text_regex,
+    }
+    if b"<table" in content:
+        candidates["BeautifulSoup"] = old_soup_cells
+    print(f"{name} ({len(content) / 1024:.0f} KiB)")
+    for label, parse in candidates.items():
+        try:
+            found = len(parse(content))
+        except Exception as e:
+            print(f"  {label:>14}: failed with {e!r}")
+            continue
+        best = min(repeat(lambda: parse(content), number=3, repeat=3)) / 3
+        print(f"  {label:>14}: {best * 1000:8.2f} ms  {len(content) / best / 2 ** 20:8.1f} MiB/s  {found} proxies")
+
+
+def main() -> None:
+    if len(sys.argv) > 1:
+        pages = {path: Path(path).read_bytes() for path in sys.argv[1:]}
+    else:
+        pages = synthetic_pages()
+    for name, content in pages.items():
+        bench(name, content)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""Runs the rotating forward proxy in front of a local farm of fake proxies, no network needed.
+
+python scripts/bench_forward.py [--size 200] [--requests 5000] [--concurrency 200] [--json report.json]
+
+Every proxy of the farm is put into the pool as if its last check passed, so the blackholed,
+refusing, resetting and lying ones stand for members that broke since: the forward proxy
+has to retry their requests on other members and eject them. The same load sent straight to one
+healthy fake proxy ("direct") shows the latency the forward proxy adds.
+The forward proxy runs in its own process, the clients in this one.
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+from statistics import quantiles
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from farm import default_mix, scaled_mix, start_farm_process
+
+from proxy_machine.tools.forward import ForwardProxy
+from proxy_machine.tools.pool import ProxyPool
+from proxy_machine.tools.prefilter import raise_open_files_limit
+from proxy_machine.tools.proxy_checker import CheckResult
+
+
+def serve_forward(
+    proxies: List[str],
+    options: Dict[str, Any],
+    ready: "multiprocessing.Queue[Any]",
+    stop: "multiprocessing.Queue[Any]",
+) -> None:
+    raise_open_files_limit(4 * options["concurrency"] + 1024)
+
+    async def serve() -> None:
+        pool = ProxyPool()
+        pool.offer(proxies, "farm")
+        for proxy in proxies:
+            pool.record(CheckResult(proxy, alive=True, latency=0.01))
+        forward = ForwardProxy(pool, options["retries"], options["eject_after"], options["upstream_timeout"])
+        server = await forward.start("127.0.0.1", 0)
+        ready.put(server.sockets[0].getsockname()[1])
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, stop.get)
+        server.close()
+        ready.put(dict(forward.stats))
+
+    asyncio.run(serve())
+
+
+async def request(proxy_port: int, judge_url: str, tunnel: bool) -> Tuple[float, str]:
+    """Seconds and outcome of one request to the judge through the proxy on `proxy_port`"""
+    judge = urlsplit(judge_url)
+    start = perf_counter()
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", proxy_port)
+    except OSError:
+        return perf_counter() - start, "error"
+    try:
+        if tunnel:
+            writer.write(b"CONNECT %s HTTP/1.1\r\nHost: %s\r\n\r\n" % (judge.netloc.encode(), judge.netloc.encode()))
+            reply = await reader.readuntil(b"\r\n\r\n")
+            if not reply.startswith(b"HTTP/1.1 200"):
+                return perf_counter() - start, "bad_gateway" if b" 502 " in reply else "error"
+            writer.write(b"GET / HTTP/1.1\r\nHost: %s\r\nConnection: close\r\n\r\n" % judge.netloc.encode())
+        else:
+            writer.write(b"GET %s HTTP/1.1\r\nHost: %s\r\n\r\n" % (judge_url.encode(), judge.netloc.encode()))
+        answer = await reader.read()
+    except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        return perf_counter() - start, "error"
+    finally:
+        writer.close()
+    if b" 502 " in answer.partition(b"\r\n")[0]:
+        return perf_counter() - start, "bad_gateway"
+    # Only the judge knows our ip, lying proxies make one up
+    return perf_counter() - start, "ok" if b'"ip": "127.0.0.1"' in answer else "wrong"
+
+
+async def load(proxy_port: int, judge_url: str, tunnel: bool, count: int, concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one() -> Tuple[float, str]:
+        async with semaphore:
+            return await request(proxy_port, judge_url, tunnel)
+
+    start = perf_counter()
+    results = await asyncio.gather(*(one() for _ in range(count)))
+    elapsed = perf_counter() - start
+    latencies = sorted(seconds for seconds, outcome in results if outcome == "ok")
+    percentiles = quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99 or [float("nan")] * 99
+    outcomes: Dict[str, int] = {}
+    for _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    return {
+        "requests": count,
+        "seconds": elapsed,
+        "requests_per_second": count / elapsed,
+        "p50": percentiles[49],
+        "p99": percentiles[98],
+        "outcomes": outcomes,
+    }
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("--size", default=200, type=int, help="Fake proxies in the farm")
+    argparser.add_argument("--requests", default=5000, type=int, help="Requests of every mode")
+    argparser.add_argument("--concurrency", default=200, type=int, help="Client connections at once")
+    argparser.add_argument("--retries", default=2, type=int)
+    argparser.add_argument("--eject-after", default=3, type=int)
+    argparser.add_argument("--upstream-timeout", default=2.0, type=float, help="Blackholed members cost this much")
+    argparser.add_argument("--json", default=None, help="Also write the report to this file")
+    args = argparser.parse_args()
+    raise_open_files_limit(4 * args.concurrency + 1024)
+
+    mix = scaled_mix(args.size)
+    farm, proxies, judge_url = start_farm_process(mix, 0.2)
+    mix_text = ", ".join(f"{mix[behaviour]} {behaviour}" for behaviour in default_mix)
+    print(f"{len(proxies)} fake proxies in the pool ({mix_text}), {args.concurrency} clients at once")
+    options = {**vars(args), "size": len(proxies)}
+    context = multiprocessing.get_context("spawn")
+    ready: "multiprocessing.Queue[Any]" = context.Queue()
+    stop: "multiprocessing.Queue[Any]" = context.Queue()
+    server = context.Process(target=serve_forward, args=(list(proxies), options, ready, stop), daemon=True)
+    server.start()
+    forward_port = ready.get()
+    healthy = next(proxy for proxy, behaviour in proxies.items() if behaviour == "healthy")
+    reports: Dict[str, Any] = {}
+    stats: Optional[Dict[str, int]] = None
+    try:
+        for mode, port, tunnel in (
+            ("direct", int(healthy.rpartition(":")[2]), False),
+            ("forward-http", forward_port, False),
+            ("forward-connect", forward_port, True),
+        ):
+            report = asyncio.run(load(port, judge_url, tunnel, args.requests, args.concurrency))
+            reports[mode] = report
+            print(
+                f"  {mode:>15}: {report['requests_per_second']:7.0f} requests/s  "
+                f"p50 {report['p50'] * 1000:6.1f} ms  p99 {report['p99'] * 1000:7.1f} ms  {report['outcomes']}"
+            )
+        stop.put(None)
+        stats = ready.get()
+        print(
+            f"  forward proxy: {stats.get('retries', 0)} retries, {stats.get('ejected', 0)} members ejected, "
+            f"{stats.get('bad_gateway', 0)} requests without a working member"
+        )
+        added = reports["forward-http"]["p50"] - reports["direct"]["p50"]
+        print(f"  added latency at p50: {added * 1000:.1f} ms")
+    finally:
+        server.terminate()
+        farm.terminate()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"options": options, "reports": reports, "forward": stats}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Looks up the country and ASN of scraped proxies in a geo database, no network needed.
+
+python scripts/bench_geo.py [--ranges 500000] [--proxies 100000] [--db FILE] [--json report.json]
+
+Without --db a database of random ranges in the shape of iptoasn.com's ip2asn-v4.tsv is built first.
+The proxies are random too, as a ProxyArray like the pipeline has them. The time is that of one batch
+lookup on a freshly mapped file, with numpy if it is installed and with the array module.
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+from time import perf_counter
+from typing import Any, Dict
+
+from proxy_machine.tools import geo
+from proxy_machine.tools.geo import GeoDB, build_geo_db
+from proxy_machine.tools.packed import ProxyArray
+
+countries = ("US", "DE", "RU", "CN", "BR", "IN", "ID", "FR", "GB", "NL")
+
+
+def random_ranges(path: str, count: int) -> None:
+    bounds = sorted(random.sample(range(1 << 24, 224 << 24), 2 * count))
+    with open(path, "w") as f:
+        for first, last in zip(bounds[::2], bounds[1::2]):
+            address = [".".join(str(ip >> shift & 255) for shift in (24, 16, 8, 0)) for ip in (first, last)]
+            asn = random.randrange(1, 400000)
+            f.write(f"{address[0]}\t{address[1]}\t{asn}\t{random.choice(countries)}\tAS{asn}\n")
+
+
+def measure(path: str, proxies: ProxyArray) -> Dict[str, Any]:
+    start = perf_counter()
+    db = GeoDB(path)
+    opened = perf_counter() - start
+    start = perf_counter()
+    locations = db.lookup(proxies)
+    elapsed = perf_counter() - start
+    db.close()
+    return {
+        "open_seconds": opened,
+        "lookup_seconds": elapsed,
+        "lookups_per_second": len(proxies) / elapsed,
+        "located": sum(country is not None for country, _ in locations),
+    }
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("--ranges", default=500000, type=int, help="Ranges of the generated database")
+    argparser.add_argument("--proxies", default=100000, type=int, help="Proxies to locate")
+    argparser.add_argument("--db", default=None, help="A database made by the geo-db command instead")
+    argparser.add_argument("--json", default=None, help="Also write the report to this file")
+    args = argparser.parse_args()
+
+    proxies = ProxyArray(random.randrange(1 << 40, 224 << 40) for _ in range(args.proxies))
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.db
+        if path is None:
+            source, path = os.path.join(directory, "ranges.tsv"), os.path.join(directory, "geo.db")
+            random_ranges(source, args.ranges)
+            start = perf_counter()
+            build_geo_db([source], path)
+            print(f"{args.ranges} random ranges converted in {perf_counter() - start:.2f} sec")
+        reports = {}
+        numpy = geo.np
+        for mode in ("numpy", "array") if numpy is not None else ("array",):
+            geo.np = numpy if mode == "numpy" else None
+            report = reports[mode] = measure(path, proxies)
+            print(
+                f"  {mode:>6}: {len(proxies)} proxies in {report['lookup_seconds'] * 1000:7.1f} ms "
+                f"({report['lookups_per_second']:9.0f}/s), {report['located']} located, "
+                f"mapped in {report['open_seconds'] * 1000:.2f} ms"
+            )
+        geo.np = numpy
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"options": vars(args), "reports": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Checks per second of the httpx and the raw socket probe backends against a local fake proxy farm.
+
+python scripts/bench_probe.py [PROXIES] [CONCURRENCY] [PROCESSES]
+
+The farm runs in its own process, so the CPU time reported is the checker's only.
+With PROCESSES > 1 both backends also run in that many checker processes, there
+only checks per wall second are reported. The farm needs a core of its own too.
+"""
+
+import asyncio
+import multiprocessing
+import sys
+from time import perf_counter, process_time
+from typing import List
+
+from proxy_machine.pipeline import probe_backends
+from proxy_machine.tools.prefilter import raise_open_files_limit
+from proxy_machine.tools.processes import iter_checking_processes
+from proxy_machine.tools.proxy_checker import iter_checking_async
+
+judge_body = b'{"ip":"127.0.0.1","country":"Local","cc":"ZZ"}'
+judge_response = b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s" % (
+    len(judge_body),
+    judge_body,
+)
+
+
+async def answer_as_judge(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Every proxy of the farm answers the check itself, as if it forwarded it to the judge"""
+    try:
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(judge_response)
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def run_farm(count: int, ports: "multiprocessing.Queue[List[int]]") -> None:
+    async def serve() -> None:
+        servers = [await asyncio.start_server(answer_as_judge, "127.0.0.1", 0, backlog=1024) for _ in range(count)]
+        ports.put([server.sockets[0].getsockname()[1] for server in servers])
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+async def check_all(proxies: List[str], backend: str, concurrency: int, processes: int = 1) -> int:
+    alive = 0
+    if processes > 1:
+        checked = iter_checking_processes(proxies, processes, concurrency, probe=probe_backends[backend])
+    else:
+        checked = iter_checking_async(proxies, concurrency, probe=probe_backends[backend])
+    async for result in checked:
+        alive += result.alive
+    return alive
+
+
+def main() -> None:
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    processes = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+    raise_open_files_limit(2 * concurrency + 1024)
+    ports: "multiprocessing.Queue[List[int]]" = multiprocessing.Queue()
+    farm = multiprocessing.Process(target=run_farm, args=(min(total, 500), ports), daemon=True)
+    farm.start()
+    farm_ports = ports.get()
+    # A proxy list has every proxy once, the farm has fewer ports, so checks reuse them in turn
+    proxies = [f"http://127.0.0.1:{farm_ports[i % len(farm_ports)]}" for i in range(total)]
+    print(f"{total} checks, {concurrency} at once")
+    try:
+        runs = [(backend, 1) for backend in probe_backends]
+        if processes > 1:
+            runs += [(backend, processes) for backend in probe_backends]
+        for backend, run_processes in runs:
+            wall, cpu = perf_counter(), process_time()
+            alive = asyncio.run(check_all(proxies, backend, concurrency, run_processes))
+            wall, cpu = perf_counter() - wall, process_time() - cpu
+            label = f"{backend} x{run_processes}" if run_processes > 1 else backend
+            per_cpu = f"{total / cpu:8.0f}" if run_processes == 1 else f"{'-':>8}"
+            print(
+                f"  {label:>9}: {total / wall:8.0f} checks/s  {per_cpu} checks per CPU second"
+                f"  {alive} alive  {wall:.2f} s"
+            )
+    finally:
+        farm.terminate()
+
+
+if __name__ == "__main__":
+    main()
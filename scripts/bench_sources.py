@@ -0,0 +1,75 @@
+"""Parse time, allocations and yield of every source, replayed offline from a recorded archive.
+
+python -m proxy_machine --record sources.jsonl.gz      # once, with the network
+python scripts/bench_sources.py sources.jsonl.gz [--repeat 5] [--source NAME ...]
+
+Every run gets a fresh replay, so sources that page through results see the same pages.
+Time is the best of --repeat runs without tracing; allocations come from one extra run under
+tracemalloc (peak traced memory and the number of blocks still allocated right before the run ends).
+Proxies are the set the source returned, valid ones are those that pack into an ip:port.
+"""
+
+import argparse
+import asyncio
+import logging
+import tracemalloc
+from time import perf_counter, process_time
+from typing import Any, Dict, List, Set, Tuple
+
+from proxy_machine.__main__ import load_proxies_func
+from proxy_machine.tools.packed import pack_proxy
+from proxy_machine.tools.replay import ReplayFetcher, load_archive
+
+
+async def replay(parser: Any, archive: Dict[str, List[Dict[str, Any]]]) -> Tuple[Set[str], int, float, float]:
+    """Proxies, misses, wall and cpu seconds of the parser alone, without setting up the client"""
+    async with ReplayFetcher(archive) as fetcher:
+        wall, cpu = perf_counter(), process_time()
+        proxies = await parser(fetcher)
+        wall, cpu = perf_counter() - wall, process_time() - cpu
+    return proxies, fetcher.misses, wall, cpu
+
+
+def traced(parser: Any, archive: Dict[str, List[Dict[str, Any]]]) -> Tuple[int, int]:
+    tracemalloc.start()
+    try:
+        asyncio.run(replay(parser, archive))
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        return tracemalloc.get_traced_memory()[1], blocks
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    argparser.add_argument("archive", help="Archive written by --record")
+    argparser.add_argument("--repeat", default=5, type=int, help="Timed runs per source, the best one counts")
+    argparser.add_argument("--source", default=[], action="append", help="Only these sources (function names)")
+    args = argparser.parse_args()
+    logging.disable(logging.CRITICAL)  # Sources log every failed page, the table is enough
+
+    archive = load_archive(args.archive)
+    print(f"{sum(map(len, archive.values()))} recorded responses")
+    print(f"{'source':>22} {'ms':>9} {'cpu ms':>9} {'peak KiB':>9} {'blocks':>8} {'proxies':>8} {'valid':>8} misses")
+    for parser in load_proxies_func():
+        if args.source and parser.__name__ not in args.source:
+            continue
+        best_wall = best_cpu = float("inf")
+        try:
+            for _ in range(args.repeat):
+                proxies, misses, wall, cpu = asyncio.run(replay(parser, archive))
+                best_wall, best_cpu = min(best_wall, wall), min(best_cpu, cpu)
+            peak, blocks = traced(parser, archive)
+        except Exception as e:
+            # Some sources raise instead of returning what they got, e.g. without their first response
+            print(f"{parser.__name__:>22} failed: {e}")
+            continue
+        valid = len({packed for packed in map(pack_proxy, proxies) if packed is not None})
+        print(
+            f"{parser.__name__:>22} {best_wall * 1000:9.2f} {best_cpu * 1000:9.2f} {peak / 1024:9.1f} "
+            f"{blocks:8d} {len(proxies):8d} {valid:8d} {misses}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import multiprocessing
+import socket
+import struct
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from proxy_machine.tools.judges import start_judge_server
+
+# What a fake proxy does with a check:
+#   healthy   forwards it to the judge
+#   slow      forwards it after `slow_delay` seconds
+#   blackhole accepts the connection and never answers
+#   refused   refuses the connection
+#   lying     answers itself, with an ip that isn't the proxy's
+#   reset     starts an answer and resets the connection in the middle
+#   failing   answers every request with 503, like a proxy whose own upstream is gone
+#   tunnel    only opens CONNECT tunnels, plain requests are refused with 405
+#   socks4    a SOCKS4a server, closes the connection on anything else
+#   socks5    a SOCKS5 server without authentication, closes the connection on anything else
+#   transparent  forwards it with the client address in X-Forwarded-For and a Via header
+#   anonymous    forwards it with a Via header only
+behaviours = (
+    "healthy",
+    "slow",
+    "blackhole",
+    "refused",
+    "lying",
+    "reset",
+    "failing",
+    "tunnel",
+    "socks4",
+    "socks5",
+    "transparent",
+    "anonymous",
+)
+# The loopback client and proxy ips are the same, so a transparent proxy tells a made up client address
+_added_headers = {
+    "transparent": [b"X-Forwarded-For: 198.51.100.23", b"Via: 1.1 farm"],
+    "anonymous": [b"Via: 1.1 farm"],
+}
+default_mix = {"healthy": 30, "slow": 10, "blackhole": 20, "refused": 25, "lying": 5, "reset": 10}
+
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def _forward(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, head: bytes, added: Sequence[bytes] = ()
+) -> None:
+    request_line, _, header_block = head.partition(b"\r\n")
+    method, target, version = request_line.split(b" ", 2)
+    if method == b"CONNECT":
+        host, _, port = target.decode().rpartition(":")
+        upstream_reader, upstream_writer = await asyncio.open_connection(host, int(port))
+        writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        await writer.drain()
+    else:
+        parts = urlsplit(target.decode())
+        upstream_reader, upstream_writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        kept = [
+            line
+            for line in header_block.split(b"\r\n")
+            if line and not line.lower().startswith((b"connection:", b"proxy-connection:"))
+        ]
+        kept.extend(added)
+        upstream_writer.write(
+            b"%s %s %s\r\n%s\r\nConnection: close\r\n\r\n" % (method, path.encode(), version, b"\r\n".join(kept))
+        )
+    await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+
+
+async def _socks(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, version: int) -> None:
+    if (await reader.readexactly(1))[0] != version:
+        return
+    if version == 5:
+        methods = await reader.readexactly((await reader.readexactly(1))[0])
+        if 0 not in methods:
+            writer.write(b"\x05\xff")
+            return
+        writer.write(b"\x05\x00")
+        _, _, _, address_type = await reader.readexactly(4)
+        if address_type == 1:
+            host = socket.inet_ntoa(await reader.readexactly(4))
+        else:
+            host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+        (port,) = struct.unpack(">H", await reader.readexactly(2))
+    else:
+        _, port, ip = struct.unpack(">BH4s", await reader.readexactly(7))
+        await reader.readuntil(b"\x00")  # User id
+        host = socket.inet_ntoa(ip)
+        if host.startswith("0.0.0."):  # SOCKS4a, the host name follows
+            host = (await reader.readuntil(b"\x00"))[:-1].decode()
+    upstream_reader, upstream_writer = await asyncio.open_connection(host, port)
+    bound = b"\x01\x7f\x00\x00\x01\x00\x00"
+    writer.write(b"\x05\x00\x00" + bound if version == 5 else b"\x00\x5a\x00\x00\x00\x00\x00\x00")
+    await writer.drain()
+    await asyncio.gather(_pipe(reader, upstream_writer), _pipe(upstream_reader, writer))
+
+
+def _proxy_handler(behaviour: str, slow_delay: float):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            if behaviour in ("socks4", "socks5"):
+                await _socks(reader, writer, int(behaviour[-1]))
+                return
+            head = await reader.readuntil(b"\r\n\r\n")
+            if behaviour == "tunnel" and not head.startswith(b"CONNECT "):
+                writer.write(b"HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+            elif behaviour == "blackhole":
+                while await reader.read(65536):  # Until the client gives up
+                    pass
+            elif behaviour == "lying":
+                body = json.dumps({"ip": "203.0.113.7", "cc": "ZZ"}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+                await writer.drain()
+            elif behaviour == "failing":
+                writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+            elif behaviour == "reset":
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\n{"ip": "12')
+                await writer.drain()
+                sock = writer.get_extra_info("socket")
+                # Linger 0: close sends RST instead of FIN
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            else:
+                if behaviour == "slow":
+                    await asyncio.sleep(slow_delay)
+                await _forward(reader, writer, head, _added_headers.get(behaviour, ()))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+def scaled_mix(size: int, mix: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """`size` proxies in the proportions of `mix`"""
+    mix = mix or default_mix
+    total = sum(mix.values())
+    return {behaviour: round(size * count / total) for behaviour, count in mix.items()}
+
+
+def works(behaviour: str, slow_delay: float, check_timeout: float) -> bool:
+    """The right verdict for a proxy: it forwards the check to the judge in time"""
+    return behaviour in ("healthy", "transparent", "anonymous") or behaviour == "slow" and slow_delay < check_timeout
+
+
+def speaks(behaviour: str, slow_delay: float, check_timeout: float) -> Tuple[str, ...]:
+    """The protocols a detecting check should find"""
+    if behaviour == "slow":
+        # The CONNECT comes after the plain request on another connection, and waits again
+        return ("http", "https")[: int(slow_delay < check_timeout) + int(2 * slow_delay < check_timeout)]
+    if behaviour in ("healthy", "transparent", "anonymous"):
+        return ("http", "https")
+    return {"tunnel": ("https",), "socks4": ("socks4",), "socks5": ("socks5",)}.get(behaviour, ())
+
+
+class ProxyFarm:
+    """Local fake proxies with a known behaviour each and a judge behind them,
+    so the checker can be measured without the network"""
+
+    def __init__(self, mix: Optional[Dict[str, int]] = None, slow_delay: float = 1.0, host: str = "127.0.0.1") -> None:
+        self.mix = dict(mix or default_mix)
+        unknown = set(self.mix) - set(behaviours)
+        if unknown:
+            raise ValueError(f"Unknown behaviours {', '.join(sorted(unknown))}")
+        self.slow_delay = slow_delay
+        self.host = host
+        self.proxies: Dict[str, str] = {}  # proxy url -> behaviour
+        self.judge_url = ""
+        self._servers: List[asyncio.AbstractServer] = []
+        self._reserved: List[socket.socket] = []
+
+    async def start(self) -> None:
+        judge = await start_judge_server(self.host, 0)
+        self._servers.append(judge)
+        self.judge_url = f"http://{self.host}:{judge.sockets[0].getsockname()[1]}/"
+        for behaviour, count in self.mix.items():
+            for _ in range(count):
+                if behaviour == "refused":
+                    # A bound socket that doesn't listen keeps the port and refuses connections
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.bind((self.host, 0))
+                    self._reserved.append(sock)
+                    port = sock.getsockname()[1]
+                else:
+                    server = await asyncio.start_server(
+                        _proxy_handler(behaviour, self.slow_delay), self.host, 0, backlog=1024
+                    )
+                    self._servers.append(server)
+                    port = server.sockets[0].getsockname()[1]
+                self.proxies[f"http://{self.host}:{port}"] = behaviour
+
+    async def stop(self) -> None:
+        for server in self._servers:
+            server.close()
+        for sock in self._reserved:
+            sock.close()
+
+
+def _serve_farm(
+    mix: Dict[str, int], slow_delay: float, ready: "multiprocessing.Queue[Tuple[Dict[str, str], str]]"
+) -> None:
+    async def serve() -> None:
+        farm = ProxyFarm(mix, slow_delay)
+        await farm.start()
+        ready.put((farm.proxies, farm.judge_url))
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+def start_farm_process(
+    mix: Optional[Dict[str, int]] = None, slow_delay: float = 1.0
+) -> Tuple[multiprocessing.process.BaseProcess, Dict[str, str], str]:
+    """Runs a ProxyFarm in another process, so it doesn't share the cpu time of the
+    measured process. Returns the process, the proxies with their behaviours and the judge url"""
+    context = multiprocessing.get_context("spawn")
+    ready: "multiprocessing.Queue[Tuple[Dict[str, str], str]]" = context.Queue()
+    process = context.Process(target=_serve_farm, args=(dict(mix or default_mix), slow_delay, ready), daemon=True)
+    process.start()
+    proxies, judge_url = ready.get()
+    return process, proxies, judge_url
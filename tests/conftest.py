@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The fake proxy farm of the benchmarks lives in scripts/
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
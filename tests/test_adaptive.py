@@ -0,0 +1,106 @@
+import asyncio
+from time import perf_counter
+
+import pytest
+
+from proxy_machine.tools.adaptive import AdaptiveTimeout, HostTimeouts
+from proxy_machine.tools.proxy_checker import CheckResult
+
+
+def latency_probe(latencies):
+    """A probe whose proxies answer after their latency, or time out if the deadline is shorter"""
+    deadlines = []
+
+    async def probe(proxy, check_timeout):
+        deadlines.append(check_timeout)
+        latency = latencies[proxy]
+        if latency > check_timeout:
+            return CheckResult(proxy, error="timeout")
+        return CheckResult(proxy, alive=True, latency=latency, successes=1)
+
+    return probe, deadlines
+
+
+def test_deadline_is_the_percentile_plus_margin_within_bounds():
+    adaptive = AdaptiveTimeout(percentile=95, margin=0.5, floor=0.5, warmup=30)
+    adaptive.latencies = [n / 100 for n in range(29)]
+    assert adaptive.learned_deadline(6) == 6  # Still warming up
+    adaptive.latencies = [n / 100 for n in range(1, 101)]
+    assert adaptive.learned_deadline(6) == pytest.approx(0.96 + 0.5)
+    assert adaptive.learned_deadline(1) == 1
+    adaptive = AdaptiveTimeout(percentile=95, margin=0, floor=0.5, warmup=30)
+    adaptive.latencies = [0.01] * 100
+    assert adaptive.learned_deadline(6) == 0.5
+
+
+def test_checks_converge_on_the_learned_deadline():
+    latencies = {f"http://10.0.{n // 250}.{n % 250}:80": 0.1 + n % 10 / 100 for n in range(200)}
+    latencies.update({f"http://10.1.0.{n}:80": 5.0 for n in range(40)})  # Alive, but slower than the deadline
+    probe, deadlines = latency_probe(latencies)
+    adaptive = AdaptiveTimeout(percentile=90, margin=0.1, floor=0.1, warmup=30, shadow_every=4)
+    adaptive.started = perf_counter() - 10  # The first checks had the whole timeout already
+    check = adaptive.wrap(probe)
+
+    async def run():
+        return [await check(proxy, 10) for proxy in latencies]
+
+    results = asyncio.run(run())
+    assert deadlines[:30] == [10] * 30
+    # The 90th percentile of the fast proxies
+    assert deadlines[200] == pytest.approx(0.19 + 0.1)
+    # Every 4th cut check of the slow proxies is checked again with the whole timeout and passes there,
+    # once they are more than a tenth of the successes the deadline takes them in
+    assert (adaptive.stats["tightened_timeouts"], adaptive.stats["shadow_checks"]) == (24, 6)
+    assert adaptive.false_negative_rate == 1.0
+    assert deadlines[-1] == adaptive.learned_deadline(10) == pytest.approx(5.0 + 0.1)
+    assert sum(result.alive for result in results) == 200 + 6 + 16
+
+
+def test_deadline_waits_for_the_first_checks():
+    adaptive = AdaptiveTimeout(warmup=1)
+    adaptive.latencies = [0.1]
+    assert adaptive.deadline(6) == 6  # Not started
+    adaptive.started = perf_counter()
+    assert adaptive.deadline(6) == 6  # The slow proxies of the start could still answer
+    adaptive.started -= 6
+    assert adaptive.deadline(6) == pytest.approx(0.6)
+
+
+def test_merge():
+    adaptive, other = AdaptiveTimeout(), AdaptiveTimeout()
+    adaptive.latencies = [0.1, 0.3]
+    other.latencies = [0.2]
+    other.stats.update(checks=3, tightened_timeouts=1)
+    adaptive.merge(other.counts())
+    assert adaptive.latencies == [0.1, 0.2, 0.3]
+    assert adaptive.stats["checks"] == 3
+
+
+def test_host_timeouts():
+    timeouts = HostTimeouts(window=5, factor=3, floor=0.5, min_samples=3)
+    url = "https://Example.com/list.txt"
+    for seconds in (0.2, 0.3):
+        timeouts.observe(url, seconds)
+    assert timeouts.timeout_for(url) is None
+    timeouts.observe("http://example.com/other", 0.1)
+    assert timeouts.timeout_for(url) == pytest.approx(0.9)
+    timeouts.missed(url, 0.9)
+    assert timeouts.timeout_for(url) == pytest.approx(2.7)
+    for _ in range(5):
+        timeouts.observe(url, 0.01)
+    assert timeouts.timeout_for(url) == 0.5  # The old durations left the window
+    assert timeouts.timeout_for("http://unknown.org/") is None
+
+
+def test_host_timeouts_are_kept_between_runs(tmp_path):
+    path = str(tmp_path / "fetch_history.json")
+    timeouts = HostTimeouts(path)
+    for seconds in (1.0, 1.5, 0.5):
+        timeouts.observe("https://example.com/", seconds)
+    timeouts.save()
+    loaded = HostTimeouts(path)
+    assert list(loaded.durations["example.com"]) == [1.0, 1.5, 0.5]
+    assert loaded.timeout_for("https://example.com/") == timeouts.timeout_for("https://example.com/") == 4.5
+    (tmp_path / "broken.json").write_text("{")
+    assert HostTimeouts(str(tmp_path / "broken.json")).durations == {}
+    assert HostTimeouts(str(tmp_path / "missing.json")).durations == {}
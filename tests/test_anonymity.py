@@ -0,0 +1,66 @@
+import pytest
+
+from proxy_machine.tools.proxy_checker import (
+    CheckResult,
+    WrongIpError,
+    anonymity_level,
+    combine_probes,
+    hides_enough,
+    judge_result,
+)
+
+proxy_ip, client_ip = "45.79.110.81", "203.0.113.7"
+
+
+def test_anonymity_level():
+    assert anonymity_level({"ip": proxy_ip}, proxy_ip, client_ip) is None  # No headers echoed
+    assert anonymity_level({"ip": proxy_ip, "headers": {"Host": "judge"}}, proxy_ip, client_ip) == "elite"
+    assert anonymity_level({"headers": {"X-Forwarded-For": client_ip}}, proxy_ip, client_ip) == "transparent"
+    # Our ip in any header, or in the chain httpbin puts into "origin"
+    assert anonymity_level({"headers": {"X-Custom": f"for {client_ip}"}}, proxy_ip, client_ip) == "transparent"
+    assert anonymity_level({"origin": f"{client_ip}, {proxy_ip}", "headers": {}}, proxy_ip, client_ip) == "transparent"
+    assert anonymity_level({"headers": {"Via": "1.1 squid"}}, proxy_ip, client_ip) == "anonymous"
+    assert anonymity_level({"headers": {"X-Forwarded-For": "unknown"}}, proxy_ip, client_ip) == "anonymous"
+    # Just the proxy ip comes from a load balancer in front of the judge
+    assert anonymity_level({"headers": {"X-Real-Ip": proxy_ip}}, proxy_ip, client_ip) == "elite"
+
+
+def test_judge_result_of_httpbin():
+    proxy = f"http://{proxy_ip}:8080"
+    transparent = {"origin": f"{client_ip}, {proxy_ip}", "headers": {"Host": "httpbin.org"}}
+    result = judge_result(proxy, transparent, 0.5, client_ip=client_ip)
+    assert (result.alive, result.anonymity) == (True, "transparent")
+    assert judge_result(proxy, {"origin": proxy_ip, "headers": {}}, 0.5, client_ip=client_ip).anonymity == "elite"
+    # An answer that didn't come through the proxy
+    with pytest.raises(WrongIpError):
+        judge_result(proxy, {"origin": f"{proxy_ip}, {client_ip}", "headers": {}}, 0.5, client_ip=client_ip)
+
+
+def test_anonymity_level_without_our_ip():
+    assert anonymity_level({"headers": {"X-Forwarded-For": "198.51.100.1"}}, proxy_ip) == "transparent"
+    assert anonymity_level({"headers": {"X-Custom": "198.51.100.1"}}, proxy_ip) == "elite"
+    assert anonymity_level({"headers": {"Proxy-Connection": "keep-alive"}}, proxy_ip) == "anonymous"
+
+
+def test_hides_enough():
+    assert hides_enough("elite", "anonymous")
+    assert hides_enough("anonymous", "anonymous")
+    assert not hides_enough("transparent", "anonymous")
+    assert not hides_enough(None, "transparent")
+
+
+def test_combine_probes():
+    proxy = "http://45.79.110.81:8080"
+    results = [
+        CheckResult(proxy, alive=True, latency=0.3, successes=1, anonymity="elite", country="DE"),
+        CheckResult(proxy, error="timeout"),
+        CheckResult(proxy, alive=True, latency=0.1, ttfb=0.05, successes=1, anonymity="anonymous"),
+        CheckResult(proxy, alive=True, latency=0.2, successes=1),
+    ]
+    combined = combine_probes(results)
+    assert (combined.latency, combined.ttfb, combined.connect_time) == (0.2, 0.05, None)
+    assert (combined.probes, combined.successes, combined.country) == (4, 3, "DE")
+    assert combined.anonymity == "anonymous"  # The least hidden level a probe saw
+    assert combined.score == 0.2 * 4 / 3
+    dead = [CheckResult(proxy, error="refused"), CheckResult(proxy, error="timeout")]
+    assert combine_probes(dead) is dead[0]
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from proxy_machine.tools.proxy_checker import iter_bounded
+
+
+class Work:
+    """Checks that take `delay` seconds, `slow` ones much longer,
+    counting how many run at once and how many got cancelled"""
+
+    def __init__(self, delay: float = 0.01, slow: float = 0.01) -> None:
+        self.delay, self.slow = delay, slow
+        self.running = self.most = self.cancelled = 0
+
+    async def __call__(self, item: str) -> str:
+        self.running += 1
+        self.most = max(self.most, self.running)
+        try:
+            await asyncio.sleep(self.delay if item == "0" else self.slow)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.running -= 1
+        return item
+
+
+async def produce(items):
+    for item in items:
+        await asyncio.sleep(0)
+        yield item
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_at_most_limit_in_flight(streamed):
+    items = [str(n) for n in range(20)]
+    work = Work()
+
+    async def run():
+        source = produce(items) if streamed else items
+        return [result async for result in iter_bounded(work, source, 4)]
+
+    assert sorted(asyncio.run(run())) == sorted(items)
+    assert work.most == 4
+
+
+@pytest.mark.parametrize("streamed", [False, True])
+def test_aclose_cancels_pending_checks(streamed):
+    items = [str(n) for n in range(20)]
+    work = Work(delay=0.05, slow=10)
+
+    async def run():
+        results = iter_bounded(work, produce(items) if streamed else items, 4)
+        first = await results.__anext__()
+        await results.aclose()
+        await asyncio.sleep(0)  # The cancelled checks get to run their handlers
+        return first, work.running, work.cancelled
+
+    assert asyncio.run(run()) == ("0", 0, 3)
@@ -0,0 +1,92 @@
+import asyncio
+from time import time
+
+import httpx
+import pytest
+
+from proxy_machine.tools.cache import ResponseCache, fresh_until
+from proxy_machine.tools.extract import extract_proxies
+from proxy_machine.tools.fetcher import Fetcher
+
+url = "https://raw.example/proxies.txt"
+body = b"45.79.110.81:8080\n103.216.82.20:6666\n"
+proxies = {"45.79.110.81:8080", "103.216.82.20:6666"}
+validators = {"etag": '"v1"', "last-modified": "Sun, 18 Oct 2026 08:00:00 GMT"}
+
+
+class Source:
+    """A static file that answers 304 to the validators of its body, with `cache_control`"""
+
+    def __init__(self, cache_control: str = "max-age=0") -> None:
+        self.cache_control = cache_control
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        headers = {**validators, "cache-control": self.cache_control}
+        if request.headers.get("if-none-match") == validators["etag"]:
+            return httpx.Response(304, headers=headers)
+        return httpx.Response(200, headers=headers, content=body)
+
+
+def get_static(cache, source, parse=extract_proxies):
+    async def run():
+        fetcher = Fetcher(cache=cache)
+        fetcher.client = httpx.AsyncClient(transport=httpx.MockTransport(source))
+        async with fetcher:
+            return await fetcher.get_static(url, parse)
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "cache"))
+
+
+def test_a_fresh_entry_is_served_without_a_request(cache):
+    source = Source("public, max-age=300")
+    assert get_static(cache, source) == proxies
+    assert get_static(cache, source) == proxies
+    assert len(source.requests) == 1
+    assert cache.load(url).fresh_until == pytest.approx(time() + 300, abs=5)
+
+
+def test_a_stale_entry_is_revalidated_and_a_304_reuses_it(cache):
+    source = Source()
+    assert get_static(cache, source) == proxies
+    parsed = []
+
+    def parse(content):
+        parsed.append(content)
+        return extract_proxies(content)
+
+    assert get_static(cache, source) == proxies
+    first, second = source.requests
+    assert "if-none-match" not in first.headers
+    assert (second.headers["if-none-match"], second.headers["if-modified-since"]) == (
+        validators["etag"],
+        validators["last-modified"],
+    )
+    # Another parser gets the cached body of the 304
+    assert get_static(cache, source, parse) == proxies
+    assert parsed == [body]
+
+
+def test_a_lost_body_is_asked_for_again(cache, tmp_path):
+    source = Source()
+    get_static(cache, source)
+    for lost in (tmp_path / "cache").glob("*.body"):
+        lost.unlink()
+    assert get_static(cache, source, lambda content: extract_proxies(content)) == proxies
+    assert [request.headers.get("if-none-match") for request in source.requests] == [None, '"v1"', None]
+    assert cache.body(url) == body
+
+
+def test_fresh_until():
+    assert fresh_until({"cache-control": "max-age=300"}, 1000) == 1300
+    assert fresh_until({"cache-control": "public, max-age=300", "age": "100"}, 1000) == 1200
+    assert fresh_until({"cache-control": "no-cache, max-age=300"}, 1000) is None
+    assert fresh_until({"expires": "Thu, 01 Jan 1970 00:20:00 GMT"}, 1000) == 1200
+    assert fresh_until({"expires": "0"}, 1000) is None
+    assert fresh_until({}, 1000) is None
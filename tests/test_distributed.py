@@ -0,0 +1,42 @@
+from proxy_machine.tools.distributed import Coordinator
+
+proxies = [f"10.0.0.{n}:80\n" for n in range(1, 6)]
+
+
+def test_leases_are_handed_out_until_done():
+    coordinator = Coordinator(proxies + proxies[:2], size=3, expire_after=60)
+    first = coordinator.lease(10, owner=1, now=0)
+    second = coordinator.lease(10, owner=2, now=0)
+    assert first["proxies"] == ["10.0.0.1:80", "10.0.0.2:80", "10.0.0.3:80"]  # At most `size`, without repeats
+    assert second["proxies"] == ["10.0.0.4:80", "10.0.0.5:80"]
+    assert coordinator.lease(10, owner=3, now=1) == {"wait": 1.0}
+    assert coordinator.report(first["lease"], [{"proxy": proxy} for proxy in first["proxies"]]) == {"ok": True}
+    assert coordinator.report(second["lease"], [{"proxy": "10.0.0.4:80", "alive": True}]) == {"ok": True}
+    # The proxy missing from the report is handed out again
+    third = coordinator.lease(10, owner=3, now=2)
+    assert third["proxies"] == ["10.0.0.5:80"]
+    coordinator.report(third["lease"], [{"proxy": "10.0.0.5:80"}])
+    assert coordinator.lease(10, owner=3, now=3) == {"done": True}
+    assert coordinator.finished
+    assert [result.proxy for result in coordinator.results if result.alive] == ["10.0.0.4:80"]
+    assert len(coordinator.results) == 5
+
+
+def test_an_expired_lease_goes_to_another_worker():
+    coordinator = Coordinator(proxies, size=2, expire_after=60)
+    late = coordinator.lease(2, owner=1, now=0)
+    coordinator.lease(2, owner=2, now=30)
+    reassigned = coordinator.lease(2, owner=3, now=60)
+    assert reassigned["proxies"] == late["proxies"]  # Before the proxies that waited in the queue
+    assert coordinator.report(late["lease"], [{"proxy": proxy} for proxy in late["proxies"]])["ok"] is False
+    assert coordinator.requeued == 2
+    assert coordinator.results == []
+
+
+def test_leases_of_a_disconnected_worker_go_back():
+    coordinator = Coordinator(proxies, size=2)
+    lost = coordinator.lease(2, owner=1, now=0)
+    kept = coordinator.lease(2, owner=2, now=0)
+    coordinator.release(1)
+    assert list(coordinator.leases) == [kept["lease"]]
+    assert coordinator.lease(5, owner=2, now=1)["proxies"] == lost["proxies"]
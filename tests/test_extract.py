@@ -0,0 +1,77 @@
+import asyncio
+from pathlib import Path
+
+import httpx
+import pytest
+
+from proxy_machine import otherproxies
+from proxy_machine.tools.extract import ProxyExtractor, extract_proxies, last_option_number, table_slice
+
+pages = Path(__file__).parent / "pages"
+
+
+class PageFetcher:
+    """Answers every request of a source with the same saved page"""
+
+    def __init__(self, content: bytes) -> None:
+        self.content = content
+
+    async def get(self, url: str, **options: object) -> httpx.Response:
+        return httpx.Response(200, content=self.content, request=httpx.Request("GET", url))
+
+
+@pytest.mark.parametrize(
+    "source, expected",
+    [
+        ("aliveproxy", {"45.79.110.81:8080", "103.216.82.20:6666"}),
+        ("community_aliveproxy", {"188.166.56.246:80", "51.158.68.133:8811"}),
+        ("hidemy", {"185.61.152.137:8080", "80.48.119.28:8080"}),
+        ("proxylistplus", {"103.152.112.162:80", "20.111.54.16:8123"}),
+        ("proxyhub", {"167.172.180.46:41370", "64.225.4.81:9993"}),
+        ("proxynova", {"177.93.44.53:999", "190.61.88.147:8080"}),
+    ],
+)
+def test_table_sources(source, expected):
+    fetcher = PageFetcher((pages / f"{source}.html").read_bytes())
+    assert asyncio.run(getattr(otherproxies, source)(fetcher)) == expected
+
+
+def test_plain_text():
+    content = b"45.79.110.81:8080 US-H +\n103.216.82.20:6666 IN-A-S!\n"
+    assert extract_proxies(content) == {"45.79.110.81:8080", "103.216.82.20:6666"}
+
+
+def test_plain_text_needs_a_colon():
+    content = b"Checked 45.79.110.81 8080 times\n1.1.1.1 - 53 ms\nversion 10.0.19041.1 2021"
+    assert extract_proxies(content) == set()
+
+
+def test_deeply_indented_cells():
+    indent = b"\n" + b" " * 200
+    content = b"<tr>" + indent + b"<td>45.79.110.81</td>" + indent + b"<td>" + indent + b"8080" + indent + b"</td>"
+    assert extract_proxies(content) == {"45.79.110.81:8080"}
+
+
+def test_table_slice_and_pager():
+    content = (pages / "proxylistplus.html").read_bytes()
+    assert table_slice(content, b'class="bg"').rstrip().endswith(b"</tr>")
+    assert table_slice(content, b"no such table") == b""
+    assert last_option_number(content) == 2
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096, 65536])
+def test_streamed_like_whole(chunk_size):
+    indent = b"\n" + b" " * 255
+    cells = b"<td>10.0.0.1</td>" + (indent + b"<td>") * 11 + b"3128</td>"  # as long as a match gets
+    content = b"".join((pages / page).read_bytes() for page in sorted(pages.iterdir())) * 4 + cells
+    content += b"\n".join(b"%d.%d.7.1:%d" % (n // 250, n % 250, 1000 + n) for n in range(3000))
+    extractor = ProxyExtractor()
+    streamed = []
+    for start in range(0, len(content), chunk_size):
+        streamed += extractor.feed(content[start : start + chunk_size])
+    streamed += extractor.close()
+    assert "10.0.0.1:3128" in streamed
+    whole = ProxyExtractor()
+    assert streamed == whole.feed(content) + whole.close()
+    assert set(streamed) == extract_proxies(content)
+    assert extractor.close() == []
@@ -0,0 +1,80 @@
+import asyncio
+import gzip
+
+import httpx
+import pytest
+
+from proxy_machine.tools.adaptive import HostTimeouts
+from proxy_machine.tools.fetcher import Fetcher
+from proxy_machine.tools.metrics import SourceMetrics, current_source
+
+text = b"45.79.110.81:8080\n" * 100
+packed = gzip.compress(text)
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """/list is gzipped, /old redirects to it, /slow never answers"""
+    path = (await reader.readuntil(b"\r\n\r\n")).split(b" ")[1]
+    if path == b"/slow":
+        await reader.read()  # until the client gives up
+    elif path == b"/old":
+        writer.write(b"HTTP/1.1 302 Found\r\nLocation: /list\r\nContent-Length: 0\r\n\r\n")
+    else:
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\nContent-Length: %d\r\n\r\n" % len(packed))
+        writer.write(packed)
+    await writer.drain()
+    writer.close()
+
+
+def serve(test):
+    async def run():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        base = "http://127.0.0.1:%d" % server.sockets[0].getsockname()[1]
+        metrics = SourceMetrics("local")
+        current_source.set(metrics)
+        try:
+            async with Fetcher(fetch_timeout=5) as fetcher:
+                await test(fetcher, base)
+        finally:
+            server.close()
+        return metrics
+
+    return asyncio.run(run())
+
+
+def test_gzip_is_decoded_and_measured_as_it_came():
+    async def test(fetcher, base):
+        r = await fetcher.get(base + "/list")
+        assert (r.status_code, r.content) == (200, text)
+
+    metrics = serve(test)
+    assert (metrics.requests, metrics.bytes) == (1, len(packed))
+    assert metrics.fetch_seconds > 0 and metrics.decompress_seconds > 0
+
+
+def test_redirects_are_followed():
+    async def test(fetcher, base):
+        r = await fetcher.get(base + "/old")
+        assert (r.status_code, r.content, str(r.url)) == (200, text, base + "/list")
+        assert [redirect.status_code for redirect in r.history] == [302]
+
+    serve(test)
+
+
+def test_timeout():
+    host_timeouts = HostTimeouts(floor=0.1)
+
+    async def test(fetcher, base):
+        with pytest.raises(httpx.TimeoutException):
+            await fetcher.get(base + "/slow", timeout=0.1)
+        # A learned timeout shorter than the one asked for is tried first and is lengthened when missed
+        fetcher.host_timeouts = host_timeouts
+        for _ in range(20):
+            host_timeouts.observe(base + "/list", 0.01)
+        learned = host_timeouts.timeout_for(base + "/slow")
+        with pytest.raises(httpx.TimeoutException):
+            await fetcher.get(base + "/slow", timeout=1)
+        assert host_timeouts.timeout_for(base + "/slow") > learned
+
+    metrics = serve(test)
+    assert (metrics.requests, metrics.failed_requests) == (2, 2)
@@ -0,0 +1,71 @@
+import asyncio
+from urllib.parse import urlsplit
+
+from farm import ProxyFarm
+
+from proxy_machine.tools.forward import ForwardProxy
+from proxy_machine.tools.pool import ProxyPool
+from proxy_machine.tools.proxy_checker import CheckResult
+
+
+async def get(port: int, url: str) -> bytes:
+    """A plain request to `url` through the proxy on `port`, the whole answer"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        writer.write(b"GET %s HTTP/1.1\r\nHost: %s\r\n\r\n" % (url.encode(), urlsplit(url).netloc.encode()))
+        return await reader.read()
+    except ConnectionError:
+        return b""
+    finally:
+        writer.close()
+
+
+def through_farm(mix, requests, **options):
+    """Answers of `requests` plain requests to the judge through a forward proxy over the farm,
+    with every member in the pool as if its last check passed"""
+
+    async def run():
+        farm = ProxyFarm(mix)
+        await farm.start()
+        pool = ProxyPool()
+        pool.offer(list(farm.proxies), "farm")
+        for proxy in farm.proxies:
+            pool.record(CheckResult(proxy, alive=True, latency=0.01))
+        forward = ForwardProxy(pool, timeout=1.0, **options)
+        server = await forward.start("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            answers = [await get(port, farm.judge_url) for _ in range(requests)]
+        finally:
+            server.close()
+            await farm.stop()
+        by_behaviour = {behaviour: proxy for proxy, behaviour in farm.proxies.items()}
+        return answers, forward, pool, by_behaviour
+
+    return asyncio.run(run())
+
+
+def test_refused_and_failing_members_are_retried_and_ejected():
+    answers, forward, pool, members = through_farm({"refused": 1, "failing": 1, "healthy": 1}, 30, eject_after=2)
+    # Every request ends at the healthy member, the others never answer the client
+    assert all(answer.startswith(b"HTTP/1.1 200") and b'"ip": "127.0.0.1"' in answer for answer in answers)
+    assert forward.stats["ejected"] == 2
+    assert not pool.entries[members["refused"]].alive
+    assert not pool.entries[members["failing"]].alive
+    assert pool.entries[members["healthy"]].alive
+
+
+def test_a_member_that_resets_counts_against_it():
+    answers, forward, pool, members = through_farm({"reset": 1}, 2, eject_after=2)
+    # Too late for another member, the client gets the broken answer
+    assert all(b"Content-Length: 100" in answer and len(answer.partition(b"\r\n\r\n")[2]) < 100 for answer in answers)
+    assert forward.stats["ejected"] == 1
+    assert not pool.entries[members["reset"]].alive
+
+
+def test_a_lying_member_looks_like_a_working_one():
+    # Its answer is complete HTTP, only a check against the judge tells it lies
+    answers, forward, pool, members = through_farm({"lying": 1}, 3, eject_after=1)
+    assert all(answer.startswith(b"HTTP/1.1 200") and b"203.0.113.7" in answer for answer in answers)
+    assert (forward.stats["upstream_failures"], forward.members[members["lying"]].fails) == (0, 0)
+    assert pool.entries[members["lying"]].alive
@@ -0,0 +1,47 @@
+import gzip
+
+import pytest
+
+from proxy_machine.tools import geo
+from proxy_machine.tools.geo import GeoDB, build_geo_db
+from proxy_machine.tools.packed import pack_proxy
+
+# ip2asn-v4.tsv of iptoasn.com: first, last, ASN, country, name
+tsv = "1.0.0.0\t1.0.0.255\t13335\tUS\tCLOUDFLARENET\n1.0.4.0\t1.0.7.255\t0\tNone\tNot routed\n"
+# db-ip lite: first, last, country; its 1.0.0.0/24 overlaps the earlier tsv
+csv = '"1.0.0.128","1.0.1.255","AU"\n"5.0.0.0","5.0.0.255","DE"\n2001:db8::,2001:db8::ffff,NL\n'
+
+
+@pytest.fixture(params=["numpy", "array"])
+def db(request, monkeypatch, tmp_path):
+    if request.param == "array":
+        monkeypatch.setattr(geo, "np", None)
+    elif geo.np is None:
+        pytest.skip("numpy is not installed")
+    (tmp_path / "ip2asn-v4.tsv").write_text(tsv)
+    with gzip.open(tmp_path / "dbip.csv.gz", "wt") as f:
+        f.write(csv)
+    sources = [str(tmp_path / "ip2asn-v4.tsv"), str(tmp_path / "dbip.csv.gz")]
+    assert build_geo_db(sources, str(tmp_path / "geo.db")) == 3
+    db = GeoDB(str(tmp_path / "geo.db"))
+    yield db
+    db.close()
+
+
+def test_lookup(db):
+    proxies = ["5.0.0.7:80", "1.0.0.200:80", "1.0.1.1:8080", "9.9.9.9:53", "1.0.5.5:80", "0.0.0.1:80"]
+    assert db.lookup(pack_proxy(proxy) for proxy in proxies) == [
+        ("DE", None),
+        ("US", 13335),  # The earlier source wins the overlap
+        ("AU", None),
+        (None, None),
+        (None, None),  # Not routed
+        (None, None),
+    ]
+    assert len(db) == 3
+
+
+def test_not_a_geo_db(tmp_path):
+    (tmp_path / "geo.db").write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        GeoDB(str(tmp_path / "geo.db"))
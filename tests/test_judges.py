@@ -0,0 +1,81 @@
+import asyncio
+
+from proxy_machine.tools.judges import JudgePool
+from proxy_machine.tools.proxy_checker import CheckResult, check_or_dead
+
+down, up = "http://judge-down/", "http://judge-up/"
+
+
+def pool_with(answering, **options):
+    """A pool whose judges answer direct requests if they are in `answering`"""
+    pool = JudgePool([down, up], **options)
+    asked = []
+
+    async def ask(client, judge):
+        asked.append(judge.url)
+        return judge.url in answering
+
+    pool._ask = ask
+    return pool, asked
+
+
+def probe_with(alive_at):
+    """A probe whose check works only through the judges in `alive_at`, it times out at the others"""
+    calls = []
+
+    async def probe(proxy, check_timeout, judge, client_ip=None):
+        calls.append(judge)
+        if judge in alive_at:
+            return CheckResult(proxy, alive=True, latency=0.1, successes=1)
+        return CheckResult(proxy, error="timeout")
+
+    return probe, calls
+
+
+def test_a_judge_that_went_down_rests_and_the_proxy_is_checked_again():
+    async def run():
+        pool, asked = pool_with({up})
+        probe, calls = probe_with({up})
+        check = pool.wrap(probe)
+        results = [await check(f"http://10.0.0.{n}:80", 1) for n in range(4)]
+        return results, calls, asked
+
+    results, calls, asked = asyncio.run(run())
+    assert all(result.alive for result in results)
+    # The down judge failed one check, rests after its health check and gets no more
+    assert calls.count(down) == 1
+    assert asked == [down]
+
+
+def test_a_dead_proxy_at_a_healthy_judge_stays_dead():
+    async def run():
+        pool, asked = pool_with({down, up})
+        probe, calls = probe_with(set())
+        check = pool.wrap(probe)
+        results = await asyncio.gather(*(check(f"http://10.0.0.{n}:80", 1) for n in range(10)))
+        return results, calls, asked
+
+    results, calls, asked = asyncio.run(run())
+    assert [result.error for result in results] == ["timeout"] * 10
+    assert len(calls) == 10  # No retries
+    # Checks that failed at once share the health check of their judge
+    assert sorted(asked) == [down, up]
+
+
+def test_no_judge_answers():
+    async def run():
+        pool, _ = pool_with(set())
+        probe, _ = probe_with(set())
+        return await check_or_dead(pool.wrap(probe), "http://10.0.0.1:80", 1)
+
+    assert asyncio.run(run()).error == "judge"
+
+
+def test_judges_are_verified_once():
+    async def run():
+        pool, asked = pool_with({down, up})
+        await pool.verify()
+        await pool.verify()
+        return asked
+
+    assert sorted(asyncio.run(run())) == [down, up]
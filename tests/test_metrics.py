@@ -0,0 +1,13 @@
+from proxy_machine.tools.metrics import RunMetrics
+
+
+def test_prometheus_totals_are_counters():
+    metrics = RunMetrics()
+    metrics.source("spys").live = 3
+    metrics.checker.outcomes["alive"] += 2
+    text = metrics.prometheus()
+    assert "# TYPE proxy_machine_source_live_total counter" in text
+    assert 'proxy_machine_source_live_total{source="spys"} 3' in text
+    assert 'proxy_machine_checks_total{outcome="alive"} 2' in text
+    assert "# TYPE proxy_machine_checks_peak_in_flight gauge" in text
+    assert "# TYPE proxy_machine_run_seconds gauge" in text
@@ -0,0 +1,47 @@
+import csv
+import json
+
+import pytest
+
+from proxy_machine.tools.output import rank_results, write_results
+from proxy_machine.tools.proxy_checker import CheckResult
+
+
+def test_rank_by_seconds_per_successful_request():
+    results = [
+        CheckResult("unchecked-1:80"),
+        CheckResult("flaky:80", alive=True, latency=0.2, probes=3, successes=1),  # 0.6 s per success
+        CheckResult("slow:80", alive=True, latency=0.5, probes=3, successes=3),  # 0.5
+        CheckResult("dead:80", probes=3, successes=0, error="timeout"),
+        CheckResult("fast:80", alive=True, latency=0.1, probes=3, successes=3),  # 0.1
+        CheckResult("no-latency:80", alive=True, probes=3, successes=2),
+        CheckResult("unchecked-2:80"),
+    ]
+    assert [result.score for result in results[1:3]] == pytest.approx([0.6, 0.5])
+    assert [result.proxy for result in rank_results(results)] == [
+        "fast:80",
+        "slow:80",
+        "flaky:80",
+        # Without a score, in their order
+        "unchecked-1:80",
+        "dead:80",
+        "no-latency:80",
+        "unchecked-2:80",
+    ]
+
+
+def test_write_results(tmp_path):
+    results = rank_results(
+        [
+            CheckResult("1.2.3.4:80", alive=True, latency=0.3, probes=2, successes=1, protocols=("socks5",)),
+            CheckResult("5.6.7.8:3128", alive=True, latency=0.123456, probes=2, successes=2),
+        ]
+    )
+    write_results(str(tmp_path / "out.txt"), results)
+    assert (tmp_path / "out.txt").read_text() == "5.6.7.8:3128\nsocks5://1.2.3.4:80\n"
+    write_results(str(tmp_path / "out.json"), results, "json")
+    rows = json.loads((tmp_path / "out.json").read_text())
+    assert [(row["proxy"], row["score"]) for row in rows] == [("5.6.7.8:3128", 0.1235), ("socks5://1.2.3.4:80", 0.6)]
+    write_results(str(tmp_path / "out.csv"), results, "csv")
+    with open(tmp_path / "out.csv", newline="") as f:
+        assert [row["protocols"] for row in csv.DictReader(f)] == ["", "socks5"]
@@ -0,0 +1,41 @@
+import pytest
+
+from proxy_machine.tools import packed
+from proxy_machine.tools.packed import ProxyArray, pack_proxy, unpack_proxy
+
+
+@pytest.fixture(params=["numpy", "array"])
+def backend(request, monkeypatch):
+    """Runs a test with numpy and with the array module numpy is optional for"""
+    if request.param == "array":
+        monkeypatch.setattr(packed, "np", None)
+    elif packed.np is None:
+        pytest.skip("numpy is not installed")
+
+
+def test_pack_and_unpack():
+    value = pack_proxy("http://45.79.110.81:8080\n")
+    assert value == (45 << 40 | 79 << 32 | 110 << 24 | 81 << 16 | 8080)
+    assert unpack_proxy(value) == "45.79.110.81:8080"
+    for bad in ("45.79.110.81", "45.79.110:8080", "45.79.110.256:80", "45.79.110.81:0", "[::1]:80", "a.b.c.d:80"):
+        assert pack_proxy(bad) is None
+
+
+def test_array_is_sorted_and_unique(backend):
+    proxies = ProxyArray.from_strings(["10.0.0.2:80", "10.0.0.1:80", "10.0.0.2:80", "garbage"])
+    assert len(proxies) == 2
+    assert proxies.to_strings("http://") == ["http://10.0.0.1:80", "http://10.0.0.2:80"]
+    assert pack_proxy("10.0.0.1:80") in proxies
+    assert pack_proxy("10.0.0.3:80") not in proxies
+    assert pack_proxy("255.255.255.255:65534") not in proxies
+
+
+def test_union_and_difference(backend):
+    first = ProxyArray.from_strings(["10.0.0.1:80", "10.0.0.2:80", "10.0.0.3:80"])
+    second = ProxyArray.from_strings(["10.0.0.3:80", "10.0.0.4:80"])
+    assert first.union(second).to_strings() == ["10.0.0.1:80", "10.0.0.2:80", "10.0.0.3:80", "10.0.0.4:80"]
+    assert first.difference(second).to_strings() == ["10.0.0.1:80", "10.0.0.2:80"]
+    assert second.difference(first).to_strings() == ["10.0.0.4:80"]
+    assert len(first.difference(first)) == 0
+    assert first.union(ProxyArray()).to_strings() == first.to_strings()
+    assert pack_proxy("10.0.0.4:80") in first.union(second)
@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+
+from proxy_machine.tools.pages import Page, fetch_pages, page_sink, paged
+
+
+class FakeFetcher:
+    """Answers every url with its text, or with the error of `pages`"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    async def get(self, url, **kwargs):
+        self.requests.append((url, kwargs))
+        await asyncio.sleep(self.pages.get(url + "#delay", 0))
+        answer = self.pages[url]
+        if isinstance(answer, Exception):
+            raise answer
+        status, text = answer
+        return httpx.Response(status, text=text, request=httpx.Request("GET", url))
+
+
+def lines(r):
+    return r.text.split()
+
+
+def test_a_failing_page_keeps_the_others():
+    fetcher = FakeFetcher(
+        {
+            "https://site/1": (200, "1.1.1.1:80 1.1.1.2:80"),
+            "https://site/2": httpx.ConnectTimeout("timed out"),
+            "https://site/3": (503, "busy"),
+            "https://site/4": (200, "4.4.4.4:80"),
+            "https://site/4#delay": 0.05,  # after the failures
+        }
+    )
+    streamed = []
+
+    async def run():
+        page_sink.set(streamed.append)
+        pages = [Page(f"https://site/{n}", lines) for n in range(1, 5)] + [Page("https://site/1", lambda r: 1 / 0)]
+        return await fetch_pages(fetcher, "site", pages, {"timeout": 5})
+
+    assert asyncio.run(run()) == {"1.1.1.1:80", "1.1.1.2:80", "4.4.4.4:80"}
+    assert streamed == [{"1.1.1.1:80", "1.1.1.2:80"}, {"4.4.4.4:80"}]
+    assert all(kwargs == {"timeout": 5} for _, kwargs in fetcher.requests)
+
+
+def test_paged_source():
+    fetcher = FakeFetcher({"https://site/list": (200, "2"), "https://site/1": (200, "1.1.1.1:80")})
+
+    @paged(headers={"Referer": "https://site"})
+    async def site(fetcher):
+        first = await fetcher.get("https://site/list")
+        return [
+            Page("https://site/1", lines, {"params": {"page": 1}}),
+            Page("https://site/list", lines, label="first", response=first),  # parsed, not asked again
+        ]
+
+    @paged()
+    async def broken(fetcher):
+        raise ValueError("no pages")
+
+    assert asyncio.run(site(fetcher)) == {"1.1.1.1:80", "2"}
+    assert fetcher.requests == [
+        ("https://site/list", {}),
+        ("https://site/1", {"headers": {"Referer": "https://site"}, "params": {"page": 1}}),
+    ]
+    assert asyncio.run(broken(fetcher)) == set()
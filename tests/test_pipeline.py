@@ -0,0 +1,22 @@
+import asyncio
+
+from proxy_machine.pipeline import ScrapePipeline
+from proxy_machine.tools.proxy_checker import CheckResult
+
+proxies = [f"10.0.0.{n}:8080\n" for n in range(1, 21)]
+
+
+def test_unchecked_candidates_are_not_limited_or_filtered():
+    # The threaded checker gets them all, --limit and the filters apply to its results
+    pipeline = ScrapePipeline([], limit=5, max_latency=1.0, countries=["DE"])
+    results = asyncio.run(pipeline.run(proxies))
+    assert len(results) == len(proxies)
+    assert {result.proxy for result in results} == {f"http://{proxy.strip()}" for proxy in proxies}
+
+
+def test_accepts_checked_results():
+    pipeline = ScrapePipeline([], checker=True, max_latency=1.0, countries=["DE"])
+    assert pipeline.accepts(CheckResult("http://10.0.0.1:80", alive=True, latency=0.5, country="de"))
+    assert not pipeline.accepts(CheckResult("http://10.0.0.1:80", alive=True, latency=2.0, country="DE"))
+    assert not pipeline.accepts(CheckResult("http://10.0.0.1:80", alive=True, latency=0.5, country="US"))
+    assert not pipeline.accepts(CheckResult("http://10.0.0.1:80", alive=False))
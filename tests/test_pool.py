@@ -0,0 +1,67 @@
+from proxy_machine.tools.pool import ProxyPool
+from proxy_machine.tools.proxy_checker import CheckResult
+
+
+def alive(proxy, latency, **known):
+    return CheckResult(proxy, alive=True, latency=latency, successes=1, **known)
+
+
+def pool_of(*results, now=0.0):
+    pool = ProxyPool(revalidate_after=300, max_failures=2, retry_after=30, forget_after=3600)
+    pool.offer([result.proxy for result in results], "spys", now=now)
+    for result in results:
+        pool.record(result, now=now)
+    return pool
+
+
+def test_offer_skips_known_and_recently_evicted_proxies():
+    pool = pool_of(CheckResult("http://10.0.0.1:80", error="timeout"))
+    assert pool.evicted == {"http://10.0.0.1:80": 0.0}
+    assert pool.offer(["http://10.0.0.1:80", "http://10.0.0.2:80", "http://10.0.0.2:80"], "spys", now=60) == 1
+    assert pool.offer(["http://10.0.0.1:80"], "spys", now=3600) == 1  # Forgotten
+    assert pool.stats["found"] == 3
+
+
+def test_select_by_latency_protocol_country_and_anonymity():
+    pool = pool_of(
+        alive("http://10.0.0.1:80", 0.9, country="DE", anonymity="elite"),
+        alive("http://10.0.0.2:80", 0.1, country="US", anonymity="transparent"),
+        alive("http://10.0.0.3:1080", 0.5, country="de", protocols=("socks5",), anonymity="anonymous"),
+    )
+    assert len(pool) == 3
+    assert [entry.proxy for entry in pool.select()] == [
+        "http://10.0.0.2:80",
+        "http://10.0.0.3:1080",
+        "http://10.0.0.1:80",
+    ]
+    assert [entry.url for entry in pool.select(protocol="SOCKS5")] == ["socks5://10.0.0.3:1080"]
+    assert [entry.proxy for entry in pool.select(country="de", max_latency=0.5)] == ["http://10.0.0.3:1080"]
+    assert [entry.proxy for entry in pool.select(anonymity="anonymous")] == [
+        "http://10.0.0.3:1080",
+        "http://10.0.0.1:80",
+    ]
+    assert [entry.proxy for entry in pool.select(anonymity="elite", count=5)] == ["http://10.0.0.1:80"]
+    assert pool.select(count=1, max_latency=0.05) == []
+
+
+def test_a_member_is_evicted_after_max_failures():
+    pool = pool_of(alive("http://10.0.0.1:80", 0.2, country="DE"))
+    entry = pool.entries["http://10.0.0.1:80"]
+    assert entry.due == 300
+    pool.record(CheckResult("http://10.0.0.1:80", error="timeout"), now=300)
+    # Out of the answers, checked again sooner
+    assert (len(pool), entry.due, entry.failures) == (0, 330, 1)
+    assert pool.counts()["countries"] == {"DE": 0}
+    pool.record(alive("http://10.0.0.1:80", 0.3), now=330)
+    assert (len(pool), entry.latency, entry.country, entry.failures) == (1, 0.3, "DE", 0)
+    pool.record(CheckResult("http://10.0.0.1:80", error="timeout"), now=630)
+    pool.record(CheckResult("http://10.0.0.1:80", error="timeout"), now=660)
+    assert "http://10.0.0.1:80" not in pool.entries
+    assert (len(pool), pool.stats["evicted"], pool.stats["checks"]) == (0, 1, 5)
+
+
+def test_a_check_without_a_judge_is_no_verdict():
+    pool = pool_of(alive("http://10.0.0.1:80", 0.2))
+    pool.record(CheckResult("http://10.0.0.1:80", error="judge"), now=300)
+    entry = pool.entries["http://10.0.0.1:80"]
+    assert (len(pool), entry.failures, entry.due, pool.stats["checks"]) == (1, 0, 330, 1)
@@ -0,0 +1,59 @@
+import asyncio
+import socket
+
+import pytest
+
+from proxy_machine.tools.prefilter import StageStats, iter_reachable
+
+
+@pytest.fixture
+def ports():
+    """Local ports by what a connect to them does: listening, refused and blackholed"""
+    sockets, found = [], {"open": [], "refused": [], "timeout": []}
+
+    def bound():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        sockets.append(sock)
+        return sock
+
+    for _ in range(3):
+        listening = bound()
+        listening.listen(16)
+        found["open"].append(listening.getsockname()[1])
+        found["refused"].append(bound().getsockname()[1])  # Bound, not listening
+    # A full accept queue drops the SYNs of new connects, like a firewall that drops them
+    full = bound()
+    full.listen(0)
+    for _ in range(2):
+        filler = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        filler.setblocking(False)
+        filler.connect_ex(full.getsockname())
+        sockets.append(filler)
+    found["timeout"].append(full.getsockname()[1])
+    yield found
+    for sock in sockets:
+        sock.close()
+
+
+def test_only_listening_proxies_pass(ports):
+    proxies = {f"http://127.0.0.1:{port}": outcome for outcome, found in ports.items() for port in found}
+    stats = StageStats("TCP prefilter")
+
+    async def run():
+        return [proxy async for proxy in iter_reachable(list(proxies), 4, timeout=0.3, stats=stats)]
+
+    passed = asyncio.run(run())
+    assert sorted(passed) == sorted(proxy for proxy, outcome in proxies.items() if outcome == "open")
+    assert stats.outcomes == {"open": 3, "refused": 3, "timeout": 1}
+    assert (stats.total, stats.passed) == (7, 3)
+    assert 0.3 <= stats.elapsed < 2
+
+
+def test_stage_stats():
+    stats = StageStats("HTTP check")
+    assert (stats.total, stats.elapsed) == (0, 0.0)
+    stats.record("alive", True)
+    stats.record("timeout", False)
+    stats.record("timeout", False)
+    assert (stats.total, stats.passed, stats.outcomes.most_common(1)) == (3, 1, [("timeout", 2)])
@@ -0,0 +1,50 @@
+import asyncio
+import multiprocessing
+
+from farm import ProxyFarm, works
+
+from proxy_machine.tools.judges import JudgePool
+from proxy_machine.tools.processes import iter_checking_processes
+
+check_timeout = 1.0
+
+
+def test_every_proxy_gets_one_result_and_judge_counts_come_back():
+    async def run():
+        farm = ProxyFarm({"healthy": 4, "refused": 4, "lying": 2})
+        await farm.start()
+        judges = JudgePool([farm.judge_url])
+        await judges.verify()
+        try:
+            results = [
+                result
+                async for result in iter_checking_processes(list(farm.proxies), 2, 8, check_timeout, judges=judges)
+            ]
+        finally:
+            await farm.stop()
+        return farm.proxies, results, judges.counts()
+
+    proxies, results, counts = asyncio.run(run())
+    assert sorted(result.proxy for result in results) == sorted(proxies)
+    assert all(result.alive == works(proxies[result.proxy], 0, check_timeout) for result in results)
+    # checks, alive and errors of the judge, counted in the worker processes
+    assert list(counts.values()) == [(10, 4, 0)]
+
+
+def test_closing_early_terminates_the_processes():
+    async def run():
+        farm = ProxyFarm({"healthy": 1, "blackhole": 20})
+        await farm.start()
+        judges = JudgePool([farm.judge_url])
+        await judges.verify()
+        try:
+            checked = iter_checking_processes(list(farm.proxies), 2, 4, 30, judges=judges)
+            first = await checked.__anext__()
+            await checked.aclose()
+        finally:
+            await farm.stop()
+        return first, farm.proxies
+
+    first, proxies = asyncio.run(run())
+    assert proxies[first.proxy] == "healthy"
+    assert multiprocessing.active_children() == []
@@ -0,0 +1,43 @@
+import asyncio
+
+from farm import ProxyFarm, speaks
+
+from proxy_machine.tools.protocols import detect_probe, proxy_url, speaks_any
+
+check_timeout = 1.0
+
+
+def detect_farm(mix):
+    """Results of detect_probe for every fake proxy of a farm with `mix`, by behaviour"""
+
+    async def run():
+        farm = ProxyFarm(mix)
+        await farm.start()
+        try:
+            results = await asyncio.gather(
+                *(detect_probe(proxy, check_timeout, farm.judge_url) for proxy in farm.proxies)
+            )
+        finally:
+            await farm.stop()
+        return {behaviour: result for behaviour, result in zip(farm.proxies.values(), results)}
+
+    return asyncio.run(run())
+
+
+def test_detected_protocols():
+    results = detect_farm({"healthy": 1, "tunnel": 1, "socks4": 1, "socks5": 1, "refused": 1})
+    for behaviour, result in results.items():
+        assert result.protocols == speaks(behaviour, 0, check_timeout), behaviour
+        assert result.alive == bool(result.protocols)
+    assert results["refused"].error == "refused"
+    assert results["healthy"].latency is not None and results["healthy"].connect_time is not None
+    assert proxy_url(results["socks5"]).startswith("socks5://")
+    assert proxy_url(results["tunnel"]).startswith("http://")
+
+
+def test_speaks_any():
+    results = detect_farm({"tunnel": 1, "socks4": 1})
+    assert speaks_any(results["tunnel"], ["https", "socks5"])
+    assert not speaks_any(results["tunnel"], ["http"])
+    assert speaks_any(results["socks4"], ["socks4"])
+    assert not speaks_any(results["socks4"], ["socks5", "http", "https"])
@@ -0,0 +1,35 @@
+import asyncio
+
+from farm import ProxyFarm
+
+from proxy_machine.tools.raw_probe import raw_probe
+
+
+def probe_farm(mix, check_timeout=0.5):
+    """Results of raw_probe for every fake proxy of a farm with `mix`, by behaviour"""
+
+    async def run():
+        farm = ProxyFarm(mix)
+        await farm.start()
+        try:
+            results = await asyncio.gather(*(raw_probe(proxy, check_timeout, farm.judge_url) for proxy in farm.proxies))
+        finally:
+            await farm.stop()
+        return {behaviour: result for behaviour, result in zip(farm.proxies.values(), results)}
+
+    return asyncio.run(run())
+
+
+def test_raw_probe_verdicts():
+    results = probe_farm({"healthy": 1, "transparent": 1, "lying": 1, "reset": 1, "refused": 1, "blackhole": 1})
+    healthy = results["healthy"]
+    assert healthy.alive and healthy.error is None
+    assert 0 < healthy.connect_time <= healthy.ttfb <= healthy.latency < 0.5
+    assert healthy.anonymity == "elite"
+    assert results["transparent"].anonymity == "transparent"
+    assert {behaviour: result.error for behaviour, result in results.items() if not result.alive} == {
+        "lying": "wrong_ip",
+        "reset": "reset",
+        "refused": "refused",
+        "blackhole": "timeout",
+    }
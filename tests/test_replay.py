@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+
+from proxy_machine.tools.cache import ResponseCache
+from proxy_machine.tools.extract import extract_proxies
+from proxy_machine.tools.replay import RecordingFetcher, ReplayFetcher
+
+url = "http://lists.example/proxies.txt"
+body = b"45.79.110.81:8080\n103.216.82.20:6666\n"
+
+
+def answer(request: httpx.Request) -> httpx.Response:
+    if request.headers.get("if-none-match") == '"v1"':
+        return httpx.Response(304, headers={"etag": '"v1"'})
+    return httpx.Response(200, headers={"etag": '"v1"'}, content=body)
+
+
+def record(path, cache):
+    async def run():
+        fetcher = RecordingFetcher(str(path), cache=cache)
+        fetcher.client = httpx.AsyncClient(transport=httpx.MockTransport(answer))
+        async with fetcher:
+            return await fetcher.get_static(url, extract_proxies)
+
+    return asyncio.run(run())
+
+
+def replay(path):
+    async def run():
+        async with ReplayFetcher.from_file(str(path)) as fetcher:
+            return await fetcher.get_static(url, extract_proxies)
+
+    return asyncio.run(run())
+
+
+def test_a_cached_304_is_recorded_with_its_body(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    expected = {"45.79.110.81:8080", "103.216.82.20:6666"}
+    assert record(tmp_path / "first.jsonl.gz", cache) == expected
+    assert record(tmp_path / "second.jsonl.gz", cache) == expected  # 304 this time
+    assert replay(tmp_path / "second.jsonl.gz") == expected
+
+
+def test_a_304_without_a_cached_body_is_asked_again(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache"))
+    record(tmp_path / "first.jsonl.gz", cache)
+    for lost in (tmp_path / "cache").glob("*.body"):
+        lost.unlink()
+    record(tmp_path / "second.jsonl.gz", cache)
+    fetcher = ReplayFetcher.from_file(str(tmp_path / "second.jsonl.gz"))
+    assert [record["status"] for records in fetcher.archive.values() for record in records] == [200]
+    assert replay(tmp_path / "second.jsonl.gz") == {"45.79.110.81:8080", "103.216.82.20:6666"}
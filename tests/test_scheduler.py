@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from proxy_machine.tools.scheduler import HostLimit, HostScheduler, parse_host_limit
+
+
+def starts_of(scheduler, urls, hold=0.0):
+    """Loop times at which the requests to `urls` got their slots, and the most that held one at once"""
+    starts = []
+    inside = most = 0
+
+    async def request(url):
+        nonlocal inside, most
+        async with scheduler.slot(url):
+            starts.append(asyncio.get_running_loop().time())
+            inside += 1
+            most = max(most, inside)
+            await asyncio.sleep(hold)
+            inside -= 1
+
+    async def run():
+        await asyncio.gather(*(request(url) for url in urls))
+
+    asyncio.run(run())
+    return sorted(starts), most
+
+
+def test_requests_to_a_host_are_spaced():
+    scheduler = HostScheduler({"example.com": HostLimit(min_interval=0.05, max_concurrent=8)})
+    starts, _ = starts_of(scheduler, ["http://example.com/a"] * 4)
+    gaps = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    assert min(gaps) >= 0.045
+    assert scheduler.total_waited >= 0.14
+
+
+def test_subdomains_share_the_budget_of_their_domain():
+    scheduler = HostScheduler({"aliveproxy.com": HostLimit(min_interval=0.05, max_concurrent=1)})
+    urls = ["http://aliveproxy.com/", "http://www.aliveproxy.com/", "http://community.aliveproxy.com/"] * 2
+    starts, most = starts_of(scheduler, urls)
+    assert starts[-1] - starts[0] >= 5 * 0.045
+    assert most == 1
+    assert scheduler.domain_for("community.aliveproxy.com") == "aliveproxy.com"
+    assert list(scheduler.waited) == ["aliveproxy.com"]
+
+
+def test_concurrency_limit_and_unlimited_hosts():
+    scheduler = HostScheduler({"slow.net": HostLimit(max_concurrent=2)})
+    _, most = starts_of(scheduler, ["http://slow.net/"] * 6, hold=0.02)
+    assert most == 2
+    _, most = starts_of(scheduler, ["http://other.org/"] * 6, hold=0.02)
+    assert most == 6
+    assert scheduler.limit_for("other.org") == HostLimit()
+
+
+def test_parse_host_limit():
+    assert parse_host_limit("Example.com=1.5") == ("example.com", HostLimit(1.5, HostLimit().max_concurrent))
+    assert parse_host_limit("example.com=0:2") == ("example.com", HostLimit(0.0, 2))
+    with pytest.raises(ValueError):
+        parse_host_limit("example.com")
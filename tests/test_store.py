@@ -0,0 +1,58 @@
+import pytest
+
+from proxy_machine.tools.packed import pack_proxy, unpack_proxy
+from proxy_machine.tools.proxy_checker import CheckResult
+from proxy_machine.tools.store import ProxyStore
+
+new, stale, good, failed, failing, retried = (pack_proxy(f"10.0.0.{n}:80") for n in range(1, 7))
+day = 86400
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ProxyStore(str(tmp_path / "history.sqlite"), stale_after=3600, max_failures=2, retry_after=day)
+    yield store
+    store.close()
+
+
+def checked(store, proxy, alive, now, **known):
+    store.record_result(CheckResult(f"http://{unpack_proxy(proxy)}", alive=alive, **known))
+    store.flush(now)
+
+
+def test_triage(store):
+    store.record_seen([stale, good, failed, failing, retried], "spys", now=0)
+    checked(store, stale, True, now=0)
+    checked(store, good, True, now=day, latency=0.5, country="DE", protocols=("socks5",), anonymity="elite")
+    for now in (1, 2):
+        checked(store, failed, False, now=day - now)
+        checked(store, retried, False, now=now)
+    checked(store, failing, True, now=0)
+    checked(store, failing, False, now=day)
+    to_check, known_good = store.triage([new, stale, good, failed, failing, retried], now=day + 60)
+    # A failure in a row below max_failures is neither good nor stale yet
+    assert to_check == [new, stale, retried]
+    assert known_good == [
+        CheckResult(
+            "http://10.0.0.3:80",
+            alive=True,
+            latency=0.5,
+            country="DE",
+            successes=1,
+            protocols=("socks5",),
+            anonymity="elite",
+        )
+    ]
+
+
+def test_a_failure_keeps_what_was_known(store):
+    store.record_seen([good], "spys", now=0)
+    checked(store, good, True, now=0, latency=0.5, country="DE", protocols=("http", "https"))
+    checked(store, good, False, now=10)
+    checked(store, good, True, now=20, latency=0.7)
+    _, known_good = store.triage([good], now=30)
+    assert (known_good[0].latency, known_good[0].country, known_good[0].protocols) == (0.7, "DE", ("http", "https"))
+    checks, successes, fail_streak = store.connection.execute(
+        "SELECT checks, successes, fail_streak FROM proxies"
+    ).fetchone()
+    assert (checks, successes, fail_streak) == (3, 2, 0)
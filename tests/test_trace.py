@@ -0,0 +1,58 @@
+import asyncio
+import json
+import threading
+
+from proxy_machine.tools import trace
+from proxy_machine.tools.trace import span, start_tracing, stop_tracing
+
+
+def test_span_does_nothing_while_tracing_is_off():
+    assert trace._tracer is None
+    with span("fetch", "source", url="https://site") as inside:
+        assert inside is None
+    assert span("a", "b") is span("c", "d")
+    stop_tracing("never-written.json")
+
+
+def test_spans_are_chrome_trace_events(tmp_path):
+    tracer = start_tracing()
+
+    async def check(n):
+        with span("check", "checker", proxy=n):
+            await asyncio.sleep(0.01 * n)
+
+    async def run():
+        with span("run", "pipeline"):
+            await asyncio.gather(*(check(n) for n in range(3)))
+        # The rows of finished tasks are taken again
+        await asyncio.gather(*(check(n) for n in range(2)))
+
+    asyncio.run(run())
+
+    def parse():
+        with span("parse", "extract"):
+            pass
+
+    thread = threading.Thread(target=parse, name="worker")
+    with span("write", "output"):
+        thread.start()
+        thread.join()
+    path = tmp_path / "trace.json"
+    stop_tracing(str(path))
+    assert trace._tracer is None
+
+    events = json.loads(path.read_text())["traceEvents"]
+    assert events == tracer.events
+    spans = [event for event in events if event["ph"] == "X"]
+    assert sorted(event["name"] for event in spans) == ["check"] * 5 + ["parse", "run", "write"]
+    for event in spans:
+        assert event["dur"] >= 0 and event["ts"] >= 0
+        assert {"pid", "tid", "cat", "args"} <= event.keys()
+    run_event = next(event for event in spans if event["name"] == "run")
+    checks = [event for event in spans if event["name"] == "check"]
+    assert all(run_event["ts"] <= event["ts"] for event in checks[:3])
+    assert len({event["tid"] for event in checks}) == 3  # three in flight at once, then two reused rows
+    assert all(event["args"]["task"].startswith("Task-") for event in checks)
+    assert next(event for event in spans if event["name"] == "parse")["tid"] >= trace._first_thread_row
+    names = {event["tid"]: event["args"]["name"] for event in events if event["name"] == "thread_name"}
+    assert sorted(names.values()) == ["MainThread", "tasks 1", "tasks 2", "tasks 3", "tasks 4", "worker"]